@@ -12,10 +12,14 @@ if sys.platform == 'win32':
     theano_flags += config_for_theano_cache_script
     os.environ['THEANO_FLAGS'] = theano_flags
 
+import six.moves.cPickle as pickle
+
 import theano
 from theano import config
 import theano.gof.compiledir
 from theano.gof.cc import get_module_cache
+from theano.compile.module_bundle import (export_cache_bundle,
+                                          import_cache_bundle)
 
 _logger = logging.getLogger('theano.bin.theano-cache')
 
@@ -27,10 +31,16 @@ def print_help(exit_status):
     print('Type "theano-cache help" to print this help')
     print('Type "theano-cache clear" to erase the cache')
     print('Type "theano-cache list" to print the cache content')
+    print('Type "theano-cache usage" to print the disk usage and the '
+          'number of cache hits per Op class')
     print('Type "theano-cache unlock" to unlock the cache directory')
     print('Type "theano-cache cleanup" to delete keys in the old '
           'format/code version')
     print('Type "theano-cache purge" to force deletion of the cache directory')
+    print('Type "theano-cache bundle ARCHIVE FILE..." to save in ARCHIVE '
+          'the compiled modules used by the functions pickled in the FILEs')
+    print('Type "theano-cache import ARCHIVE" to add the compiled modules '
+          'of ARCHIVE to the cache')
     print('Type "theano-cache basecompiledir" '
           'to print the parent of the cache directory')
     print('Type "theano-cache basecompiledir list" '
@@ -53,6 +63,7 @@ def main():
             cache = get_module_cache(init_args=dict(do_refresh=False))
             cache.clear(unversioned_min_age=-1, clear_base_files=True,
                         delete_if_problem=True)
+            theano.compile.optcache.get_optimization_cache().clear()
 
             # Print a warning if some cached modules were not removed, so that the
             # user knows he should manually delete them, or call
@@ -70,6 +81,8 @@ def main():
                               (len(items), ', '.join(items)))
         elif sys.argv[1] == 'list':
             theano.gof.compiledir.print_compiledir_content()
+        elif sys.argv[1] == 'usage':
+            theano.gof.compiledir.print_compiledir_usage()
         elif sys.argv[1] == 'cleanup':
             theano.gof.compiledir.cleanup()
             cache = get_module_cache(init_args=dict(do_refresh=False))
@@ -84,6 +97,20 @@ def main():
             print(theano.config.base_compiledir)
         else:
             print_help(exit_status=1)
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'bundle':
+        functions = []
+        for filename in sys.argv[3:]:
+            with open(filename, 'rb') as f:
+                obj = pickle.load(f)
+            if isinstance(obj, (list, tuple)):
+                functions.extend(obj)
+            else:
+                functions.append(obj)
+        n = export_cache_bundle(functions, sys.argv[2])
+        print('Saved %d compiled modules in %s' % (n, sys.argv[2]))
+    elif len(sys.argv) == 3 and sys.argv[1] == 'import':
+        n = import_cache_bundle(sys.argv[2])
+        print('Added %d compiled modules to the cache' % n)
     elif len(sys.argv) == 3 and sys.argv[1] == 'basecompiledir':
         if sys.argv[2] == 'list':
             theano.gof.compiledir.basecompiledir_ls()
@@ -5,10 +5,13 @@ Driver of graph construction, optimization, and linking.
 from __future__ import absolute_import, print_function, division
 
 import copy
-from six import string_types, iteritems, iterkeys
+import functools
+import multiprocessing
+import sys
+import threading
+from six import string_types, iteritems, iterkeys, reraise
 from six.moves import xrange
 import six.moves.copyreg as copyreg
-import six.moves.cPickle as pickle
 from itertools import chain
 import time
 import warnings
@@ -19,16 +22,26 @@ from theano import config, gof
 from theano.compat import izip
 from theano.gof import graph
 import theano.compile.mode
+import theano.compile.optcache
 import theano.compile.profiling
 from theano.compile.io import (
     In, SymbolicInput, SymbolicOutput)
 from theano.compile.ops import deep_copy_op, view_op
-from theano.gof.graph import is_same_graph
 from theano.gof.op import ops_with_inner_function
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the futures package.
+    ThreadPoolExecutor = None
+
 import logging
 _logger = logging.getLogger('theano.compile.function_module')
 
+# Protects the creation of the thread pools of Function.call_async and of
+# the per-thread functions of Function.thread_local_storage.
+_threads_lock = threading.Lock()
+
 __docformat__ = "restructuredtext en"
 
 
@@ -218,6 +231,44 @@ class AliasedMemoryError(Exception):
 DUPLICATE = ['DUPLICATE']
 
 
+class _RebindStorage(object):
+    """
+    Wrapper around the `fn` of a `Function` that puts other values in some of
+    its storage cells while it runs (see `Function.replicate`).
+
+    Parameters
+    ----------
+    fn
+        The wrapped callable, as returned by the linker.
+    cells
+        List of (fn_cell, cell) pairs. fn_cell is a storage cell of `fn` and
+        cell the one holding the value it must use. After the call, the value
+        of fn_cell (which may have been updated) is stored back in cell, and
+        fn_cell gets back its previous value.
+
+    """
+
+    def __init__(self, fn, cells):
+        self.fn = fn
+        self.cells = cells
+
+    def __call__(self, *args, **kwargs):
+        cells = self.cells
+        saved = [fn_cell[0] for fn_cell, cell in cells]
+        for fn_cell, cell in cells:
+            fn_cell[0] = cell[0]
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            for (fn_cell, cell), value in izip(cells, saved):
+                cell[0] = fn_cell[0]
+                fn_cell[0] = value
+
+    def __getattr__(self, attr):
+        # need_update_inputs, storage_map, thunks, position_of_error, ...
+        return getattr(self.fn, attr)
+
+
 class Function(object):
     """
     Type of the functions returned by theano.function or
@@ -272,6 +323,28 @@ class Function(object):
 
     """
 
+    async_workers = None
+    """
+    Number of threads running the calls of `call_async`, or None to use
+    one per CPU. It is read at the first call of `call_async`.
+
+    """
+
+    thread_local_storage = False
+    """
+    Bool: if True, each thread calling the function uses its own storage.
+
+    The first thread that calls the function uses the storage of this
+    function, the other threads use a copy of it (see `copy`) made at their
+    first call. The copies share the compiled C modules and the values of
+    the shared variables, so one function can be called by several threads
+    at the same time, and the thunks that release the GIL run in parallel.
+    Calls made at the same time may lose updates of each other. The
+    callers returned by `trusted_caller` are bound to the storage of the
+    thread that asked for them.
+
+    """
+
     input_storage = None
     """
     List of Container instances.
@@ -375,6 +448,12 @@ class Function(object):
         self.name = None
         self.nodes_with_inner_function = []
         self.output_keys = output_keys
+        self._trusted_callers = None
+        self._async_executor = None
+        self._thread_local = threading.local()
+        self._owner_thread = None
+        # The functions that run the calls of call_async and are not in use.
+        self._async_functions = None
 
         # We will be popping stuff off this `containers` object.  It is a copy.
         containers = list(self.input_storage)
@@ -386,6 +465,11 @@ class Function(object):
             for c in cs:
                 c.provided += 1
 
+        # The containers of the shared variables, by input of the fgraph,
+        # and those that the updates of this function modify.
+        shared_containers = {}
+        self._updated_containers = []
+
         # Store the list of names of named inputs.
         named_inputs = []
         # Count the number of un-named inputs.
@@ -414,6 +498,13 @@ class Function(object):
                         assert not refeed
                     else:
                         c.value = value
+                shared = getattr(input.variable, 'container', None)
+                if (input.shared and shared is not None and
+                        shared.storage is c.storage):
+                    j = len(self.input_storage) - len(containers)
+                    shared_containers[self.maker.fgraph.inputs[j]] = shared
+                    if input.update is not None:
+                        self._updated_containers.append(shared)
                 c.required = required
                 c.implicit = input.implicit
                 # this is a count of how many times the input has been
@@ -502,6 +593,11 @@ class Function(object):
             if node.op in ops_with_inner_function:
                 self.nodes_with_inner_function.append(node.op)
 
+        # An incremental VM sees that the shared variables changed through
+        # their version, as the updates may modify their value inplace.
+        if getattr(self.fn, 'incremental', False):
+            self.fn.version_sources = shared_containers
+
     def __contains__(self, item):
         return self.value.__contains__(item)
 
@@ -756,6 +852,10 @@ class Function(object):
                     if isinstance(value, gof.Container):
                         value = value.storage[0]
                     self[i] = value
+        if self.thread_local_storage:
+            fn = self._thread_function()
+            if fn is not self:
+                return fn(*args, **kwargs)
         profile = self.profile
         t0 = time.time()
 
@@ -877,6 +977,10 @@ class Function(object):
                         % getattr(self.inv_finder[c], 'variable',
                                   self.inv_finder[c]))
 
+        # The updates may modify the shared values inplace.
+        for c in self._updated_containers:
+            c.version += 1
+
         # Do the actual work
         t0_fn = time.time()
         try:
@@ -885,20 +989,7 @@ class Function(object):
                 self.fn(output_subset=output_subset)
         except Exception:
             restore_defaults()
-            if hasattr(self.fn, 'position_of_error'):
-                # this is a new vm-provided function or c linker
-                # they need this because the exception manipulation
-                # done by raise_with_op is not implemented in C.
-                thunk = None
-                if hasattr(self.fn, 'thunks'):
-                    thunk = self.fn.thunks[self.fn.position_of_error]
-                gof.link.raise_with_op(
-                    node=self.fn.nodes[self.fn.position_of_error],
-                    thunk=thunk,
-                    storage_map=getattr(self.fn, 'storage_map', None))
-            else:
-                # old-style linkers raise their own exceptions
-                raise
+            self._raise_fn_error(*sys.exc_info())
 
         dt_fn = time.time() - t0_fn
         self.maker.mode.fn_time += dt_fn
@@ -977,6 +1068,333 @@ class Function(object):
             else:
                 return [outputs[i] for i in output_subset]
 
+    def _raise_fn_error(self, exc_type, exc_value, exc_trace):
+        """
+        Re-raise an exception raised by `self.fn`, with information about
+        the node that failed when the linker provides it.
+
+        """
+        if hasattr(self.fn, 'position_of_error'):
+            # this is a new vm-provided function or c linker
+            # they need this because the exception manipulation
+            # done by raise_with_op is not implemented in C.
+            thunk = None
+            if hasattr(self.fn, 'thunks'):
+                thunk = self.fn.thunks[self.fn.position_of_error]
+            gof.link.raise_with_op(
+                node=self.fn.nodes[self.fn.position_of_error],
+                thunk=thunk,
+                exc_info=(exc_type, exc_value, exc_trace),
+                storage_map=getattr(self.fn, 'storage_map', None))
+        else:
+            # old-style linkers raise their own exceptions
+            reraise(exc_type, exc_value, exc_trace)
+
+    def trusted_caller(self):
+        """
+        Return a callable that evaluates this function with as little
+        overhead as possible.
+
+        The callable only accepts the explicit inputs of the function,
+        positionally and in order, and stores them as they are: they are
+        not filtered, so they must already have the exact type (dtype,
+        number of dimensions, ...) of the inputs, and they are not checked
+        for aliasing, so they must not share memory with each other or
+        with the values of the shared variables.
+        Updates, default values and the garbage collection of outputs are
+        handled as in ``__call__``, but the call time is not added to the
+        mode.
+
+        When the function is run by the CVM, the whole call is done in C
+        (see `bind_call` in lazylinker_c.c). Otherwise, a Python version
+        of it is used. When the function is profiled, this returns
+        ``__call__``.
+
+        Returns
+        -------
+        callable
+            The caller, which is built once per function.
+
+        """
+        if self.thread_local_storage:
+            fn = self._thread_function()
+            if fn is not self:
+                return fn.trusted_caller()
+        if self._trusted_callers is None:
+            self._trusted_callers = self._make_trusted_callers()
+        return self._trusted_callers[0]
+
+    def trusted_call(self, *args):
+        """
+        Evaluate the function on `args` through `trusted_caller`.
+
+        In a loop, calling the result of `trusted_caller` directly saves
+        one more Python call.
+
+        """
+        return self.trusted_caller()(*args)
+
+    def map(self, iterable, chunksize=64):
+        """
+        Evaluate the function on each tuple of inputs of `iterable`.
+
+        The inputs are filtered as in ``__call__`` (unless `trust_input`
+        is True) but, as with `trusted_caller`, they are not checked for
+        aliasing. They are run by chunks of `chunksize` calls through
+        `trusted_caller`. When the function is run by the CVM, each chunk
+        is run by a single call to C (see `bind_map` in lazylinker_c.c)
+        that does not go back to Python between the calls. The storage of
+        the function is reused from one call to the next.
+
+        Parameters
+        ----------
+        iterable
+            Iterable of sequences of explicit inputs, given positionally.
+        chunksize : int
+            Number of calls run at once. The results of a chunk are only
+            yielded once the whole chunk is computed.
+
+        Returns
+        -------
+        generator
+            The results of the calls, in order.
+
+        Notes
+        -----
+        The results are not copied: like with ``__call__``, they may be
+        overwritten by later calls if the function was compiled with
+        ``borrow=True`` outputs or without garbage collection.
+
+        """
+        if self.thread_local_storage:
+            fn = self._thread_function()
+            if fn is not self:
+                for output in fn.map(iterable, chunksize):
+                    yield output
+                return
+        if any(inp.mutable and not inp.implicit
+               for inp in self.maker.inputs):
+            # The inputs would have to be checked for aliasing.
+            for args in iterable:
+                yield self(*args)
+            return
+        self.trusted_caller()
+        caller, call_many = self._trusted_callers
+        if call_many is None:
+            def call_many(chunk):
+                return [caller(*args) for args in chunk]
+        if self.trust_input:
+            containers = None
+        else:
+            containers = [c for c in self.input_storage if not c.implicit]
+        chunk = []
+        for args in iterable:
+            if containers is not None:
+                args = [arg if arg is None else
+                        c.type.filter(arg, strict=c.strict,
+                                      allow_downcast=c.allow_downcast)
+                        for c, arg in izip(containers, args)]
+            chunk.append(args)
+            if len(chunk) >= chunksize:
+                for output in call_many(chunk):
+                    yield output
+                chunk = []
+        if chunk:
+            for output in call_many(chunk):
+                yield output
+
+    def call_many(self, iterable, chunksize=64):
+        """
+        Return the list of the results of `map`.
+
+        """
+        return list(self.map(iterable, chunksize))
+
+    def call_async(self, *args, **kwargs):
+        """
+        Evaluate the function in a thread and return a future of the result.
+
+        The arguments are those of ``__call__``. The calls are run by a
+        pool of `async_workers` threads created at the first call. Each
+        thread uses a copy of the function (see `copy`), created when
+        needed, so several calls can run at the same time, in parallel for
+        the thunks that release the GIL. The copies share the values of
+        the shared variables, but not the storage of the inputs, outputs
+        and intermediate results. A function with updates is not copied:
+        its calls are run one at a time in order, so that each one sees
+        the updates of the previous ones.
+
+        In asyncio code, the result can be awaited with
+        ``await asyncio.wrap_future(f.call_async(...))``.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future of what ``__call__`` returns, or of the exception it
+            raises.
+
+        Notes
+        -----
+        Calling the function directly while calls of `call_async` run is
+        only safe if it has no updates. As with ``__call__``, results of
+        outputs compiled with ``borrow=True`` may be overwritten by the
+        next call that the same copy runs.
+
+        """
+        if self._async_executor is None:
+            with _threads_lock:
+                if self._async_executor is None:
+                    if ThreadPoolExecutor is None:
+                        raise ImportError(
+                            "call_async needs the concurrent.futures "
+                            "module (the futures package on Python 2).")
+                    if any(inp.update is not None
+                           for inp in self.maker.inputs):
+                        n_workers = 1
+                        self._async_functions = [self]
+                    else:
+                        n_workers = (self.async_workers or
+                                     multiprocessing.cpu_count())
+                        self._async_functions = []
+                    self._async_executor = ThreadPoolExecutor(n_workers)
+        return self._async_executor.submit(self._call_async, args, kwargs)
+
+    def _call_async(self, args, kwargs):
+        # There are never more calls running than threads, so at most one
+        # copy is made for each thread. list.pop and list.append are
+        # atomic.
+        try:
+            fn = self._async_functions.pop()
+        except IndexError:
+            fn = self._storage_copy()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._async_functions.append(fn)
+
+    def _storage_copy(self):
+        # Return a copy of the function with its own storage, that is
+        # called like this one.
+        fn = self.copy()
+        # copy always returns a list of outputs.
+        fn.unpack_single = self.unpack_single
+        fn.return_none = self.return_none
+        fn.output_keys = self.output_keys
+        fn.trust_input = self.trust_input
+        return fn
+
+    def _thread_function(self):
+        # Return the function whose storage the current thread uses.
+        fn = getattr(self._thread_local, 'function', None)
+        if fn is None:
+            with _threads_lock:
+                if self._owner_thread is None:
+                    self._owner_thread = threading.current_thread()
+                    fn = self
+            if fn is None:
+                fn = self._storage_copy()
+            self._thread_local.function = fn
+        return fn
+
+    def _make_trusted_callers(self):
+        # Return the callable returned by trusted_caller, and a callable
+        # that does the same thing for a list of inputs, or None.
+        if self.profile:
+            return self.__call__, None
+        n_explicit = len([c for c in self.input_storage if not c.implicit])
+        explicit = self.input_storage[:n_explicit]
+        assert not any(c.implicit for c in explicit)
+        cells = [c.storage for c in explicit]
+
+        # Cells to reset after each call, as done by __call__.
+        reset_cells = []
+        reset_values = []
+        for c, (required, refeed, value) in izip(explicit, self.defaults):
+            if required:
+                reset_cells.append(c.storage)
+                reset_values.append(None)
+            elif refeed:
+                if isinstance(value, gof.Container):
+                    # The default value changes over time.
+                    return self.__call__, None
+                reset_cells.append(c.storage)
+                reset_values.append(c.type.filter(
+                    value, strict=c.strict, allow_downcast=c.allow_downcast))
+        fn = self.fn
+        if getattr(fn, 'allow_gc', False):
+            for o_container, o_variable in zip(self.output_storage,
+                                               self.maker.fgraph.outputs):
+                if o_variable.owner is not None:
+                    reset_cells.append(o_container.storage)
+                    reset_values.append(None)
+
+        n_returned = self.n_returned_outputs
+        updated_containers = self._updated_containers
+        CVM = getattr(gof.vm, 'CVM', None)
+        if (CVM is not None and isinstance(fn, CVM) and
+                not fn.need_update_inputs and self.output_keys is None):
+            from theano.gof.lazylinker_c import bind_call, bind_map
+            unpack = 2 if self.return_none else int(bool(self.unpack_single))
+            args = (fn, self._raise_fn_error, cells, reset_cells,
+                    reset_values, n_returned, unpack)
+            call = functools.partial(bind_call, *args)
+            call_many = functools.partial(bind_map, *args)
+            if not updated_containers:
+                return call, call_many
+
+            def versioned(call):
+                # The updates may modify the shared values inplace.
+                def versioned_call(*args):
+                    for c in updated_containers:
+                        c.version += 1
+                    return call(*args)
+                return versioned_call
+            return versioned(call), versioned(call_many)
+
+        output_storage = self.output_storage
+        need_update_inputs = getattr(fn, 'need_update_inputs', True)
+        updated = [storage for input, storage in
+                   reversed(list(zip(self.maker.expanded_inputs,
+                                     self.input_storage)))
+                   if input.update is not None]
+        return_none = self.return_none
+        unpack_single = self.unpack_single
+        output_keys = self.output_keys
+        raise_fn_error = self._raise_fn_error
+
+        def trusted_call(*args):
+            if len(args) != n_explicit:
+                raise TypeError("Wrong number of inputs: expected %d, got %d"
+                                % (n_explicit, len(args)))
+            for cell, arg in izip(cells, args):
+                cell[0] = arg
+            for c in updated_containers:
+                c.version += 1
+            try:
+                outputs = fn()
+            except Exception:
+                exc_info = sys.exc_info()
+                for cell, value in izip(reset_cells, reset_values):
+                    cell[0] = value
+                raise_fn_error(*exc_info)
+            if outputs is None:
+                outputs = [x.data for x in output_storage]
+            for cell, value in izip(reset_cells, reset_values):
+                cell[0] = value
+            if need_update_inputs:
+                for storage in updated:
+                    storage.data = outputs.pop()
+            else:
+                outputs = outputs[:n_returned]
+            if return_none:
+                return None
+            elif unpack_single and len(outputs) == 1:
+                return outputs[0]
+            elif output_keys is not None:
+                return dict(izip(output_keys, outputs))
+            return outputs
+        return trusted_call, None
+
     value = property(
         lambda self: self._value,
         None,  # this property itself is not settable
@@ -989,7 +1407,9 @@ class Function(object):
 
     def free(self):
         """
-        When allow_gc = False, clear the Variables in storage_map
+        When allow_gc = False, clear the Variables in storage_map.
+        Also empty the buffer pool of the VM, if it has one, and release
+        the input values kept by an incremental VM.
         """
         # 1.no allow_gc return False
         # 2.has allow_gc, if allow_gc is False, return True
@@ -1000,6 +1420,10 @@ class Function(object):
 
             for node in self.nodes_with_inner_function:
                 ops_with_inner_function[node.op].free()
+        if getattr(self.fn, 'buffer_pool', None) is not None:
+            self.fn.clear_storage()
+        if getattr(self.fn, 'incremental', False):
+            self.fn.input_values = None
 
     def get_shared(self):
         """
@@ -1007,6 +1431,72 @@ class Function(object):
         """
         return [i.variable for i in self.maker.inputs if i.implicit]
 
+    def replicate(self, swap, name=None):
+        """
+        Return a function that computes the same thing as this one, but on
+        other shared variables, without compiling or linking anything.
+
+        Unlike ``copy(swap=...)``, the returned function reuses the thunks
+        and the storage of this one: when it is called, the values of its
+        shared variables are put in the storage cells of this function, the
+        computation is run, and the (possibly updated) values are moved
+        back to its shared variables. It is cheap to create, but it must
+        not be called at the same time as this function or any of its
+        other replicas (e.g. from another thread).
+
+        Parameters
+        ----------
+        swap : dict
+            Dictionary that maps SharedVariables used by this function to the
+            SharedVariables the new function must use instead. They must
+            have the same type.
+        name : string
+            If provided, will be the name of the new Function. Otherwise, it
+            will be the name of this one.
+
+        Returns
+        -------
+        theano.Function
+            The new function.
+
+        """
+        fn = self.fn
+        cells = []
+        if isinstance(fn, _RebindStorage):
+            # Rebind the cells of the original function, not ours.
+            cells = list(fn.cells)
+            fn = fn.fn
+        input_storage = list(self.input_storage)
+        for sv, new_sv in iteritems(swap):
+            container = self.finder.get(sv)
+            if not isinstance(container, gof.Container) or \
+                    not container.implicit:
+                raise ValueError("SharedVariable: %s not found" % (sv.name))
+            if sv.type != new_sv.type:
+                raise TypeError(
+                    "Type of given SharedVariable conflicts with original "
+                    "one", sv.type, new_sv.type)
+            i = [j for j, c in enumerate(input_storage) if c is container][0]
+            fn_cell = container.storage
+            for j, (f_cell, cell) in enumerate(cells):
+                if cell is fn_cell:
+                    fn_cell = f_cell
+                    del cells[j]
+                    break
+            cells.append((fn_cell, new_sv.container.storage))
+            input_storage[i] = new_sv.container
+
+        f_rep = type(self)(_RebindStorage(fn, cells), input_storage,
+                           self.output_storage, self.indices, self.outputs,
+                           self.defaults, self.unpack_single,
+                           self.return_none, self.output_keys, self.maker)
+        f_rep.profile = self.profile
+        f_rep.trust_input = self.trust_input
+        f_rep.name = name or self.name
+        for sv, new_sv in iteritems(swap):
+            f_rep.finder[new_sv] = new_sv.container
+        return f_rep
+
 
 # pickling/deepcopy support for Function
 def _pickle_Function(f):
@@ -1222,171 +1712,23 @@ class FunctionMaker(object):
             raise TypeError("Unknown output type: %s (%s)", type(output),
                             output)
 
-    def optimize_graph_with_cache(self, optimizer, inputs, outputs):
-        # This function is not finished
-        from theano.gof.compilelock import get_lock, release_lock
-        import os.path
-
-        graph_db_file = os.path.join(theano.config.compiledir,
-                                     'optimized_graphs.pkl')
-
-        # the inputs, outputs, and size of the graph to be optimized
-        inputs_new = [inp.variable for inp in inputs]
-        outputs_new = [out.variable for out in outputs]
-        size_new = len(self.fgraph.apply_nodes)
-        get_lock()
-        # Beginning of cache optimizations.
-        # Could be refactored in different functions.
-
-        def load_graph_db():
-            if os.path.isfile(graph_db_file):
-                print('graph_db already exists')
-            else:
-                # create graph_db
-                with open(graph_db_file, 'wb') as f:
-                    print('create new graph_db in %s' % graph_db_file)
-            # load the graph_db dictionary
-            try:
-                with open(graph_db_file, 'rb') as f:
-                    # Temporary hack to allow
-                    # theano.scan_module.tests.test_scan.T_Scan to
-                    # finish. Should be changed in definitive version.
-                    tmp = theano.config.unpickle_function
-                    theano.config.unpickle_function = False
-                    graph_db = pickle.load(f)
-                print('graph_db loaded and it is not empty')
-            except EOFError as e:
-                # the file has nothing in it
-                print(e)
-                print('graph_db loaded and it is empty')
-                graph_db = {}
-            finally:
-                theano.config.unpickle_function = tmp
-
-            return graph_db
-
-        def find_same_graph_in_db(graph_db):
-            # If found_graph_in_db is None, then need to optimize.
-            # Otherwise, return the graph found.
-            found_graph_in_db = None
-            # The sole purpose of this loop is to set 'need_optimize' by
-            # going through graph_db, looking for graph that has the same
-            # computation performed.
-            for graph_old, graph_optimized in iteritems(graph_db):
-                inputs_old = graph_old.inputs
-                outputs_old = graph_old.outputs
-                size_old = len(graph_old.apply_nodes)
-                # Some heuristics to check is the same graphs have
-                # already been optimized before.
-                if len(inputs_new) != len(inputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because input size is different')
-                    continue
-                elif len(outputs_new) != len(outputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because output size is different')
-                    continue
-                elif not all(input_new.type == input_old.type
-                             for input_new, input_old in
-                             zip(inputs_new, inputs_old)):
-                    print('need to optimize, because inputs are of different '
-                          'types')
-                    continue
-                elif not all(output_new.type == output_old.type
-                             for output_new, output_old in
-                             zip(outputs_new, outputs_old)):
-                    print('need to optimize, because outputs are of different '
-                          'types')
-                    continue
-                elif not size_old == size_new:
-                    print('need to optimize, because numbers of nodes in graph'
-                          ' are different')
-                    continue
-                else:
-                    flags = []
-                    for i, (output_new, output_old) in enumerate(
-                            zip(outputs_new, outputs_old)):
-                        print('loop through outputs node for both graphs')
-                        graph_old.variables = set(gof.graph.variables(
-                            graph_old.inputs, graph_old.outputs))
-
-                        # using clone allowed to avoid a lot of errors
-                        # deep copy seemed to had.
-                        f2 = graph_old.clone(check_integrity=False)
-                        t1 = output_new
-                        t2 = f2.outputs[i]
-
-                        # Used to remove "already used by another graph error
-                        def removeAllFgraph(remove):
-                            if hasattr(remove, 'fgraph'):
-                                del remove.fgraph
-                            if hasattr(remove, 'owner'):
-                                if remove.owner is None:
-                                    pass
-                                else:
-                                    if hasattr(remove.owner, 'fgraph'):
-                                        del remove.owner.fgraph
-                                    if hasattr(remove.owner, 'inputs'):
-                                        remove.owner.inputs = [removeAllFgraph(
-                                            i) for i in remove.owner.inputs]
-                                        for o in remove.owner.outputs:
-                                            if hasattr(o, 'fgraph'):
-                                                del o.fgraph
-                            return remove
-
-                        t2 = removeAllFgraph(t2)
-
-                        givens = dict(izip(gof.graph.inputs([t1]),
-                                           gof.graph.inputs([t2])))
-
-                        temp = dict(izip(gof.graph.inputs([t1]),
-                                         gof.graph.inputs([t2])))
-
-                        # hack to remove inconstent entry in givens
-                        # seems to work that but source of inconsistency
-                        # could be worth investigating.
-                        for key, value in iteritems(temp):
-                            if key.type != value.type:
-                                del givens[key]
-
-                        flag = is_same_graph(t1, t2, givens=givens)
-
-                        flags.append(flag)
-
-                    is_same = all(flags)
-                    if is_same:
-                        # found the match
-                        print('found a match, no need to optimize')
-                        found_graph_in_db = graph_optimized
-                        break
-            return found_graph_in_db
-
-        graph_db = load_graph_db()
-        print('loaded graph_db from %s, size=%d' % (graph_db_file,
-                                                    len(graph_db)))
-        found_graph = find_same_graph_in_db(graph_db)
-        if found_graph:
-            self.fgraph = found_graph
-            optimizer_profile = None
-        else:
-            # this is a brand new graph, optimize it, save it to graph_db
-            print('graph not found in graph_db, optimizing the graph')
-            self.fgraph.variables = set(gof.graph.variables(
-                self.fgraph.inputs, self.fgraph.outputs))
-            # check_integrity parameters was added to ignore
-            # "excess cached variables" errors. Works that way
-            # but once again the error couldbe worth
-            # investigating.
-            before_opt = self.fgraph.clone(check_integrity=False)
-            optimizer_profile = optimizer(self.fgraph)
-            graph_db.update({before_opt: self.fgraph})
-            with open(graph_db_file, 'wb') as f:
-                pickle.dump(graph_db, f, -1)
-            print('new graph saved into graph_db')
-        release_lock()
-        return optimizer_profile
+    def optimize_graph_with_cache(self, optimizer, inputs, outputs,
+                                  mode=None):
+        """
+        Optimize `self.fgraph` inplace with `optimizer`, reusing the result
+        of a previous optimization of a structurally identical graph if
+        there is one in the optimization cache of the compiledir.
+
+        Returns the optimizer profile, or None on a cache hit.
+
+        See Also
+        --------
+        theano.compile.optcache
+
+        """
+        return theano.compile.optcache.optimize_with_cache(
+            optimizer, self.fgraph, inputs,
+            getattr(mode, 'provided_optimizer', None))
 
     def __init__(self, inputs, outputs,
                  mode=None, accept_inplace=False, function_builder=Function,
@@ -1473,7 +1815,7 @@ class FunctionMaker(object):
                 # now optimize the graph
                 if theano.config.cache_optimizations:
                     optimizer_profile = self.optimize_graph_with_cache(
-                        optimizer, inputs, outputs)
+                        optimizer, inputs, outputs, mode)
                 else:
                     optimizer_profile = optimizer(fgraph)
 
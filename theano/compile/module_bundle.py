@@ -0,0 +1,84 @@
+"""
+Export the compiled C modules used by functions, to warm up another cache.
+
+`export_cache_bundle` writes in a single archive the modules of the
+`ModuleCache` that compiled functions use. `import_cache_bundle` adds them
+to the cache of another machine with the same platform, Python and
+compiler, so that compiling the same functions there does not call the
+C compiler. The archive only holds compiled modules, so it can be
+imported before the functions are built. A typical use is::
+
+    theano-cache bundle bundle.tar.gz f1.pkl f2.pkl  # on the build machine
+    theano-cache import bundle.tar.gz                # in the container
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import logging
+
+from theano.gof.cc import CLinker, get_module_cache, node_cmodule_keys
+
+_logger = logging.getLogger('theano.compile.module_bundle')
+
+
+def function_cmodule_keys(fn):
+    """
+    Return the keys of the C modules used by the compiled function `fn`,
+    including those of the functions of its Ops (e.g. Scan).
+
+    """
+    from theano.compile.function_module import Function
+    linker = fn.maker.linker
+    fgraph = linker.fgraph
+    keys = []
+    if isinstance(linker, CLinker):
+        try:
+            keys.append(linker.cmodule_key())
+        except Exception as e:
+            _logger.debug('No C module key for %s: %s', fn, e)
+    else:
+        keys.extend(key for key, lnk in node_cmodule_keys(
+            fgraph.toposort(), getattr(linker, 'no_recycling', [])))
+    for node in fgraph.apply_nodes:
+        inner_fn = getattr(node.op, 'fn', None)
+        if isinstance(inner_fn, Function):
+            keys.extend(function_cmodule_keys(inner_fn))
+    return keys
+
+
+def export_cache_bundle(functions, path):
+    """
+    Write the compiled C modules used by `functions` in the archive `path`.
+
+    Parameters
+    ----------
+    functions
+        List of compiled `Function`.
+    path : str
+        The archive to write.
+
+    Returns
+    -------
+    int
+        The number of exported modules.
+
+    """
+    keys = []
+    for fn in functions:
+        keys.extend(function_cmodule_keys(fn))
+    return get_module_cache().export_bundle(keys, path)
+
+
+def import_cache_bundle(path):
+    """
+    Add the modules of an archive written by `export_cache_bundle` to the
+    cache.
+
+    Returns
+    -------
+    int
+        The number of imported modules (those already in the cache are
+        skipped).
+
+    """
+    return get_module_cache().import_bundle(path)
@@ -0,0 +1,310 @@
+"""
+Persistent cache of optimized graphs.
+
+When `config.cache_optimizations` is True, `FunctionMaker` looks up the
+optimized version of a graph in this cache before running the optimizer.
+Entries are content-addressed: the key is a hash of the structure of the
+unoptimized graph (ops, types, constants and how they are connected, but
+not the identity or names of the variables), of the optimizer and of the
+Theano flags that can change the optimized graph. Each entry is stored in its own
+file under ``<compiledir>/optimized_graphs``, so processes sharing a
+compiledir can read and write it concurrently without taking the
+compilation lock.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import logging
+import os
+import tempfile
+import time
+
+import six.moves.cPickle as pickle
+from six import string_types
+
+import theano
+from theano import config, gof
+from theano.gof import graph
+from theano.gof.utils import hash_from_code
+
+_logger = logging.getLogger('theano.compile.optcache')
+
+# Global counters, reported by `theano.compile.profiling.print_global_stats`.
+stats = {'hit': 0, 'miss': 0, 'skip': 0, 'store': 0, 'evict': 0, 'error': 0}
+
+# Flags that can't change the optimized graph: paths, verbosity and
+# profiling options, and the settings of this cache. All the other flags
+# are part of the key, not only the ones in the C key, as many of them
+# select or tune optimizations.
+_ignored_flags = frozenset([
+    'base_compiledir', 'compiledir', 'compiledir_format', 'home',
+    'nocleanup', 'exception_verbosity', 'optimizer_verbose',
+    'metaopt.verbose', 'print_active_device', 'print_global_stats',
+    'print_test_value', 'profile', 'profile_memory', 'profile_optimizer',
+    'cmodule.warn_no_version', 'cmodule.compilation_warning',
+    'cache_optimizations', 'cache_optimizations_max_entries'])
+_ignored_flag_prefixes = ('profiling.', 'traceback.')
+
+
+def config_signature():
+    """
+    Return a string describing the value of the flags that can change the
+    optimized graph.
+
+    """
+    return '\n'.join(
+        '%s = %s' % (cv.fullname, cv.__get__(True, None))
+        for cv in sorted(theano.configparser._config_var_list,
+                         key=lambda cv: cv.fullname)
+        if (cv.fullname not in _ignored_flags and
+            not cv.fullname.startswith(_ignored_flag_prefixes)))
+
+
+def _variable_ref(var, ids):
+    """
+    Return a picklable description of `var` that doesn't depend on its
+    identity, given the descriptions `ids` of the variables seen so far.
+
+    """
+    if var in ids:
+        return ids[var]
+    if isinstance(var, graph.Constant):
+        return ('constant', var.type, var.data)
+    raise ValueError("Can't describe variable %s: it is neither an input "
+                     "of the graph nor a constant." % var)
+
+
+def graph_key(fgraph, input_specs, optimizer):
+    """
+    Return the cache key of the unoptimized `fgraph`, or None if it can't be
+    cached.
+
+    Parameters
+    ----------
+    fgraph : FunctionGraph
+        The graph as returned by `std_fgraph`, before optimization.
+    input_specs : list of SymbolicInput
+        The input specifications. Their `mutable` flag changes which
+        inplace optimizations are legal, so it is part of the key.
+    optimizer
+        The optimizer as provided to the `Mode`. Only `Query` and strings
+        have a description that is stable across processes; for any other
+        optimizer, None is returned.
+
+    """
+    if not isinstance(optimizer, (gof.Query, string_types)):
+        return None
+    ids = {}
+    for i, inp in enumerate(fgraph.inputs):
+        ids[inp] = ('input', i)
+    nodes = []
+    for n_idx, node in enumerate(fgraph.toposort()):
+        nodes.append((node.op,
+                      tuple(_variable_ref(i, ids) for i in node.inputs)))
+        for o_idx, out in enumerate(node.outputs):
+            ids[out] = ('node', n_idx, o_idx)
+    signature = (theano.__version__,
+                 config_signature(),
+                 str(optimizer),
+                 tuple((inp.type, bool(spec.mutable))
+                       for inp, spec in zip(fgraph.inputs, input_specs)),
+                 sorted(fgraph.update_mapping.items()),
+                 nodes,
+                 tuple(_variable_ref(o, ids) for o in fgraph.outputs))
+    try:
+        return hash_from_code(pickle.dumps(signature, 2))
+    except Exception as e:
+        # Some Ops can't be pickled (e.g. they hold a lambda).
+        _logger.debug('Graph not cacheable: %s', e)
+        return None
+
+
+class OptimizationCache(object):
+    """
+    Directory of optimized graphs, one pickle file per key.
+
+    Each entry stores placeholder inputs and the optimized outputs built on
+    top of them. When an entry is used, the optimized graph is cloned on
+    top of the inputs of the `FunctionGraph` being compiled, so entries
+    never hold references to user variables or shared values.
+
+    Parameters
+    ----------
+    dirname : str
+        The directory holding the entries. It is created on the first store.
+    max_entries : int
+        When more than `max_entries` entries are stored, the least recently
+        used ones are removed. 0 means no limit.
+
+    """
+
+    def __init__(self, dirname, max_entries=0):
+        self.dirname = dirname
+        self.max_entries = max_entries
+
+    def _entry_path(self, key):
+        return os.path.join(self.dirname, key + '.pkl')
+
+    def _listdir(self):
+        try:
+            return os.listdir(self.dirname)
+        except OSError:
+            return []
+
+    def load(self, key):
+        """
+        Return the (inputs, outputs) pair stored for `key`, or None.
+
+        """
+        path = self._entry_path(key)
+        if not os.path.exists(path):
+            return None
+        # Do not unpickle the inner function of Ops like Scan, the
+        # optimized graph holds them already.
+        unpickle_function = config.unpickle_function
+        config.unpickle_function = False
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            # Mark the entry as recently used for the eviction.
+            os.utime(path, None)
+        except Exception as e:
+            # Corrupted entry or an entry that was removed between the
+            # test above and the open.
+            _logger.warning('Ignoring optimization cache entry %s: %s',
+                            path, e)
+            stats['error'] += 1
+            self._remove(path)
+            return None
+        finally:
+            config.unpickle_function = unpickle_function
+        return entry
+
+    def store(self, key, fgraph):
+        """
+        Store the optimized `fgraph` under `key`.
+
+        The file is written under a temporary name and renamed, so readers
+        in other processes never see a partially written entry.
+
+        """
+        inputs = [inp.type() for inp in fgraph.inputs]
+        # Constants are copied too, as the ones in fgraph are owned by it.
+        memo = graph.clone_get_equiv(fgraph.inputs, fgraph.outputs,
+                                     copy_inputs_and_orphans=True,
+                                     memo=dict(zip(fgraph.inputs, inputs)))
+        # Outputs that are constants are not computed by any node.
+        outputs = [memo[o] if o in memo else o.clone()
+                   for o in fgraph.outputs]
+        if not os.path.isdir(self.dirname):
+            try:
+                os.makedirs(self.dirname)
+            except OSError:
+                # Another process may have created it in the meantime.
+                assert os.path.isdir(self.dirname)
+        fd, tmp_path = tempfile.mkstemp(dir=self.dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((inputs, outputs), f, -1)
+            os.rename(tmp_path, self._entry_path(key))
+        except Exception as e:
+            _logger.warning('Could not store the optimized graph in the '
+                            'optimization cache: %s', e)
+            stats['error'] += 1
+            self._remove(tmp_path)
+            return
+        stats['store'] += 1
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries above `max_entries`, and
+        temporary files left by interrupted writers.
+
+        """
+        now = time.time()
+        entries = []
+        for filename in self._listdir():
+            path = os.path.join(self.dirname, filename)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if filename.endswith('.pkl'):
+                entries.append((mtime, path))
+            elif filename.endswith('.tmp') and now - mtime > 3600:
+                self._remove(path)
+        if self.max_entries and len(entries) > self.max_entries:
+            entries.sort()
+            for mtime, path in entries[:len(entries) - self.max_entries]:
+                self._remove(path)
+                stats['evict'] += 1
+
+    def clear(self):
+        """
+        Remove all entries.
+
+        """
+        for filename in self._listdir():
+            self._remove(os.path.join(self.dirname, filename))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            # Already removed by another process.
+            pass
+
+
+def get_optimization_cache():
+    """
+    Return the `OptimizationCache` of the current compiledir.
+
+    """
+    dirname = os.path.join(config.compiledir, 'optimized_graphs')
+    cache = getattr(get_optimization_cache, 'cache', None)
+    if cache is None or cache.dirname != dirname:
+        cache = OptimizationCache(dirname)
+        get_optimization_cache.cache = cache
+    cache.max_entries = config.cache_optimizations_max_entries
+    return cache
+
+
+def optimize_with_cache(optimizer, fgraph, input_specs, provided_optimizer):
+    """
+    Optimize `fgraph` inplace with `optimizer`, going through the cache.
+
+    Returns the optimizer profile, or None when the graph was found in the
+    cache.
+
+    """
+    key = graph_key(fgraph, input_specs, provided_optimizer)
+    if key is None:
+        stats['skip'] += 1
+        return optimizer(fgraph)
+    cache = get_optimization_cache()
+    entry = cache.load(key)
+    if entry is None:
+        stats['miss'] += 1
+        _logger.debug('Optimization cache miss for %s', key)
+        optimizer_profile = optimizer(fgraph)
+        cache.store(key, fgraph)
+        return optimizer_profile
+
+    stats['hit'] += 1
+    _logger.debug('Optimization cache hit for %s', key)
+    inputs, outputs = entry
+    memo = graph.clone_get_equiv(inputs, outputs,
+                                 copy_inputs_and_orphans=False,
+                                 memo=dict(zip(inputs, fgraph.inputs)))
+    new_outputs = [memo.get(o, o) for o in outputs]
+    if (not hasattr(fgraph, 'destroyers') and
+            any(getattr(node.op, 'destroy_map', None)
+                for node in graph.io_toposort(fgraph.inputs, new_outputs))):
+        # The optimizer would have added it while introducing inplace ops.
+        fgraph.attach_feature(gof.DestroyHandler())
+    for i, new_output in enumerate(new_outputs):
+        fgraph.change_input('output', i, new_output,
+                            reason='cache_optimizations')
+    return None
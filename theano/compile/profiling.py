@@ -83,7 +83,8 @@ def _atexit_print_fn():
                 for attr in ["compile_time", "fct_call_time", "fct_callcount",
                              "vm_call_time", "optimizer_time", "linker_time",
                              "validate_time", "import_time",
-                             "linker_node_make_thunks"]:
+                             "linker_node_make_thunks", "buffer_pool_hits",
+                             "buffer_pool_misses", "buffer_pool_size"]:
                     setattr(cum, attr, getattr(cum, attr) + getattr(ps, attr))
 
                 # merge dictonary
@@ -124,6 +125,7 @@ def print_global_stats():
       -- Time spent in compiling Theano functions
            -- on graph optimization
            -- on linker
+      -- Optimization cache hits and misses, if it is enabled
     """
 
     if config.profiling.destination == 'stderr':
@@ -144,6 +146,14 @@ def print_global_stats():
            total_graph_opt_time,
            total_time_linker),
           file=destination_file)
+    if config.cache_optimizations:
+        stats = theano.compile.optcache.stats
+        print('Optimization cache: '
+              'hit = %d, miss = %d, not cacheable = %d, stored = %d, '
+              'evicted = %d, errors = %d' %
+              (stats['hit'], stats['miss'], stats['skip'], stats['store'],
+               stats['evict'], stats['error']),
+              file=destination_file)
     print('=' * 50, file=destination_file)
 
 
@@ -247,6 +257,16 @@ class ProfileStats(object):
 
     linker_make_thunk_time = {}
 
+    buffer_pool_hits = 0
+    # Number of outputs that got their storage from the buffer pool of the VM
+    # (see config.vm.buffer_pool_size)
+
+    buffer_pool_misses = 0
+    # Number of outputs that did not find their storage in the buffer pool
+
+    buffer_pool_size = 0
+    # Bytes held by the buffer pool after the last call
+
     line_width = config.profiling.output_line_width
 
     nb_nodes = -1
@@ -730,6 +750,10 @@ class ProfileStats(object):
                 print('  Time in thunks: %es (%.3f%%)' %
                       (local_time, 100 * local_time / self.fct_call_time),
                       file=file)
+        if self.buffer_pool_hits or self.buffer_pool_misses:
+            print('  Buffer pool: %d hits, %d misses, %d bytes held' % (
+                self.buffer_pool_hits, self.buffer_pool_misses,
+                self.buffer_pool_size), file=file)
         print('  Total compile time: %es' % self.compile_time, file=file)
         print('    Number of Apply nodes: %d' % self.nb_nodes, file=file)
         print('    Theano Optimizer time: %es' % self.optimizer_time,
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function, division
 import copy
+import threading
 import six.moves.cPickle as pickle
 import numpy as np
 import unittest
@@ -336,6 +337,148 @@ class T_function(unittest.TestCase):
 
             second_time = True
 
+    def test_replicate(self):
+        x = T.scalar('x')
+        y = theano.shared(value=1., name='y')
+        z = theano.shared(value=2., name='z')
+        y_rpl = theano.shared(value=3., name='y_rpl')
+        z_rpl = theano.shared(value=4., name='z_rpl')
+        z_rpl2 = theano.shared(value=5., name='z_rpl2')
+
+        for mode in ["FAST_RUN", "FAST_COMPILE"]:
+            y.set_value(1.)
+            z.set_value(2.)
+            y_rpl.set_value(3.)
+            z_rpl.set_value(4.)
+            z_rpl2.set_value(5.)
+            ori = theano.function([x], x + y + z, mode=mode,
+                                  updates=[(z, z + 1)])
+            rpl = ori.replicate({y: y_rpl, z: z_rpl}, name='rpl')
+            assert rpl.name == 'rpl'
+            assert rpl.maker is ori.maker
+            assert rpl(1) == 8
+            assert z_rpl.get_value() == 5
+            assert z.get_value() == 2
+            assert ori(1) == 4
+            assert z.get_value() == 3
+            assert z_rpl.get_value() == 5
+            # Values set after the replication are used.
+            y_rpl.set_value(10.)
+            assert rpl(0) == 15
+            assert z_rpl.get_value() == 6
+
+            # Replicas of replicas rebind the cells of the original.
+            rpl2 = rpl.replicate({z_rpl: z_rpl2})
+            assert rpl2(0) == 15
+            assert z_rpl2.get_value() == 6
+            assert z_rpl.get_value() == 6
+            assert z.get_value() == 3
+            assert ori(0) == 4
+
+            self.assertRaises(ValueError, ori.replicate, {z_rpl: z})
+            self.assertRaises(TypeError, ori.replicate,
+                              {z: theano.shared(np.zeros(2))})
+
+    def test_trusted_call(self):
+        x = T.dvector('x')
+        a = T.dscalar('a')
+        s = theano.shared(np.zeros(3), name='s')
+        for mode in ["FAST_RUN", "FAST_COMPILE"]:
+            s.set_value(np.zeros(3))
+            f = function([x, In(a, value=2.)], x * a, mode=mode,
+                         updates=[(s, s + x)])
+            assert f.trusted_caller() is f.trusted_caller()
+            assert np.allclose(f.trusted_call(np.ones(3), np.asarray(3.)), [3, 3, 3])
+            assert np.allclose(s.get_value(), [1, 1, 1])
+            call = f.trusted_caller()
+            assert np.allclose(call(np.arange(3.), np.asarray(1.)), [0, 1, 2])
+            assert np.allclose(s.get_value(), [1, 2, 3])
+            # The inputs and default values are reset for __call__.
+            assert f.input_storage[0].storage[0] is None
+            assert np.allclose(f(np.ones(3)), [2, 2, 2])
+            self.assertRaises(TypeError, call, np.ones(3))
+
+            g = function([x], [x + 1, x * 2], mode=mode)
+            r = g.trusted_call(np.ones(2))
+            assert len(r) == 2
+            assert np.allclose(r[1], [2, 2])
+            h = function([x], updates=[(s, x)], mode=mode)
+            assert h.trusted_call(np.ones(3)) == h(np.ones(3))
+            assert np.allclose(s.get_value(), [1, 1, 1])
+
+    def test_map(self):
+        x = T.dvector('x')
+        a = T.dscalar('a')
+        s = theano.shared(0., name='s')
+        for mode in ["FAST_RUN", "FAST_COMPILE"]:
+            s.set_value(0.)
+            f = function([x, a], (x * a).sum(), mode=mode,
+                         updates=[(s, s + a)])
+            inputs = [([1, 2], i) for i in range(5)]
+            results = f.map(inputs, chunksize=2)
+            assert not isinstance(results, list)
+            assert np.allclose(list(results), [0, 3, 6, 9, 12])
+            assert s.get_value() == 10
+            assert np.allclose(f.call_many(inputs), [0, 3, 6, 9, 12])
+            assert s.get_value() == 20
+            self.assertRaises(TypeError, f.call_many, [([1.5],)])
+
+            g = function([In(x, mutable=True)], x * 2, mode=mode)
+            assert np.allclose(g.call_many([([1.],), ([2.],)]), [[2], [4]])
+
+    def test_call_async(self):
+        x = T.dvector('x')
+        w = theano.shared(np.ones(2), name='w')
+        f = function([x], T.dot(x, w))
+        f.async_workers = 2
+        futures = [f.call_async(np.asarray([i, 1.])) for i in range(10)]
+        assert [fut.result() for fut in futures] == [i + 1. for i in range(10)]
+        assert 1 <= len(f._async_functions) <= 2
+        assert all(g is not f for g in f._async_functions)
+        # The copies see the new values of the shared variables.
+        w.set_value(np.zeros(2))
+        assert f.call_async(x=[1., 1.]).result() == 0
+        # The exceptions are raised by the future.
+        self.assertRaises(ValueError, f.call_async([1.]).result)
+
+        # With updates, the calls are run in order by the function itself.
+        s = theano.shared(0., name='s')
+        a = T.dscalar('a')
+        g = function([a], s, updates=[(s, s + a)])
+        futures = [g.call_async(i) for i in range(5)]
+        assert [fut.result() for fut in futures] == [0, 0, 1, 3, 6]
+        assert s.get_value() == 10
+        assert g._async_functions == [g]
+
+    def test_thread_local_storage(self):
+        x = T.dvector('x')
+        w = theano.shared(np.ones(3), name='w')
+        f = function([x], Out(x * w, borrow=True))
+        f.thread_local_storage = True
+        assert np.allclose(f([1., 2., 3.]), [1, 2, 3])
+        results = {}
+        start = threading.Event()
+
+        def run(i):
+            start.wait()
+            for j in range(20):
+                r = f(np.ones(3) * i)
+                if not np.allclose(r, i):
+                    results[i] = r
+                    return
+            results[i] = f.trusted_caller()(np.ones(3) * i)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        start.set()
+        for t in threads:
+            t.join()
+        for i in range(4):
+            assert np.allclose(results[i], i)
+        # The first thread kept the storage of the function.
+        assert f._thread_function() is f
+
     def test_swap_SharedVariable_with_given(self):
         """
         A special testcase for logistic_sgd.py in Deep Learning Tutorial
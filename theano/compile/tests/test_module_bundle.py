@@ -0,0 +1,55 @@
+from __future__ import absolute_import, print_function, division
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+from theano.compile.module_bundle import function_cmodule_keys
+from theano.gof import cmodule
+
+
+def add_fake_module(dirname, key, module_hash):
+    # Add to the cache `dirname` a module for `key`, without compiling it.
+    root = tempfile.mkdtemp(dir=dirname)
+    open(os.path.join(root, '__init__.py'), 'w').close()
+    with open(os.path.join(root, 'mod.so'), 'w') as f:
+        f.write('not a real module')
+    cmodule.KeyData(keys=set([key]), module_hash=module_hash,
+                    key_pkl=os.path.join(root, 'key.pkl'),
+                    entry=os.path.join(root, 'mod.so')).save_pkl()
+
+
+def test_export_import_bundle():
+    x = T.dvector('x')
+    f = theano.function([x], T.exp(x) * 2, mode='FAST_RUN')
+    keys = [key for key in function_cmodule_keys(f) if key[0]]
+    assert keys
+    assert np.allclose(f([0, 1]), 2 * np.exp([0, 1]))
+
+    src_dir = tempfile.mkdtemp()
+    dst_dir = tempfile.mkdtemp()
+    try:
+        for i, key in enumerate(keys):
+            add_fake_module(src_dir, key, 'hash%d' % i)
+        src = cmodule.ModuleCache(src_dir, use_index=False)
+        path = os.path.join(src_dir, 'bundle.tar.gz')
+        assert src.export_bundle(keys, path) == len(keys)
+
+        dst = cmodule.ModuleCache(dst_dir, use_index=True)
+        assert dst.import_bundle(path) == len(keys)
+        # Modules already in the cache are not imported again.
+        assert dst.import_bundle(path) == 0
+
+        dst = cmodule.ModuleCache(dst_dir, use_index=True)
+        for i, key in enumerate(keys):
+            assert dst._load_from_index('hash%d' % i)
+            entry = dst.entry_from_key[key]
+            assert entry.startswith(dst_dir)
+            with open(entry) as f:
+                assert f.read() == 'not a real module'
+    finally:
+        shutil.rmtree(src_dir)
+        shutil.rmtree(dst_dir)
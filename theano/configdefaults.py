@@ -942,6 +942,24 @@ AddConfigVar('openmp_elemwise_minsize',
              in_c_key=False,
              )
 
+AddConfigVar('elemwise_simd',
+             "If True, the C code of elemwise ops on contiguous inputs "
+             "tells the compiler to vectorize its loop with "
+             "'#pragma omp simd'. It needs a compiler that supports "
+             "-fopenmp-simd.",
+             BoolParam(False),
+             in_c_key=False,
+             )
+
+AddConfigVar('openmp_thread_budget',
+             "If more than 0, the vm linkers set before each call of the C"
+             " code of OpenMP and BLAS nodes how many threads it uses, from"
+             " the size of its inputs and within that many threads for the"
+             " function.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False,
+             )
+
 AddConfigVar(
     'check_input',
     "Specify if types should check their input in their C code. "
@@ -953,14 +971,23 @@ AddConfigVar(
 
 AddConfigVar(
     'cache_optimizations',
-    "WARNING: work in progress, does not work yet. "
-    "Specify if the optimization cache should be used. This cache will "
-    "any optimized graph and its optimization. Actually slow downs a lot "
-    "the first optimization, and could possibly still contains some bugs. "
-    "Use at your own risks.",
+    "Specify if the optimization cache should be used. When True, the "
+    "optimized version of each graph is stored in the compiledir, keyed "
+    "by a structural hash of the unoptimized graph, the optimizer and "
+    "the Theano flags. Compiling a structurally identical graph again "
+    "(in this or any other process) reuses it instead of running the "
+    "optimizer.",
     BoolParam(False),
     in_c_key=False)
 
+AddConfigVar(
+    'cache_optimizations_max_entries',
+    "Maximum number of optimized graphs kept in the optimization cache. "
+    "When it is exceeded, the least recently used entries are removed. "
+    "0 means no limit.",
+    IntParam(2000, lambda i: i >= 0),
+    in_c_key=False)
+
 
 def good_seed_param(seed):
     if seed == "random":
@@ -1145,6 +1172,21 @@ AddConfigVar('optdb.max_use_ratio',
              FloatParam(8),
              in_c_key=False)
 
+AddConfigVar('optdb.worklist',
+             'If True, after their first iteration, EquilibriumOptimizer'
+             ' only visit the nodes that changed, then all of them once'
+             ' at the end to check the equilibrium.',
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('cycle_detection',
+             "How the DestroyHandler checks that the graph has no cycle."
+             " 'incremental' keeps a topological order up to date and only"
+             " visits the nodes affected by each change, 'regular' sorts"
+             " the whole graph at each validation.",
+             EnumStr('incremental', 'regular'),
+             in_c_key=False)
+
 AddConfigVar('gcc.cxxflags',
              "Extra compiler flags for gcc",
              StrParam(""),
@@ -1179,6 +1221,43 @@ AddConfigVar('cmodule.preload_cache',
              BoolParam(False, allow_override=False),
              in_c_key=False)
 
+AddConfigVar('cmodule.use_index',
+             "If True, the C module cache keeps an index of its modules, so "
+             "that a new process does not need to load all of them when it "
+             "starts, only those it uses.",
+             BoolParam(True, allow_override=False),
+             in_c_key=False)
+
+AddConfigVar('cmodule.lazy_load',
+             "If True, the C module of a thunk that is already in the cache "
+             "is only imported when the thunk is first run. The C VM needs "
+             "them when it is built, so this mostly helps the other linkers.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('cmodule.max_loaded_modules',
+             "Maximum number of C modules the cache keeps references to. "
+             "When it is exceeded, the least recently used ones are "
+             "forgotten, and imported again if they are needed. 0 means no "
+             "limit.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('cmodule.compile_jobs',
+             "Number of threads used to compile the C modules of a function "
+             "that are not in the cache yet. They are all compiled before "
+             "the thunks are built. 1 disables it and 0 means the number of "
+             "CPUs.",
+             IntParam(1, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('cmodule.max_cache_size',
+             "In megabytes. When the modules in the cache use more disk "
+             "space, the least recently used ones are deleted when the "
+             "cache is cleaned up. 0 means no limit.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
 AddConfigVar('cmodule.age_thresh_use',
              "In seconds. The time after which "
              "Theano won't reuse a compile c module.",
@@ -1463,6 +1542,36 @@ AddConfigVar('vm.lazy',
              ConfigParam('None', filter_vm_lazy),
              in_c_key=False)
 
+AddConfigVar('vm.plan_storage',
+             "Useful only for the vm linkers that use the Loop/LoopGC VM."
+             " If True, intermediate results of any number of dimensions"
+             " share the storage of dead ones of the same type and shape,"
+             " instead of only scalars.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('vm.buffer_pool_size',
+             "Useful only for the vm linkers that use the LoopGC VM. If"
+             " more than 0, the intermediate results freed by the garbage"
+             " collection are kept in a pool of at most that many MB and"
+             " reused by the next calls.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('vm.incremental',
+             "Useful only for the vm linkers. If True, the intermediate"
+             " results are kept between calls and only those that depend"
+             " on inputs whose value changed are recomputed.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('vm.threads',
+             "Useful only for the vm linkers. If more than 1, the"
+             " independent nodes of graphs without lazy nodes are run"
+             " concurrently by that many threads.",
+             IntParam(1, lambda i: i >= 1),
+             in_c_key=False)
+
 AddConfigVar(
     'warn.identify_1pexp_bug',
     'Warn if Theano versions prior to 7987b51 (2011-12-18) could have '
@@ -1482,6 +1591,16 @@ AddConfigVar(
     theano.configparser.IntParam(-1),
     in_c_key=False)
 
+AddConfigVar(
+    'tensor.insert_inplace_optimizer_bisect',
+    "If True, when the validation of several changes done by"
+    " inplace_elemwise_optimizer (see"
+    " tensor.insert_inplace_optimizer_validate_nb) fails, they are tried"
+    " again by halves to only drop the ones that make the graph invalid,"
+    " instead of dropping all of them.",
+    theano.configparser.BoolParam(False),
+    in_c_key=False)
+
 AddConfigVar('experimental.local_alloc_elemwise',
              "DEPRECATED: If True, enable the experimental"
              " optimization local_alloc_elemwise."
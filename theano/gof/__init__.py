@@ -41,7 +41,8 @@ from theano.gof.cc import \
     CLinker, OpWiseCLinker, DualLinker, HideC
 
 from theano.gof.fg import \
-    CachedConstantError, InconsistencyError, MissingInputError, FunctionGraph
+    CachedConstantError, InconsistencyError, MissingInputError, FunctionGraph, \
+    CompactGraph
 
 from theano.gof.destroyhandler import \
     DestroyHandler
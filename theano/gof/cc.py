@@ -7,16 +7,18 @@ from __future__ import absolute_import, print_function, division
 
 # Python imports
 from copy import copy
+import functools
 import os
 import sys
 import logging
+import multiprocessing
 
 import numpy as np
 
 import theano
 from theano import config
 from theano.compat import PY3
-from theano.compat import izip
+from theano.compat import izip, get_unbound_function
 from six import string_types, reraise
 from six.moves import StringIO, xrange
 
@@ -1088,7 +1090,7 @@ class CLinker(link.Linker):
         return utils.uniq(ret)
 
     def __compile__(self, input_storage=None, output_storage=None,
-                    storage_map=None, keep_lock=False):
+                    storage_map=None, keep_lock=False, lazy=False):
         """
         Compiles this linker's fgraph.
 
@@ -1101,6 +1103,8 @@ class CLinker(link.Linker):
         output_storage: list of lists of length 1
             The thunk returned by __compile__ will put the variables of the
             computation in these lists. If None, storage will be allocated.
+        lazy: bool
+            See `cthunk_factory`.
 
         Returns
         -------
@@ -1128,7 +1132,8 @@ class CLinker(link.Linker):
                                     input_storage,
                                     output_storage,
                                     storage_map,
-                                    keep_lock=keep_lock)
+                                    keep_lock=keep_lock,
+                                    lazy=lazy)
         return (thunk,
                 [link.Container(input, storage) for input, storage in
                  izip(self.fgraph.inputs, input_storage)],
@@ -1153,7 +1158,7 @@ class CLinker(link.Linker):
         return init_tasks, tasks
 
     def make_thunk(self, input_storage=None, output_storage=None,
-                   storage_map=None, keep_lock=False):
+                   storage_map=None, keep_lock=False, lazy=None):
         """
         Compiles this linker's fgraph and returns a function to perform the
         computations, as well as lists of storage cells for both the inputs
@@ -1175,6 +1180,10 @@ class CLinker(link.Linker):
         keep_lock:
             If True, we won't release the lock on the compiledir
             at the end of this function call.
+        lazy:
+            If True, the module is only imported, and its C struct only
+            built, when the thunk is first used. Defaults to
+            config.cmodule.lazy_load.
         Returns: thunk, input_storage, output_storage
 
         The return values can be used as follows:
@@ -1184,12 +1193,18 @@ class CLinker(link.Linker):
           f()
           first_output = ostor[0].data
         """
+        if lazy is None:
+            lazy = config.cmodule.lazy_load
         init_tasks, tasks = self.get_init_tasks()
         cthunk, in_storage, out_storage, error_storage = self.__compile__(
             input_storage, output_storage, storage_map,
-            keep_lock=keep_lock)
+            keep_lock=keep_lock, lazy=lazy)
 
-        res = _CThunk(cthunk, init_tasks, tasks, error_storage)
+        if lazy:
+            res = _CThunk(None, init_tasks, tasks, error_storage,
+                          instantiate=cthunk)
+        else:
+            res = _CThunk(cthunk, init_tasks, tasks, error_storage)
         res.nodes = self.node_order
         return res, in_storage, out_storage
 
@@ -1474,9 +1489,9 @@ class CLinker(link.Linker):
         c_compiler = self.c_compiler()
         libs = self.libraries()
         preargs = self.compile_args()
-        # We want to compute the code without the lock
         src_code = mod.code()
-        get_lock()
+        # No lock is needed: `location` is a new directory, and the
+        # `ModuleCache` already holds the lock of this module's hash.
         try:
             _logger.debug("LOCATION %s", str(location))
             module = c_compiler.compile_str(
@@ -1490,8 +1505,6 @@ class CLinker(link.Linker):
         except Exception as e:
             e.args += (str(self.fgraph),)
             raise
-        finally:
-            release_lock()
         return module
 
     def get_dynamic_module(self):
@@ -1554,7 +1567,7 @@ class CLinker(link.Linker):
         return self._mod
 
     def cthunk_factory(self, error_storage, in_storage, out_storage,
-                       storage_map=None, keep_lock=False):
+                       storage_map=None, keep_lock=False, lazy=False):
         """
         Returns a thunk that points to an instance of a C struct that
         can carry on the computation of this linker's fgraph
@@ -1570,6 +1583,10 @@ class CLinker(link.Linker):
         when executed, will fetch its inputs from in_storage, put its
         outputs in out_storage and if an error occurs will put the
         type, value and traceback of the exception in error_storage.
+
+        If lazy is True, the module is still compiled if it is not in the
+        cache, but a function that imports it and returns the thunk is
+        returned instead.
         """
         try:
             key = self.cmodule_key()
@@ -1583,7 +1600,7 @@ class CLinker(link.Linker):
             for node in self.node_order:
                 node.op.prepare_node(node, storage_map, None, 'c')
             module = get_module_cache().module_from_key(
-                key=key, lnk=self, keep_lock=keep_lock)
+                key=key, lnk=self, keep_lock=keep_lock, lazy=lazy)
 
         vars = self.inputs + self.outputs + self.orphans
         # List of indices that should be ignored when passing the arguments
@@ -1599,8 +1616,10 @@ class CLinker(link.Linker):
         else:
             orphd = [storage_map[orphan] for orphan in self.orphans]
 
-        ret = module.instantiate(error_storage,
-                                 *(in_storage + out_storage + orphd))
+        args = in_storage + out_storage + orphd
+        if lazy:
+            return functools.partial(module.instantiate, error_storage, *args)
+        ret = module.instantiate(error_storage, *args)
 
         return ret
 
@@ -1647,19 +1666,32 @@ class _CThunk(object):
         WRITEME
     error_storage
         WRITEME
+    instantiate
+        If cthunk is None, function returning it, called the first time
+        the thunk is used.
 
     """
 
-    def __init__(self, cthunk, init_tasks, tasks, error_storage):
+    def __init__(self, cthunk, init_tasks, tasks, error_storage,
+                 instantiate=None):
         global run_cthunk
         if run_cthunk is None:
             # Lazy import to avoid compilation when importing theano.
             from theano.gof.cutils import run_cthunk  # noqa
-        self.cthunk = cthunk
+        assert cthunk is not None or instantiate is not None
+        self._cthunk = cthunk
+        self.instantiate = instantiate
         self.init_tasks = init_tasks
         self.tasks = tasks
         self.error_storage = error_storage
 
+    @property
+    def cthunk(self):
+        if self._cthunk is None:
+            self._cthunk = self.instantiate()
+            self.instantiate = None
+        return self._cthunk
+
     def find_task(self, failure_code):
         """
         Maps a failure code to the task that is associated to it.
@@ -1675,7 +1707,10 @@ class _CThunk(object):
             return self.tasks[failure_code - n]
 
     def __call__(self):
-        failure = run_cthunk(self.cthunk)
+        cthunk = self._cthunk
+        if cthunk is None:
+            cthunk = self.cthunk
+        failure = run_cthunk(cthunk)
         if failure:
             task, taskname, id = self.find_task(failure)
             try:
@@ -1698,6 +1733,62 @@ class _CThunk(object):
             reraise(exc_type, exc_value, exc_trace)
 
 
+def node_cmodule_keys(order, no_recycling, storage_map=None,
+                      compute_map=None):
+    """
+    Return the (key, CLinker) pairs of the C modules of the nodes in
+    `order`.
+
+    Only nodes whose op uses the default `Op.make_thunk` are considered, as
+    we must build the same CLinker as `Op.make_c_thunk` will. Nodes without
+    C code are skipped.
+
+    """
+    Op = theano.gof.op.Op
+    default_make_thunk = get_unbound_function(Op.make_thunk)
+    default_make_c_thunk = get_unbound_function(Op.make_c_thunk)
+    key_lnk_pairs = []
+    for node in order:
+        op = node.op
+        if (get_unbound_function(op.make_thunk) is not default_make_thunk or
+                get_unbound_function(op.make_c_thunk) is not
+                default_make_c_thunk):
+            continue
+        try:
+            op.prepare_node(node, storage_map, compute_map, 'c')
+            lnk = op.make_c_linker(node, no_recycling)
+            key = lnk.cmodule_key()
+        except Exception as e:
+            # No C code, or an error make_thunk will report with context.
+            _logger.debug('No C module key for %s: %s', node, e)
+            continue
+        if key is not None:
+            key_lnk_pairs.append((key, lnk))
+    return key_lnk_pairs
+
+
+def compile_nodes_parallel(order, no_recycling, storage_map=None,
+                           compute_map=None):
+    """
+    Compile concurrently the C modules of the nodes in `order` that are not
+    in the module cache yet.
+
+    This uses `config.cmodule.compile_jobs` threads and does nothing if it
+    is 1. The modules are those of `node_cmodule_keys`. The thunks still
+    have to be built afterwards; their modules will then be found in the
+    cache.
+
+    """
+    n_jobs = config.cmodule.compile_jobs
+    if n_jobs == 0:
+        n_jobs = multiprocessing.cpu_count()
+    if n_jobs <= 1 or not config.cxx:
+        return
+    key_lnk_pairs = node_cmodule_keys(order, no_recycling, storage_map,
+                                      compute_map)
+    get_module_cache().compile_parallel(key_lnk_pairs, n_jobs)
+
+
 class OpWiseCLinker(link.LocalLinker):
     """
     Uses CLinker on the individual Ops that comprise an fgraph and loops
@@ -1773,8 +1864,10 @@ class OpWiseCLinker(link.LocalLinker):
             input_storage, output_storage, storage_map = link.map_storage(
                 fgraph, order, input_storage, output_storage, storage_map)
             if self.allow_gc:
-                computed, last_user = link.gc_helper(order)
-                post_thunk_old_storage = []
+                compact = fgraph.compact(order)
+                post_thunk_old_storage = [
+                    [storage_map[compact.variables[v]] for v in last_uses]
+                    for last_uses in compact.last_uses()]
             else:
                 post_thunk_old_storage = None
 
@@ -1782,6 +1875,9 @@ class OpWiseCLinker(link.LocalLinker):
             for k in storage_map:
                 compute_map[k] = [k.owner is None]
 
+            compile_nodes_parallel(order, no_recycling, storage_map,
+                                   compute_map)
+
             thunks = []
             for node in order:
                 # make_thunk will try by default C code, otherwise
@@ -1793,14 +1889,6 @@ class OpWiseCLinker(link.LocalLinker):
                 thunks[-1].inputs = [storage_map[v] for v in node.inputs]
                 thunks[-1].outputs = [storage_map[v] for v in node.outputs]
 
-            for node in order:
-                if self.allow_gc:
-                    post_thunk_old_storage.append(
-                        [storage_map[input] for input in node.inputs
-                         if ((input in computed) and
-                             (input not in fgraph.outputs) and
-                             node == last_user[input])])
-
             if no_recycling is True:
                 no_recycling = list(storage_map.values())
                 no_recycling = utils.difference(no_recycling, input_storage)
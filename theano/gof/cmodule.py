@@ -14,17 +14,20 @@ import shutil
 import stat
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
 import time
 import platform
 import distutils.sysconfig
 import warnings
+from contextlib import contextmanager
 
 import numpy.distutils
 
 import theano
-from theano.compat import PY3, decode, decode_iter
-from six import b, BytesIO, StringIO, string_types, iteritems
+from theano.compat import PY3, OrderedDict, decode, decode_iter
+from six import b, BytesIO, StringIO, string_types, iteritems, itervalues
 from six.moves import xrange
 from theano.gof.utils import flatten
 from theano.configparser import config
@@ -34,7 +37,8 @@ from theano.misc.windows import (subprocess_Popen,
 
 # we will abuse the lockfile mechanism when reading and writing the registry
 from theano.gof import compilelock
-from theano.configdefaults import gcc_version_str, local_bitwidth
+from theano.configdefaults import (gcc_version_str, local_bitwidth,
+                                   compiledir_format_dict)
 
 importlib = None
 try:
@@ -48,6 +52,7 @@ METH_VARARGS = "METH_VARARGS"
 METH_NOARGS = "METH_NOARGS"
 # global variable that represent the total time spent in importing module.
 import_time = 0
+_dlimport_lock = threading.Lock()
 
 
 class MissingGXX(Exception):
@@ -289,8 +294,10 @@ def dlimport(fullpath, suffix=None):
     _logger.debug("WORKDIR %s", workdir)
     _logger.debug("module_name %s", module_name)
 
-    sys.path[0:0] = [workdir]  # insert workdir at beginning (temporarily)
     global import_time
+    # sys.path is shared by all threads.
+    _dlimport_lock.acquire()
+    sys.path[0:0] = [workdir]  # insert workdir at beginning (temporarily)
     try:
         if importlib is not None:
             if hasattr(importlib, "invalidate_caches"):
@@ -306,6 +313,7 @@ def dlimport(fullpath, suffix=None):
             raise Exception('__import__ failed', fullpath)
     finally:
         del sys.path[0]
+        _dlimport_lock.release()
 
     assert fullpath.startswith(rval.__file__)
     return rval
@@ -330,6 +338,51 @@ def last_access_time(path):
     return os.stat(path)[stat.ST_ATIME]
 
 
+def bundle_fingerprint():
+    """
+    Return what must be the same on two machines for the compiled modules
+    of one to be used on the other (see `ModuleCache.export_bundle`).
+
+    The compilation flags and the versions of the C code are part of the
+    keys, so they do not need to be checked here.
+
+    """
+    return dict((k, compiledir_format_dict[k])
+                for k in ('short_platform', 'processor', 'python_version',
+                          'python_bitwidth', 'gxx_version'))
+
+
+def dir_size(dirname):
+    """
+    Return the total size in bytes of the files directly in `dirname`.
+
+    """
+    return sum(os.path.getsize(os.path.join(dirname, f))
+               for f in os.listdir(dirname))
+
+
+def get_module_hits(dirname):
+    """
+    Return a dict mapping the sub-directories of the cache `dirname` to the
+    number of times their module was found in the cache (see
+    `ModuleCache.save_hits`).
+
+    """
+    hits = {}
+    try:
+        with open(os.path.join(dirname, 'module_hits'), 'r') as f:
+            for line in f:
+                try:
+                    subdir, n = line.split()
+                    hits[subdir] = hits.get(subdir, 0) + int(n)
+                except ValueError:
+                    # A line that is being written.
+                    pass
+    except IOError:
+        pass
+    return hits
+
+
 def module_name_from_dir(dirname, err=True, files=None):
     """
     Scan the contents of a cache directory and return full path of the
@@ -429,6 +482,25 @@ def get_module_hash(src_code, key):
     return hash_from_code('\n'.join(to_hash))
 
 
+def get_key_hash(key):
+    """
+    Return an MD5 hash of the pickle of `key`, or None if it can't be
+    pickled.
+
+    Unlike `hash(key)`, it is the same in every process, but two equal keys
+    may still get different hashes (e.g. if they contain sets). It is only
+    used to find a module in the index of the cache without the source
+    code of the module: the key itself is compared once the module's keys
+    are loaded.
+
+    """
+    try:
+        return hash_from_code(pickle.dumps(key,
+                                           protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+
 def get_safe_part(key):
     """
     Return a tuple containing a subset of `key`, to be used to find equal keys.
@@ -581,6 +653,22 @@ class ModuleCache(object):
     - possibly a delete.me file, meaning this directory has been marked
     for deletion.
 
+    The number of times each module is found in the cache is counted, and
+    added to the ``module_hits`` file of the cache at exit. When
+    ``config.cmodule.max_cache_size`` is set, ``clear_old`` also deletes
+    the least recently used modules until the cache fits in that size.
+
+    When ``use_index`` is True, the cache also keeps an index file
+    (``module_index``) listing the module hash, directory and key hashes
+    (see `get_key_hash`) of every versioned module. A new process reads
+    this file instead of walking the whole cache directory, and only
+    unpickles the key.pkl of a module the first time it looks up its key
+    hash or module hash. So a module in the cache is found without
+    generating its source code. The index is appended to as
+    modules are compiled, and rewritten from scratch by the full walk done
+    in ``refresh``, which ``clear_old`` still runs, at most once every
+    ``index_refresh_interval`` seconds at exit.
+
     Keys should be tuples of length 2: (version, rest). The
     ``rest`` can be anything hashable and picklable, that uniquely
     identifies the computation in the module. The key is returned by
@@ -618,7 +706,10 @@ class ModuleCache(object):
 
     do_refresh : bool
         If True, then the ``refresh`` method will be called
-        in the constructor.
+        in the constructor (or, if there is an index, it will be read).
+    use_index : bool
+        Whether to use the index file. Defaults to
+        ``config.cmodule.use_index``.
 
     """
 
@@ -629,7 +720,8 @@ class ModuleCache(object):
     """
     module_from_name = {}
     """
-    Maps a module filename to the loaded module object.
+    Maps a module filename to the loaded module object, from the least to
+    the most recently used.
 
     """
     entry_from_key = {}
@@ -658,10 +750,43 @@ class ModuleCache(object):
     Set of all key.pkl files that have been loaded.
 
     """
+    index = {}
+    """
+    Maps the hash of a module listed in the index file, but not loaded
+    yet, to its directory.
+
+    """
+    index_from_key_hash = {}
+    """
+    Maps the key hashes listed in the index file to the hash of their
+    module.
 
-    def __init__(self, dirname, check_for_broken_eq=True, do_refresh=True):
+    """
+    hits = {}
+    """
+    Maps a module filename to the number of times it was found in the
+    cache since the last `save_hits`.
+
+    """
+    index_refresh_interval = 60 * 60 * 24
+    """
+    When using the index, the minimum time (in seconds) between two full
+    walks of the cache directory done at exit to clean it.
+
+    """
+    empty_dir_min_age = 60 * 60
+    """
+    Minimum age (in seconds) of an empty directory before `refresh` removes
+    it. Modules are compiled without the lock on the cache directory, so a
+    recent empty directory may be one another process just created to
+    compile a module in.
+
+    """
+
+    def __init__(self, dirname, check_for_broken_eq=True, do_refresh=True,
+                 use_index=None):
         self.dirname = dirname
-        self.module_from_name = dict(self.module_from_name)
+        self.module_from_name = OrderedDict(self.module_from_name)
         self.entry_from_key = dict(self.entry_from_key)
         self.module_hash_to_key_data = dict(self.module_hash_to_key_data)
         self.similar_keys = dict(self.similar_keys)
@@ -669,9 +794,28 @@ class ModuleCache(object):
         self.check_for_broken_eq = check_for_broken_eq
         self.loaded_key_pkl = set()
         self.time_spent_in_check_key = 0
+        # The compilation lock does not exclude the threads of this
+        # process from each other, this does.
+        self._index_mutex = threading.RLock()
+        if use_index is None:
+            use_index = config.cmodule.use_index
+        self.use_index = use_index
+        self.index = dict(self.index)
+        self.index_from_key_hash = dict(self.index_from_key_hash)
+        # Key hashes of the modules of `index`, to write them back.
+        self._index_key_hashes = {}
+        self.hits = dict(self.hits)
+        # Position in the index file up to which it was read, identity of
+        # that file and time of the last full walk recorded in it.
+        self._index_offset = 0
+        self._index_id = None
+        self._index_time = 0
 
         if do_refresh:
-            self.refresh()
+            if self.use_index and os.path.exists(self._index_path()):
+                self.read_index()
+            else:
+                self.refresh()
 
     age_thresh_use = config.cmodule.age_thresh_use  # default 24 days
     """
@@ -681,19 +825,47 @@ class ModuleCache(object):
 
     """
 
-    def _get_module(self, name):
+    def _get_module(self, name, lazy=False):
         """
         Fetch a compiled module from the loaded cache or the disk.
 
+        If `lazy` is True and the module is not loaded yet, a `_LazyModule`
+        that will load it when it is used is returned instead.
+
         """
-        if name not in self.module_from_name:
-            _logger.debug('loading name %s', name)
-            self.module_from_name[name] = dlimport(name)
-            self.stats[1] += 1
-        else:
-            _logger.debug('returning compiled module from cache %s', name)
-            self.stats[0] += 1
-        return self.module_from_name[name]
+        with self._index_mutex:
+            if name not in self.module_from_name:
+                if lazy:
+                    return _LazyModule(self, name)
+                _logger.debug('loading name %s', name)
+                self._add_module(name, dlimport(name))
+                self.stats[1] += 1
+            else:
+                _logger.debug('returning compiled module from cache %s', name)
+                self.stats[0] += 1
+                # Mark it as the most recently used.
+                self.module_from_name[name] = self.module_from_name.pop(name)
+            return self.module_from_name[name]
+
+    def _add_module(self, name, module):
+        """
+        Remember the loaded `module`, forgetting the least recently used
+        ones above `config.cmodule.max_loaded_modules`.
+
+        Python never unloads the shared library of an extension module, so
+        this only drops our references to the module objects (and those of
+        `sys.modules`). Thunks that were already built keep working, and a
+        module that is needed again is imported again.
+
+        """
+        with self._index_mutex:
+            self.module_from_name[name] = module
+            max_loaded = config.cmodule.max_loaded_modules
+            while max_loaded and len(self.module_from_name) > max_loaded:
+                old_name, old_module = self.module_from_name.popitem(
+                    last=False)
+                _logger.debug('unloading module %s', old_name)
+                sys.modules.pop(old_module.__name__, None)
 
     def refresh(self, age_thresh_use=None, delete_if_problem=False,
                 cleanup=True):
@@ -746,8 +918,8 @@ class ModuleCache(object):
         subdirs = sorted(os.listdir(self.dirname))
         files, root = None, None  # To make sure the "del" below works
         for subdirs_elem in subdirs:
-            # Never clean/remove lock_dir
-            if subdirs_elem == 'lock_dir':
+            # Never clean/remove lock_dir and the optimization cache
+            if subdirs_elem in ('lock_dir', 'key_locks', 'optimized_graphs'):
                 continue
             root = os.path.join(self.dirname, subdirs_elem)
             key_pkl = os.path.join(root, 'key.pkl')
@@ -757,8 +929,10 @@ class ModuleCache(object):
                 continue
             files = os.listdir(root)
             if not files:
-                rmtree_empty(root, ignore_nocleanup=True,
-                             msg="empty dir")
+                if (time_now - os.path.getmtime(root) >
+                        self.empty_dir_min_age):
+                    rmtree_empty(root, ignore_nocleanup=True,
+                                 msg="empty dir")
                 continue
             if 'delete.me' in files:
                 rmtree(root, ignore_nocleanup=True,
@@ -898,6 +1072,8 @@ class ModuleCache(object):
                     # Remember the map from a module's hash to the KeyData
                     # object associated with it.
                     self.module_hash_to_key_data[mod_hash] = key_data
+                    self.index.pop(mod_hash, None)
+                    self._index_key_hashes.pop(mod_hash, None)
 
                     for key in key_data.keys:
                         if key not in self.entry_from_key:
@@ -986,12 +1162,177 @@ class ModuleCache(object):
                     if not files:
                         _rmtree(*a, **kw)
 
+        if self.use_index:
+            self._write_index()
+
         _logger.debug('Time needed to refresh cache: %s',
                       (time.time() - start_time))
 
         return too_old_to_use
 
-    def _get_from_key(self, key, key_data=None):
+    def _index_path(self):
+        return os.path.join(self.dirname, 'module_index')
+
+    def read_index(self):
+        """
+        Read the part of the index file that was not read yet.
+
+        This only records the directory and key hashes of each module
+        hash. The key.pkl of a module is loaded the first time its hash is
+        looked up (see ``_load_from_index``).
+
+        """
+        try:
+            with open(self._index_path(), 'r') as f:
+                st = os.fstat(f.fileno())
+                if (st.st_dev, st.st_ino) != self._index_id:
+                    # The index was rewritten since the last read.
+                    self._index_id = (st.st_dev, st.st_ino)
+                    self._index_offset = 0
+                f.seek(self._index_offset)
+                content = f.read()
+        except IOError:
+            return
+        # Ignore a line that is still being written.
+        content = content[:content.rfind('\n') + 1]
+        self._index_offset += len(content)
+        for line in content.splitlines():
+            if line.startswith('#'):
+                try:
+                    self._index_time = float(line.split()[-1])
+                except ValueError:
+                    pass
+                continue
+            fields = line.split()
+            try:
+                module_hash, subdir = fields[:2]
+            except ValueError:
+                _logger.warning('Ignoring malformed line in the index of '
+                                'the cache: %s', line)
+                continue
+            key_hashes = fields[2:]
+            for key_hash in key_hashes:
+                self.index_from_key_hash[key_hash] = module_hash
+            if module_hash not in self.module_hash_to_key_data:
+                self.index[module_hash] = os.path.join(self.dirname, subdir)
+                self._index_key_hashes.setdefault(
+                    module_hash, set()).update(key_hashes)
+
+    def _write_index(self):
+        """
+        Rewrite the index file with the modules known after a full walk of
+        the cache directory.
+
+        """
+        with self._index_lock():
+            # Keep the modules that could not be unpickled by this process
+            # (e.g. their Ops are not imported) as long as they exist.
+            self.read_index()
+            lines = ['# theano module index %s\n' % time.time()]
+            for module_hash, root in sorted(self.index.items()):
+                if os.path.exists(os.path.join(root, 'key.pkl')):
+                    lines.append(self._index_line(
+                        module_hash, root,
+                        self._index_key_hashes.get(module_hash, ())))
+            for module_hash, key_data in sorted(
+                    self.module_hash_to_key_data.items()):
+                if any(key[0] for key in key_data.keys):
+                    lines.append(self._index_line(
+                        module_hash, os.path.dirname(key_data.key_pkl),
+                        [get_key_hash(key) for key in key_data.keys
+                         if key[0]]))
+            fd, tmp_path = tempfile.mkstemp(dir=self.dirname,
+                                            prefix='module_index.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.writelines(lines)
+                os.rename(tmp_path, self._index_path())
+            except OSError as e:
+                _logger.warning('Could not write the index of the cache: %s',
+                                e)
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return
+            self.read_index()
+
+    @staticmethod
+    def _index_line(module_hash, root, key_hashes):
+        return ' '.join([module_hash, os.path.basename(root)] +
+                        sorted(h for h in key_hashes if h)) + '\n'
+
+    def _append_to_index(self, key_data, keys=None):
+        """
+        Add the module of `key_data` to the index file, with the hashes of
+        `keys` (by default, all its keys).
+
+        This function expects the compile lock to be held.
+
+        """
+        if keys is None:
+            keys = key_data.keys
+        line = self._index_line(key_data.module_hash,
+                                os.path.dirname(key_data.key_pkl),
+                                [get_key_hash(key) for key in keys])
+        try:
+            with open(self._index_path(), 'a') as f:
+                f.write(line)
+        except IOError as e:
+            _logger.warning('Could not update the index of the cache: %s', e)
+
+    def _load_from_index(self, module_hash):
+        """
+        Load the KeyData of a module listed in the index.
+
+        Returns True if it was loaded. Modules whose key.pkl is missing,
+        can't be unpickled, or that are too old to be used are skipped
+        (``refresh`` deals with them).
+
+        """
+        with self._index_mutex:
+            # Another thread may have loaded it in the meantime.
+            root = self.index.pop(module_hash, None)
+            key_hashes = self._index_key_hashes.pop(module_hash, set())
+            if root is None:
+                return module_hash in self.module_hash_to_key_data
+            key_pkl = os.path.join(root, 'key.pkl')
+            try:
+                entry = module_name_from_dir(root)
+                age = time.time() - last_access_time(entry)
+            except Exception:
+                # The module was deleted.
+                return False
+            if age >= self.age_thresh_use:
+                return False
+            try:
+                with open(key_pkl, 'rb') as f:
+                    key_data = pickle.load(f)
+            except Exception as e:
+                # As in `refresh`, this may be due to Ops that are not
+                # imported yet: try again next time.
+                _logger.info("ModuleCache could not load %s from the "
+                             "index: %s", key_pkl, e)
+                self.index[module_hash] = root
+                self._index_key_hashes[module_hash] = key_hashes
+                return False
+            if (not isinstance(key_data, KeyData) or
+                    key_data.module_hash != module_hash or
+                    not all(key[0] for key in key_data.keys)):
+                return False
+            # The cache directory may have been moved.
+            key_data.entry = entry
+            key_data.key_pkl = key_pkl
+            self.module_hash_to_key_data[module_hash] = key_data
+            for key in key_data.keys:
+                if key not in self.entry_from_key:
+                    self.entry_from_key[key] = entry
+                    self.similar_keys.setdefault(get_safe_part(key),
+                                                 []).append(key)
+            self.loaded_key_pkl.add(key_pkl)
+            return True
+
+    def _get_from_key(self, key, key_data=None, lazy=False):
         """
         Returns a module if the passed-in key is found in the cache
         and None otherwise.
@@ -1014,13 +1355,33 @@ class ModuleCache(object):
             name = key_data.get_entry()
         if name is None:
             return None
-        return self._get_module(name)
+        self.hits[name] = self.hits.get(name, 0) + 1
+        return self._get_module(name, lazy=lazy)
+
+    @contextmanager
+    def _index_lock(self, keep_lock=False):
+        """
+        Hold the lock needed to read or update the index of the cache.
+
+        This takes the compilation lock, so it must be kept short: in
+        particular, no compilation is done while holding it.
 
-    def _get_from_hash(self, module_hash, key, keep_lock=False):
+        """
+        with self._index_mutex:
+            with compilelock.lock_ctx(keep_lock=keep_lock):
+                yield
+
+    def _get_from_hash(self, module_hash, key, keep_lock=False, lazy=False):
+        if module_hash in self.index:
+            self._load_from_index(module_hash)
+        if key in self.entry_from_key:
+            # The key was added by another process to the module we just
+            # loaded.
+            return self._get_from_key(key, lazy=lazy)
         if module_hash in self.module_hash_to_key_data:
             key_data = self.module_hash_to_key_data[module_hash]
-            module = self._get_from_key(None, key_data)
-            with compilelock.lock_ctx(keep_lock=keep_lock):
+            module = self._get_from_key(None, key_data, lazy=lazy)
+            with self._index_lock(keep_lock=keep_lock):
                 try:
                     key_data.add_key(key, save_pkl=bool(key[0]))
                     key_broken = False
@@ -1033,6 +1394,8 @@ class ModuleCache(object):
                 if (key[0] and not key_broken and
                         self.check_for_broken_eq):
                     self.check_key(key, key_data.key_pkl)
+                if self.use_index and key[0] and not key_broken:
+                    self._append_to_index(key_data, [key])
             self._update_mappings(key, key_data, module.__file__, check_in_keys=not key_broken)
             return module
         else:
@@ -1086,6 +1449,8 @@ class ModuleCache(object):
             if not key_broken and self.check_for_broken_eq:
                 self.check_key(key, key_pkl)
             self.loaded_key_pkl.add(key_pkl)
+            if self.use_index and not key_broken:
+                self._append_to_index(key_data)
         elif config.cmodule.warn_no_version:
             key_flat = flatten(key)
             ops = [k for k in key_flat if isinstance(k, theano.Op)]
@@ -1096,7 +1461,7 @@ class ModuleCache(object):
         self._update_mappings(key, key_data, module.__file__, not key_broken)
         return key_data
 
-    def module_from_key(self, key, lnk=None, keep_lock=False):
+    def module_from_key(self, key, lnk=None, keep_lock=False, lazy=False):
         """
         Return a module from the cache, compiling it if necessary.
 
@@ -1112,44 +1477,71 @@ class ModuleCache(object):
             the second performs the actual compilation.
         keep_lock : bool
             If True, the compilation lock will not be released if taken.
+        lazy : bool
+            If True and the module is already in the cache, it is only
+            imported when one of its attributes is used (see
+            `_LazyModule`). A module that had to be compiled is always
+            imported.
 
         """
         # Is the module in the cache?
-        module = self._get_from_key(key)
+        module = self._get_from_key(key, lazy=lazy)
         if module is not None:
             return module
 
+        # Is the key in the index? Generating the source code of a module
+        # costs more than hashing its key.
+        if self.use_index and key[0] and self.index_from_key_hash:
+            module_hash = self.index_from_key_hash.get(get_key_hash(key))
+            if (module_hash in self.index and
+                    self._load_from_index(module_hash)):
+                module = self._get_from_key(key, lazy=lazy)
+                if module is not None:
+                    return module
+
         src_code = lnk.get_src_code()
         # Is the source code already in the cache?
         module_hash = get_module_hash(src_code, key)
-        module = self._get_from_hash(module_hash, key, keep_lock=keep_lock)
+        module = self._get_from_hash(module_hash, key, keep_lock=keep_lock,
+                                     lazy=lazy)
         if module is not None:
             return module
 
-        with compilelock.lock_ctx(keep_lock=keep_lock):
-            # 1) Maybe somebody else compiled it for us while we
-            #    where waiting for the lock. Try to load it again.
-            # 2) If other repo that import Theano have Theano ops defined,
-            #    we need to refresh the cache here. Otherwise, there are import
-            #    order problems.
-            #    When device=gpu, we compile during Theano
-            #    import. This triggers the loading of the cache. But
-            #    unpickling the cache asks that the external Ops are
-            #    completly loaded, which isn't always the case!
-            #    If a module isn't completly loaded and its unpickling
-            #    fails, it means it is safe for this function
-            #    compilation to skip them, but not for future
-            #    compilations. So reloading the cache here
-            #    compilation fixes this problem. (we could do that only once)
-            self.refresh(cleanup=False)
-
-            module = self._get_from_key(key)
-            if module is not None:
-                return module
-
-            module = self._get_from_hash(module_hash, key)
-            if module is not None:
-                return module
+        # Only one process compiles a given module, but different modules
+        # are compiled concurrently: the compilation lock is only taken
+        # to update the index.
+        with compilelock.lock_key_ctx(module_hash):
+            with self._index_lock(keep_lock=keep_lock):
+                # 1) Maybe somebody else compiled it for us while we
+                #    where waiting for the lock. Try to load it again.
+                # 2) If other repo that import Theano have Theano ops
+                #    defined, we need to refresh the cache here. Otherwise,
+                #    there are import order problems.
+                #    When device=gpu, we compile during Theano
+                #    import. This triggers the loading of the cache. But
+                #    unpickling the cache asks that the external Ops are
+                #    completly loaded, which isn't always the case!
+                #    If a module isn't completly loaded and its unpickling
+                #    fails, it means it is safe for this function
+                #    compilation to skip them, but not for future
+                #    compilations. So reloading the cache here
+                #    compilation fixes this problem. (we could do that
+                #    only once)
+                # With the index, modules are only loaded when needed, so
+                # reading what was added to it since the last time is
+                # enough.
+                if self.use_index:
+                    self.read_index()
+                else:
+                    self.refresh(cleanup=False)
+
+                module = self._get_from_key(key, lazy=lazy)
+                if module is not None:
+                    return module
+
+                module = self._get_from_hash(module_hash, key, lazy=lazy)
+                if module is not None:
+                    return module
 
             hash_key = hash(key)
 
@@ -1160,7 +1552,7 @@ class ModuleCache(object):
                 name = module.__file__
                 assert name.startswith(location)
                 assert name not in self.module_from_name
-                self.module_from_name[name] = module
+                self._add_module(name, module)
                 nocleanup = True
             except OSError as e:
                 _logger.error(e)
@@ -1178,12 +1570,60 @@ class ModuleCache(object):
             # compilation.
             assert hash(key) == hash_key
 
-            key_data = self._add_to_cache(module, key, module_hash)
-            self.module_hash_to_key_data[module_hash] = key_data
-
-        self.stats[2] += 1
+            with self._index_lock(keep_lock=keep_lock):
+                key_data = self._add_to_cache(module, key, module_hash)
+                self.module_hash_to_key_data[module_hash] = key_data
+                self.stats[2] += 1
         return module
 
+    def compile_parallel(self, key_lnk_pairs, n_jobs):
+        """
+        Compile the modules of many keys concurrently.
+
+        Keys already in the cache are skipped. The others are passed to
+        `module_from_key` by `n_jobs` threads (the compiler runs in a
+        subprocess, so the GIL is not an issue). Modules that share the
+        same hash are compiled only once thanks to the per-key locks. A
+        later `module_from_key` on those keys will find them without
+        compiling.
+
+        A module that fails to compile is only logged: the error will be
+        raised again, with the context of the node, by `module_from_key`.
+
+        Parameters
+        ----------
+        key_lnk_pairs
+            List of (key, lnk) pairs, as they would be passed to
+            `module_from_key`. Keys must not be None.
+        n_jobs : int
+            The number of threads to use.
+
+        """
+        todo = []
+        seen = set()
+        for key, lnk in key_lnk_pairs:
+            if key in self.entry_from_key or key in seen:
+                continue
+            seen.add(key)
+            todo.append((key, lnk))
+        if len(todo) < 2:
+            # Nothing to win, let module_from_key do it.
+            return
+
+        def compile_one(key_lnk):
+            try:
+                self.module_from_key(*key_lnk)
+            except Exception as e:
+                _logger.debug('Parallel compilation failed: %s', e)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(n_jobs, len(todo)))
+        try:
+            pool.map(compile_one, todo)
+        finally:
+            pool.close()
+            pool.join()
+
     def check_key(self, key, key_pkl):
         """
         Perform checks to detect broken __eq__ / __hash__ implementations.
@@ -1293,23 +1733,250 @@ class ModuleCache(object):
             delete_if_problem=delete_if_problem,
             # The clean up is done at init, no need to trigger it again
             cleanup=False)
-        if not too_old_to_use:
+        if too_old_to_use:
+            with compilelock.lock_ctx():
+                # Update the age of modules that have been accessed by
+                # other processes and get all module that are too old to
+                # use (not loaded in self.entry_from_key).
+
+                for entry in too_old_to_use:
+                    # TODO: we are assuming that modules that haven't been
+                    # accessed in over age_thresh_del are not currently in
+                    # use by other processes, but that could be false for
+                    # long-running jobs, or if age_thresh_del < 0.
+                    assert entry not in self.module_from_name
+                    parent = os.path.dirname(entry)
+                    assert parent.startswith(os.path.join(self.dirname,
+                                                          'tmp'))
+                    _rmtree(parent, msg='old cache directory',
+                            level=logging.INFO, ignore_nocleanup=True)
+
+        if config.cmodule.max_cache_size:
+            self.clear_to_size(config.cmodule.max_cache_size * 2 ** 20)
+        self._compact_hits()
+        compilelock.clear_key_locks(
+            os.path.join(self.dirname, 'key_locks'),
+            min_age=max(age_thresh_del, 0))
+
+    def clear_to_size(self, max_size):
+        """
+        Delete the least recently used modules until the versioned modules
+        of the cache use at most `max_size` bytes on disk.
+
+        The modules loaded by this process are never deleted. This only
+        considers the modules known by this ModuleCache, so it should be
+        called after a full `refresh` (as `clear_old` does).
+
+        Parameters
+        ----------
+        max_size : int
+            Size budget, in bytes.
+
+        """
+        total = 0
+        candidates = []
+        for key_data in list(self.module_hash_to_key_data.values()):
+            if not any(key[0] for key in key_data.keys):
+                continue
+            entry = key_data.get_entry()
+            try:
+                size = dir_size(os.path.dirname(entry))
+                atime = last_access_time(entry)
+            except OSError:
+                # Deleted by another process.
+                continue
+            total += size
+            if entry not in self.module_from_name:
+                candidates.append((atime, entry, size, key_data))
+        if total <= max_size:
             return
-        with compilelock.lock_ctx():
-            # Update the age of modules that have been accessed by other
-            # processes and get all module that are too old to use
-            # (not loaded in self.entry_from_key).
-
-            for entry in too_old_to_use:
-                # TODO: we are assuming that modules that haven't been
-                # accessed in over age_thresh_del are not currently in
-                # use by other processes, but that could be false for
-                # long-running jobs, or if age_thresh_del < 0.
-                assert entry not in self.module_from_name
-                parent = os.path.dirname(entry)
-                assert parent.startswith(os.path.join(self.dirname, 'tmp'))
-                _rmtree(parent, msg='old cache directory', level=logging.INFO,
-                        ignore_nocleanup=True)
+        candidates.sort(key=lambda c: c[:2])
+        deleted = set()
+        with self._index_lock():
+            for atime, entry, size, key_data in candidates:
+                if total <= max_size:
+                    break
+                del self.module_hash_to_key_data[key_data.module_hash]
+                self.loaded_key_pkl.discard(key_data.key_pkl)
+                deleted.add(entry)
+                _rmtree(os.path.dirname(entry), msg='cache size limit',
+                        level=logging.INFO, ignore_nocleanup=True)
+                total -= size
+            # Broken keys are not in key_data.keys, so look for all the keys
+            # of the deleted entries at once.
+            for key in [key for key, entry in iteritems(self.entry_from_key)
+                        if entry in deleted]:
+                del self.entry_from_key[key]
+            if self.use_index:
+                self._write_index()
+        _logger.info('Deleted %d modules to fit the cache in %d bytes',
+                     len(deleted), max_size)
+
+    def export_bundle(self, keys, path):
+        """
+        Write the modules of `keys` in the archive `path`.
+
+        The archive can be imported with `import_bundle` in the cache of
+        another machine with the same `bundle_fingerprint`, so that
+        functions compiled there find their modules in the cache.
+
+        Parameters
+        ----------
+        keys
+            Keys of the modules to export. Unversioned keys and keys that
+            are not in the cache are ignored.
+        path : str
+            The archive to write (a gzipped tar file).
+
+        Returns
+        -------
+        int
+            The number of exported modules.
+
+        """
+        key_data_from_entry = dict(
+            (key_data.get_entry(), key_data)
+            for key_data in itervalues(self.module_hash_to_key_data))
+        roots = set()
+        for key in keys:
+            if not key[0] or key not in self.entry_from_key:
+                continue
+            entry = self.entry_from_key[key]
+            if entry in key_data_from_entry:
+                roots.add(os.path.dirname(entry))
+        roots = sorted(roots)
+        info = {'fingerprint': bundle_fingerprint(),
+                'modules': [os.path.basename(root) for root in roots]}
+        info_data = pickle.dumps(info, protocol=2)
+        with tarfile.open(path, 'w:gz') as tar:
+            tarinfo = tarfile.TarInfo('bundle_info.pkl')
+            tarinfo.size = len(info_data)
+            tarinfo.mtime = time.time()
+            tar.addfile(tarinfo, BytesIO(info_data))
+            for root in roots:
+                for filename in sorted(os.listdir(root)):
+                    tar.add(os.path.join(root, filename),
+                            arcname='%s/%s' % (os.path.basename(root),
+                                               filename))
+        return len(roots)
+
+    def import_bundle(self, path):
+        """
+        Add to the cache the modules of an archive written by
+        `export_bundle`.
+
+        Modules whose hash is already in the cache are skipped.
+
+        Parameters
+        ----------
+        path : str
+            The archive to read.
+
+        Returns
+        -------
+        int
+            The number of imported modules.
+
+        Raises
+        ------
+        ValueError
+            If the archive was made on an incompatible machine.
+
+        """
+        n_imported = 0
+        with tarfile.open(path, 'r:*') as tar:
+            info = pickle.load(tar.extractfile('bundle_info.pkl'))
+            fingerprint = bundle_fingerprint()
+            if info['fingerprint'] != fingerprint:
+                raise ValueError(
+                    "The compiled modules of %s can't be used here: they "
+                    "were compiled for %s, not %s." % (
+                        path, info['fingerprint'], fingerprint))
+            members = {}
+            for member in tar.getmembers():
+                if member.isfile() and '/' in member.name:
+                    subdir, filename = member.name.split('/', 1)
+                    members.setdefault(subdir, []).append(
+                        (os.path.basename(filename), member))
+
+            with self._index_lock():
+                if self.use_index:
+                    self.read_index()
+                else:
+                    self.refresh(cleanup=False)
+                for subdir in info['modules']:
+                    files = dict(members.get(subdir, []))
+                    try:
+                        key_data = pickle.load(
+                            tar.extractfile(files.pop('key.pkl')))
+                    except Exception as e:
+                        _logger.warning('Skipping module %s of %s: %s',
+                                        subdir, path, e)
+                        continue
+                    if (key_data.module_hash in self.module_hash_to_key_data or
+                            key_data.module_hash in self.index):
+                        continue
+                    location = dlimport_workdir(self.dirname)
+                    for filename, member in files.items():
+                        with open(os.path.join(location, filename),
+                                  'wb') as f:
+                            shutil.copyfileobj(tar.extractfile(member), f)
+                    # The key.pkl is written last, as a directory without
+                    # it is ignored by other processes.
+                    key_data.entry = os.path.join(
+                        location, os.path.basename(key_data.get_entry()))
+                    key_data.key_pkl = os.path.join(location, 'key.pkl')
+                    key_data.save_pkl()
+                    if self.use_index:
+                        self._append_to_index(key_data)
+                        self.index[key_data.module_hash] = location
+                    n_imported += 1
+                if not self.use_index:
+                    self.refresh(cleanup=False)
+        return n_imported
+
+    def save_hits(self):
+        """
+        Add the hits counted since the last call to the ``module_hits``
+        file of the cache.
+
+        """
+        if not self.hits:
+            return
+        lines = ['%s %d\n' % (os.path.basename(os.path.dirname(name)), n)
+                 for name, n in sorted(self.hits.items())]
+        with self._index_lock():
+            try:
+                with open(os.path.join(self.dirname, 'module_hits'),
+                          'a') as f:
+                    f.writelines(lines)
+            except IOError as e:
+                _logger.warning('Could not save the cache hits: %s', e)
+                return
+        self.hits = {}
+
+    def _compact_hits(self):
+        # Sum the hits of each module and forget the deleted ones.
+        path = os.path.join(self.dirname, 'module_hits')
+        if not os.path.exists(path):
+            return
+        with self._index_lock():
+            hits = get_module_hits(self.dirname)
+            lines = ['%s %d\n' % (subdir, n)
+                     for subdir, n in sorted(hits.items())
+                     if os.path.isdir(os.path.join(self.dirname, subdir))]
+            fd, tmp_path = tempfile.mkstemp(dir=self.dirname,
+                                            prefix='module_hits.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.writelines(lines)
+                os.rename(tmp_path, path)
+            except OSError as e:
+                _logger.warning('Could not write the cache hits: %s', e)
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
 
     def clear(self, unversioned_min_age=None, clear_base_files=False,
               delete_if_problem=False):
@@ -1411,12 +2078,10 @@ class ModuleCache(object):
                 key_data.delete_keys_from(self.entry_from_key,
                                           do_manual_check=False)
                 entry = key_data.get_entry()
-                # Entry is guaranteed to be in this dictionary, because
-                # an unversioned entry should never have been loaded via
-                # refresh.
-                assert entry in self.module_from_name
-
-                del self.module_from_name[entry]
+                # An unversioned entry should never have been loaded via
+                # refresh, but it may have been unloaded since it was
+                # compiled (see `_add_module`).
+                self.module_from_name.pop(entry, None)
                 del self.module_hash_to_key_data[key_data.module_hash]
 
                 parent = os.path.dirname(entry)
@@ -1489,12 +2154,34 @@ class ModuleCache(object):
 
         # Note: for clear_old(), as this happen unfrequently, we only
         # take the lock when it happen.
-        self.clear_old()
+        # With the index, the walk of the whole cache directory done by
+        # clear_old() is what we want to avoid in each process.
+        self.save_hits()
+        if (not self.use_index or
+                time.time() - self._index_time > self.index_refresh_interval):
+            self.clear_old()
         self.clear_unversioned()
         _logger.debug('Time spent checking keys: %s',
                       self.time_spent_in_check_key)
 
 
+class _LazyModule(object):
+    """
+    Stand-in for a module of the cache that is not imported yet.
+
+    The module is imported by its `ModuleCache` the first time one of its
+    attributes (e.g. ``instantiate``) is used.
+
+    """
+
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.__file__ = name
+
+    def __getattr__(self, attr):
+        return getattr(self.cache._get_module(self.__file__), attr)
+
+
 def _rmtree(parent, ignore_nocleanup=False, msg='', level=logging.DEBUG,
             ignore_if_missing=False):
     """
@@ -185,6 +185,48 @@ def print_compiledir_content():
            "(are they always theano.scalar ops?)" % zeros_op))
 
 
+def print_compiledir_usage():
+    """
+    Print, for each Op class, the number of modules of the cache that use it,
+    their size on disk and the number of times they were found in the cache.
+
+    """
+    compiledir = theano.config.compiledir
+    hits = theano.gof.cmodule.get_module_hits(compiledir)
+    usage = {}
+    total_size = 0
+    n_modules = 0
+    for dir in os.listdir(compiledir):
+        filename = os.path.join(compiledir, dir, "key.pkl")
+        if not os.path.exists(filename):
+            continue
+        try:
+            with open(filename, 'rb') as file:
+                keydata = pickle.load(file)
+            op_classes = set(type(x).__name__ for x in flatten(keydata.keys)
+                             if isinstance(x, theano.gof.Op))
+        except Exception:
+            # Ops of other projects that are not imported.
+            op_classes = set(['<unknown>'])
+        size = theano.gof.cmodule.dir_size(os.path.join(compiledir, dir))
+        total_size += size
+        n_modules += 1
+        for op_class in op_classes or ['<no op>']:
+            u = usage.setdefault(op_class, [0, 0, 0])
+            u[0] += 1
+            u[1] += size
+            u[2] += hits.get(dir, 0)
+
+    print("Disk usage of the %d modules in this theano cache %s: %.1f MB" % (
+        n_modules, compiledir, total_size / 2. ** 20))
+    print("Op class/number of modules/size (MB)/number of cache hits")
+    for op_class, (n, size, n_hits) in sorted(
+            iteritems(usage), key=lambda t: t[1][1], reverse=True):
+        print(op_class, n, '%.1f' % (size / 2. ** 20), n_hits)
+    print("A module that contains several Op classes is counted for each "
+          "of them.")
+
+
 def compiledir_purge():
     shutil.rmtree(config.compiledir)
 
@@ -1,17 +1,25 @@
-# Locking mechanism to ensure no two compilations occur simultaneously
-# in the same compilation directory (which can cause crashes).
+# Locking mechanism to ensure no two processes update the same compilation
+# directory simultaneously (which can cause crashes), and no two processes
+# compile the same module at the same time.
 from __future__ import absolute_import, print_function, division
 
 import atexit
 import os
 import socket  # only used for gethostname()
 import time
+import threading
 import logging
 
 from contextlib import contextmanager
 
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:
+    # Windows: per-key locks fall back to the compilation directory lock.
+    fcntl = None
+
 from theano import config
 
 random = np.random.RandomState([2015, 8, 2])
@@ -24,6 +32,25 @@ if _logger.level == logging.NOTSET:
 
 hostname = socket.gethostname()
 
+# Protects the lock counter when several threads of this process compile
+# at the same time (see `ModuleCache.compile_parallel`).
+_thread_lock = threading.RLock()
+
+# Per-key locks of this process, see `lock_key_ctx`. Maps the path of a
+# lock file to a lock and the number of threads using it, and only holds the
+# paths in use.
+_key_thread_locks = {}
+
+
+def _release_key_thread_lock(path, entry):
+    # Release the entry of `path` in _key_thread_locks, and remove it if no
+    # other thread uses it.
+    entry[0].release()
+    with _thread_lock:
+        entry[1] -= 1
+        if not entry[1]:
+            del _key_thread_locks[path]
+
 
 def force_unlock():
     """
@@ -42,6 +69,132 @@ def lock_ctx(lock_dir=None, keep_lock=False, **kw):
         release_lock()
 
 
+@contextmanager
+def lock_key_ctx(key, lock_dir=None):
+    """
+    Hold a lock specific to `key` (usually a module hash).
+
+    Unlike the lock on the whole compilation directory, processes (and
+    threads) holding the locks of different keys do not wait for each
+    other, so independent modules can be compiled at the same time.
+
+    The lock is an `fcntl.lockf` lock on the file `<lock_dir>/<key>`, so it
+    also works on NFS and is released by the system if the process dies:
+    there is no stale lock to override. When fcntl is not available, the
+    lock on the whole compilation directory is used instead.
+
+    Parameters
+    ----------
+    key : str
+        Name of the lock. Must be a valid file name.
+    lock_dir : str
+        Directory holding the lock files (default
+        `<compiledir>/key_locks`).
+
+    """
+    if not getattr(get_lock, 'lock_is_enabled', True):
+        yield
+        return
+    if fcntl is None:
+        with lock_ctx():
+            yield
+        return
+    if lock_dir is None:
+        lock_dir = os.path.join(config.compiledir, 'key_locks')
+    if not os.path.isdir(lock_dir):
+        try:
+            os.makedirs(lock_dir)
+        except OSError:
+            # Someone else was probably trying to create it at the same time.
+            time.sleep(2)
+            assert os.path.isdir(lock_dir)
+    path = os.path.join(lock_dir, key)
+    # fcntl locks are owned by the process, so threads of this process
+    # must also exclude each other.
+    with _thread_lock:
+        entry = _key_thread_locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    entry[0].acquire()
+    try:
+        while True:
+            locked = False
+            f = open(path, 'a')
+            try:
+                fcntl.lockf(f, fcntl.LOCK_EX)
+                # clear_key_locks may have removed the file while we were
+                # waiting, in which case another process could lock a new
+                # one.
+                try:
+                    locked = os.path.samestat(os.fstat(f.fileno()),
+                                              os.stat(path))
+                except OSError:
+                    pass
+            finally:
+                if not locked:
+                    f.close()
+            if locked:
+                break
+        try:
+            # Mark the lock as recently used for clear_key_locks.
+            os.utime(path, None)
+            yield
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+            f.close()
+    finally:
+        _release_key_thread_lock(path, entry)
+
+
+def clear_key_locks(lock_dir=None, min_age=0):
+    """
+    Remove the files of the locks of `lock_key_ctx` that are not held and
+    were not used in the last `min_age` seconds.
+
+    Parameters
+    ----------
+    lock_dir : str
+        Directory holding the lock files (default
+        `<compiledir>/key_locks`).
+    min_age : float
+        Minimum time (in seconds) since the last use of a lock.
+
+    """
+    if fcntl is None:
+        return
+    if lock_dir is None:
+        lock_dir = os.path.join(config.compiledir, 'key_locks')
+    try:
+        names = os.listdir(lock_dir)
+    except OSError:
+        return
+    now = time.time()
+    for name in names:
+        path = os.path.join(lock_dir, name)
+        # The fcntl locks of this process are released when any file
+        # descriptor of the file is closed, so don't touch the ones used by
+        # another thread.
+        with _thread_lock:
+            if path in _key_thread_locks:
+                continue
+            entry = _key_thread_locks[path] = [threading.Lock(), 1]
+            entry[0].acquire()
+        try:
+            if now - os.path.getmtime(path) < min_age:
+                continue
+            with open(path, 'a') as f:
+                try:
+                    fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    # Held by another process.
+                    continue
+                os.remove(path)
+        except OSError:
+            # Removed by another process.
+            pass
+        finally:
+            _release_key_thread_lock(path, entry)
+
+
 # We define this name with an underscore so that python shutdown
 # deletes this before non-underscore names (like os).  We need to do
 # it this way to avoid errors on shutdown.
@@ -60,51 +213,52 @@ def _get_lock(lock_dir=None, **kw):
     We can lock only on 1 directory at a time.
 
     """
-    if lock_dir is None:
-        lock_dir = os.path.join(config.compiledir, 'lock_dir')
-    if not hasattr(get_lock, 'n_lock'):
-        # Initialization.
-        get_lock.n_lock = 0
-        if not hasattr(get_lock, 'lock_is_enabled'):
-            # Enable lock by default.
-            get_lock.lock_is_enabled = True
-        get_lock.lock_dir = lock_dir
-        get_lock.unlocker = Unlocker(get_lock.lock_dir)
-    else:
-        if lock_dir != get_lock.lock_dir:
-            # Compilation directory has changed.
-            # First ensure all old locks were released.
-            assert get_lock.n_lock == 0
-            # Update members for new compilation directory.
+    with _thread_lock:
+        if lock_dir is None:
+            lock_dir = os.path.join(config.compiledir, 'lock_dir')
+        if not hasattr(get_lock, 'n_lock'):
+            # Initialization.
+            get_lock.n_lock = 0
+            if not hasattr(get_lock, 'lock_is_enabled'):
+                # Enable lock by default.
+                get_lock.lock_is_enabled = True
             get_lock.lock_dir = lock_dir
             get_lock.unlocker = Unlocker(get_lock.lock_dir)
-
-    if get_lock.lock_is_enabled:
-        # Only really try to acquire the lock if we do not have it already.
-        if get_lock.n_lock == 0:
-            lock(get_lock.lock_dir, **kw)
-            atexit.register(Unlocker.unlock, get_lock.unlocker)
-            # Store time at which the lock was set.
-            get_lock.start_time = time.time()
         else:
-            # Check whether we need to 'refresh' the lock. We do this
-            # every 'config.compile.timeout / 2' seconds to ensure
-            # no one else tries to override our lock after their
-            # 'config.compile.timeout' timeout period.
-            if get_lock.start_time is None:
-                # This should not happen. So if this happen, clean up
-                # the lock state and raise an error.
-                while get_lock.n_lock > 0:
-                    release_lock()
-                raise Exception("For some unknow reason, the lock was already "
-                                "taken, but no start time was registered.")
-            now = time.time()
-            if now - get_lock.start_time > config.compile.timeout / 2:
-                lockpath = os.path.join(get_lock.lock_dir, 'lock')
-                _logger.info('Refreshing lock %s', str(lockpath))
-                refresh_lock(lockpath)
-                get_lock.start_time = now
-    get_lock.n_lock += 1
+            if lock_dir != get_lock.lock_dir:
+                # Compilation directory has changed.
+                # First ensure all old locks were released.
+                assert get_lock.n_lock == 0
+                # Update members for new compilation directory.
+                get_lock.lock_dir = lock_dir
+                get_lock.unlocker = Unlocker(get_lock.lock_dir)
+
+        if get_lock.lock_is_enabled:
+            # Only really try to acquire the lock if we do not have it already.
+            if get_lock.n_lock == 0:
+                lock(get_lock.lock_dir, **kw)
+                atexit.register(Unlocker.unlock, get_lock.unlocker)
+                # Store time at which the lock was set.
+                get_lock.start_time = time.time()
+            else:
+                # Check whether we need to 'refresh' the lock. We do this
+                # every 'config.compile.timeout / 2' seconds to ensure
+                # no one else tries to override our lock after their
+                # 'config.compile.timeout' timeout period.
+                if get_lock.start_time is None:
+                    # This should not happen. So if this happen, clean up
+                    # the lock state and raise an error.
+                    while get_lock.n_lock > 0:
+                        release_lock()
+                    raise Exception("For some unknow reason, the lock was already "
+                                    "taken, but no start time was registered.")
+                now = time.time()
+                if now - get_lock.start_time > config.compile.timeout / 2:
+                    lockpath = os.path.join(get_lock.lock_dir, 'lock')
+                    _logger.info('Refreshing lock %s', str(lockpath))
+                    refresh_lock(lockpath)
+                    get_lock.start_time = now
+        get_lock.n_lock += 1
 
 
 get_lock = _get_lock
@@ -115,12 +269,13 @@ def release_lock():
     Release lock on compilation directory.
 
     """
-    get_lock.n_lock -= 1
-    assert get_lock.n_lock >= 0
-    # Only really release lock once all lock requests have ended.
-    if get_lock.lock_is_enabled and get_lock.n_lock == 0:
-        get_lock.start_time = None
-        get_lock.unlocker.unlock(force=False)
+    with _thread_lock:
+        get_lock.n_lock -= 1
+        assert get_lock.n_lock >= 0
+        # Only really release lock once all lock requests have ended.
+        if get_lock.lock_is_enabled and get_lock.n_lock == 0:
+            get_lock.start_time = None
+            get_lock.unlocker.unlock(force=False)
 
 
 def set_lock_status(use_lock):
@@ -180,6 +180,239 @@ def _contains_cycle(fgraph, orderings):
     return visited != len(parent_counts)
 
 
+class _DynamicToposort(object):
+    """
+    Topological order of the Apply nodes of a FunctionGraph, kept up to
+    date as the graph and the orderings of the DestroyHandler change.
+
+    Each node has a distinct float position and, except for the edges
+    waiting in `pending`, every edge goes from a lower to a higher
+    position. Removing an edge never breaks the order. A new node is put
+    between its parents and its clients when there is room. An edge that
+    goes against the order is inserted with the algorithm of Pearce and
+    Kelly ("A dynamic topological sort algorithm for directed acyclic
+    graphs", 2006): only the nodes whose position is between the two ends
+    of the edge are visited and reordered, and the edge closes a cycle iff
+    its source is reachable from its destination among them. As this
+    needs all the other edges to agree with the order, the edges against
+    it are taken out of the graph and inserted one at a time.
+
+    While `stale` is True, the changes are not recorded and the order is
+    rebuilt from scratch at the next check.
+
+    """
+    def __init__(self):
+        self.stale = True
+
+    def _add_edge(self, a, b):
+        succ = self.succ[a]
+        if b in succ:
+            succ[b] += 1
+        else:
+            succ[b] = 1
+            self.pred[b][a] = None
+            self.pending.append((a, b))
+
+    def _remove_edge(self, a, b):
+        succ = self.succ.get(a)
+        if succ is None:
+            # a was pruned before the change of input was notified.
+            return
+        succ[b] -= 1
+        if not succ[b]:
+            del succ[b]
+            del self.pred[b][a]
+
+    def _set_pos(self, app, p):
+        self.pos[app] = p
+        self.at[p] = app
+
+    def on_import(self, app):
+        if self.stale:
+            return
+        self.succ[app] = OrderedDict()
+        self.pred[app] = OrderedDict()
+        self.unplaced.add(app)
+        for input in app.inputs:
+            if input.owner:
+                self._add_edge(input.owner, app)
+
+    def on_prune(self, app):
+        if self.stale:
+            return
+        for p in self.pred.pop(app):
+            del self.succ[p][app]
+        for s in self.succ.pop(app):
+            del self.pred[s][app]
+            if app in self.ord_pred.get(s, ()):
+                self.ord_pred[s].remove(app)
+        self.ord_pred.pop(app, None)
+        self.unplaced.discard(app)
+        if app in self.pos:
+            del self.at[self.pos.pop(app)]
+
+    def on_change_input(self, app, old_r, new_r):
+        if self.stale:
+            return
+        if old_r.owner:
+            self._remove_edge(old_r.owner, app)
+        if new_r.owner:
+            self._add_edge(new_r.owner, app)
+
+    def _set_orderings(self, orderings):
+        # Replace the edges added by the last orderings.
+        ord_pred = self.ord_pred
+        for app, deps in iteritems(ord_pred):
+            new = orderings.get(app, ())
+            for d in deps:
+                if d not in new:
+                    self._remove_edge(d, app)
+        for app, deps in iteritems(orderings):
+            old = ord_pred.get(app, ())
+            for d in deps:
+                if d not in old:
+                    self._add_edge(d, app)
+        self.ord_pred = dict((app, set(deps))
+                             for app, deps in iteritems(orderings))
+
+    def _rebuild(self, fgraph, orderings):
+        # Compute the edges and the order from scratch. Return False if
+        # there is a cycle, in which case the order stays stale.
+        self.succ = OrderedDict((app, OrderedDict())
+                                for app in fgraph.apply_nodes)
+        self.pred = OrderedDict((app, OrderedDict())
+                                for app in fgraph.apply_nodes)
+        self.pos = {}
+        self.at = {}
+        self.unplaced = OrderedSet()
+        self.pending = deque()
+        self.ord_pred = {}
+        for app in fgraph.apply_nodes:
+            for input in app.inputs:
+                if input.owner:
+                    self._add_edge(input.owner, app)
+        self._set_orderings(orderings)
+        self.pending = deque()
+
+        parent_counts = dict((app, len(pred))
+                             for app, pred in iteritems(self.pred))
+        visitable = deque(app for app, c in iteritems(parent_counts)
+                          if not c)
+        visited = 0
+        while visitable:
+            app = visitable.popleft()
+            self._set_pos(app, float(visited))
+            visited += 1
+            for client in self.succ[app]:
+                parent_counts[client] -= 1
+                if not parent_counts[client]:
+                    visitable.append(client)
+        self.top = float(visited)
+        self.bottom = -1.
+        self.stale = visited != len(parent_counts)
+        return not self.stale
+
+    def _place(self, app):
+        pos = self.pos
+        lo = max([pos[p] for p in self.pred[app] if p in pos] or [None])
+        hi = min([pos[s] for s in self.succ[app] if s in pos] or [None])
+        if hi is None:
+            p = self.top
+            self.top += 1
+        elif lo is None:
+            p = self.bottom
+            self.bottom -= 1
+        else:
+            p = (lo + hi) / 2
+            if not lo < p < hi or p in self.at:
+                # No room left between the parents and the clients, the
+                # edges to the clients will be repaired by _insert.
+                p = self.top
+                self.top += 1
+        self._set_pos(app, p)
+
+    def _insert(self, u, v):
+        # Reorder the nodes so that u comes before v, knowing that
+        # pos[u] > pos[v]. Return False if v reaches u.
+        pos = self.pos
+        lb = pos[v]
+        ub = pos[u]
+
+        delta_f = [v]
+        seen = set(delta_f)
+        stack = [v]
+        while stack:
+            for s in self.succ[stack.pop()]:
+                if s is u:
+                    return False
+                if pos[s] < ub and s not in seen:
+                    seen.add(s)
+                    delta_f.append(s)
+                    stack.append(s)
+
+        delta_b = [u]
+        seen = set(delta_b)
+        stack = [u]
+        while stack:
+            for p in self.pred[stack.pop()]:
+                if pos[p] > lb and p not in seen:
+                    seen.add(p)
+                    delta_b.append(p)
+                    stack.append(p)
+
+        delta_b.sort(key=pos.__getitem__)
+        delta_f.sort(key=pos.__getitem__)
+        nodes = delta_b + delta_f
+        slots = sorted(pos[n] for n in nodes)
+        for n, p in zip(nodes, slots):
+            self._set_pos(n, p)
+        return True
+
+    def contains_cycle(self, fgraph, orderings):
+        """
+        Same as _contains_cycle, but only visit the part of the graph
+        that changed since the last call.
+
+        When a cycle is found, the new edges stay pending, so the next
+        call checks them again once the graph has been reverted.
+
+        """
+        if self.stale or (len(self.pending) + len(self.unplaced) >
+                          len(self.succ)):
+            return not self._rebuild(fgraph, orderings)
+
+        self._set_orderings(orderings)
+        for app in self.unplaced:
+            self._place(app)
+        self.unplaced = OrderedSet()
+
+        # _insert is only correct when all the other edges agree with the
+        # order, so the edges that go against it are taken out of the
+        # graph and put back one at a time.
+        pos = self.pos
+        backward = []
+        for u, v in self.pending:
+            succ = self.succ.get(u)
+            if succ is not None and v in succ and pos[u] >= pos[v]:
+                if u is v:
+                    self._restore_edges(backward)
+                    return True
+                backward.append((u, v, succ.pop(v)))
+                del self.pred[v][u]
+        for i, (u, v, count) in enumerate(backward):
+            if pos[u] > pos[v] and not self._insert(u, v):
+                self._restore_edges(backward[i:])
+                return True
+            self._restore_edges(backward[i:i + 1])
+        self.pending = deque()
+        return False
+
+    def _restore_edges(self, edges):
+        for u, v, count in edges:
+            self.succ[u][v] = count
+            self.pred[v][u] = None
+
+
 def _build_droot_impact(destroy_handler):
     droot = {}   # destroyed view + nonview variables -> foundation
     impact = {}  # destroyed nonview variable -> it + all views of it
@@ -653,7 +886,8 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
 
     It is a work in progress. The following data structures have been
     converted to use the incremental strategy:
-        <none>
+        the topological order used to detect cycles
+        (see config.cycle_detection)
 
     The following data structures remain to be converted:
         <unknown>
@@ -738,6 +972,10 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         # clients: how many times does an apply use a given variable
         self.clients = OrderedDict()  # variable -> apply -> ninputs
         self.stale_droot = True
+        if theano.config.cycle_detection == 'incremental':
+            self.toposort = _DynamicToposort()
+        else:
+            self.toposort = None
 
         self.debug_all_apps = OrderedSet()
         if self.do_imports_on_attach:
@@ -751,6 +989,9 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             except Exception:
                 return []
         fgraph.destroyers = get_destroyers_of
+        if not hasattr(self, 'toposort'):
+            # Pickled before the incremental cycle detection
+            self.toposort = None
 
     def refresh_droot_impact(self):
         """
@@ -772,6 +1013,7 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         del self.view_o
         del self.clients
         del self.stale_droot
+        del self.toposort
         assert self.fgraph.destroyer_handler is self
         delattr(self.fgraph, 'destroyers')
         delattr(self.fgraph, 'destroy_handler')
@@ -811,6 +1053,9 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         for i, output in enumerate(app.outputs):
             self.clients.setdefault(output, OrderedDict())
 
+        if self.toposort is not None:
+            self.toposort.on_import(app)
+
         self.stale_droot = True
 
     def on_prune(self, fgraph, app, reason):
@@ -848,6 +1093,9 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             if not self.view_o[i]:
                 del self.view_o[i]
 
+        if self.toposort is not None:
+            self.toposort.on_prune(app)
+
         self.stale_droot = True
 
     def on_change_input(self, fgraph, app, i, old_r, new_r, reason):
@@ -891,6 +1139,9 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
 
                     self.view_o.setdefault(new_r, OrderedSet()).add(output)
 
+            if self.toposort is not None:
+                self.toposort.on_change_input(app, old_r, new_r)
+
         self.stale_droot = True
 
     def validate(self, fgraph):
@@ -905,7 +1156,11 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         if self.destroyers:
             ords = self.orderings(fgraph)
 
-            if _contains_cycle(fgraph, ords):
+            if self.toposort is not None:
+                has_cycle = self.toposort.contains_cycle(fgraph, ords)
+            else:
+                has_cycle = _contains_cycle(fgraph, ords)
+            if has_cycle:
                 raise InconsistencyError("Dependency graph contains cycles")
         else:
             # James's Conjecture:
@@ -8,6 +8,8 @@ from __future__ import absolute_import, print_function, division
 from collections import OrderedDict
 import time
 
+import numpy as np
+
 import theano
 from theano.gof import graph
 from theano.gof import utils
@@ -628,6 +630,26 @@ class FunctionGraph(utils.object2):
 
         return order
 
+    def compact(self, order=None):
+        """
+        Return a CompactGraph of this graph.
+
+        Parameters
+        ----------
+        order : list of Apply, optional
+            The order in which the nodes are numbered. It defaults to
+            self.toposort().
+
+        Notes
+        -----
+        The CompactGraph is a snapshot: it doesn't follow the changes made
+        to this graph after it is built.
+
+        """
+        if order is None:
+            order = self.toposort()
+        return CompactGraph(self, order)
+
     def orderings(self):
         """
         Return dict d s.t. d[node] is a list of nodes that must be evaluated
@@ -785,3 +807,173 @@ class FunctionGraph(utils.object2):
         for feature in self._features:
             if hasattr(feature, "unpickle"):
                 feature.unpickle(self)
+
+
+class CompactGraph(object):
+    """
+    Read-only, integer-indexed view of a FunctionGraph.
+
+    The nodes are numbered in the order they are given and the variables
+    are numbered as follows: the inputs of the graph, then the other
+    variables without an owner (the constants) in the order they are
+    used, then the outputs of each node. The edges of the graph are
+    stored in int32 arrays in the CSR format, so the passes over large
+    graphs done by the linkers can be vectorized with numpy, and don't
+    need to build a dict or a set per variable.
+
+    It is a snapshot: it must be built again after the graph is changed.
+    Use FunctionGraph.compact to build it.
+
+    Parameters
+    ----------
+    fgraph : FunctionGraph
+    order : list of Apply
+        All the nodes of `fgraph`.
+
+    Attributes
+    ----------
+    nodes : list of Apply
+        The nodes, in `order`.
+    variables : list of Variable
+        The variables, by index.
+    node_index : dict
+        Map each node to its index.
+    variable_index : dict
+        Map each variable to its index.
+    owner : ndarray
+        The index of the node computing each variable, -1 for the inputs
+        and the constants.
+    inputs_ptr, inputs : ndarray
+        The inputs of the node `i` are the variables
+        `inputs[inputs_ptr[i]:inputs_ptr[i + 1]]`.
+    outputs_ptr : ndarray
+        The outputs of the node `i` are the variables `outputs_ptr[i]` to
+        `outputs_ptr[i + 1] - 1`.
+    clients_ptr, clients, clients_pos : ndarray
+        The clients of the variable `v` are the nodes
+        `clients[clients_ptr[v]:clients_ptr[v + 1]]`, that use it as their
+        input number `clients_pos[clients_ptr[v]:clients_ptr[v + 1]]`. Like
+        the ('output', i) entries of Variable.clients, the output `i` of
+        the graph is a client -1 at the position `i`, after the nodes.
+    outputs : ndarray
+        The indices of the outputs of the graph.
+    is_output : ndarray
+        Boolean mask of the outputs of the graph.
+
+    """
+
+    def __init__(self, fgraph, order):
+        self.nodes = list(order)
+        self.node_index = dict((node, i) for i, node in enumerate(self.nodes))
+        self.variables = []
+        self.variable_index = {}
+
+        def add(var):
+            if var not in self.variable_index:
+                self.variable_index[var] = len(self.variables)
+                self.variables.append(var)
+
+        for var in fgraph.inputs:
+            add(var)
+        for var in fgraph.outputs:
+            if var.owner not in self.node_index:
+                add(var)
+        for node in self.nodes:
+            for var in node.inputs:
+                if var.owner not in self.node_index:
+                    add(var)
+
+        n_nodes = len(self.nodes)
+        self.outputs_ptr = np.empty(n_nodes + 1, dtype='int32')
+        self.outputs_ptr[0] = len(self.variables)
+        for i, node in enumerate(self.nodes):
+            for var in node.outputs:
+                add(var)
+            self.outputs_ptr[i + 1] = len(self.variables)
+        n_vars = len(self.variables)
+
+        self.owner = np.empty(n_vars, dtype='int32')
+        self.owner[:self.outputs_ptr[0]] = -1
+        self.owner[self.outputs_ptr[0]:] = np.repeat(
+            np.arange(n_nodes, dtype='int32'), np.diff(self.outputs_ptr))
+
+        index = self.variable_index
+        n_inputs = np.fromiter((len(node.inputs) for node in self.nodes),
+                               dtype='int32', count=n_nodes)
+        self.inputs_ptr = np.zeros(n_nodes + 1, dtype='int32')
+        np.cumsum(n_inputs, out=self.inputs_ptr[1:])
+        self.inputs = np.fromiter(
+            (index[var] for node in self.nodes for var in node.inputs),
+            dtype='int32', count=self.inputs_ptr[-1])
+        self.outputs = np.fromiter((index[var] for var in fgraph.outputs),
+                                   dtype='int32', count=len(fgraph.outputs))
+        self.is_output = np.zeros(n_vars, dtype=bool)
+        self.is_output[self.outputs] = True
+
+        # The stable sort keeps the clients of a variable in node order.
+        users = np.concatenate([self.inputs, self.outputs])
+        user_nodes = np.concatenate([
+            np.repeat(np.arange(n_nodes, dtype='int32'), n_inputs),
+            np.full(len(self.outputs), -1, dtype='int32')])
+        user_pos = np.concatenate([
+            np.arange(len(self.inputs), dtype='int32') -
+            np.repeat(self.inputs_ptr[:-1], n_inputs),
+            np.arange(len(self.outputs), dtype='int32')])
+        perm = np.argsort(users, kind='mergesort')
+        self.clients = user_nodes[perm]
+        self.clients_pos = user_pos[perm]
+        self.clients_ptr = np.zeros(n_vars + 1, dtype='int32')
+        np.cumsum(np.bincount(users, minlength=n_vars),
+                  out=self.clients_ptr[1:])
+
+    def node_inputs(self, i):
+        """Return the indices of the inputs of the node `i`."""
+        return self.inputs[self.inputs_ptr[i]:self.inputs_ptr[i + 1]]
+
+    def node_outputs(self, i):
+        """Return the indices of the outputs of the node `i`."""
+        return np.arange(self.outputs_ptr[i], self.outputs_ptr[i + 1],
+                         dtype='int32')
+
+    def variable_clients(self, v):
+        """
+        Return the clients of the variable `v` as a list of (node index,
+        input position) pairs, with -1 for the outputs of the graph.
+
+        """
+        start, stop = self.clients_ptr[v], self.clients_ptr[v + 1]
+        return list(zip(self.clients[start:stop].tolist(),
+                        self.clients_pos[start:stop].tolist()))
+
+    def last_user(self):
+        """
+        Return the index of the last node using each variable as an input,
+        -1 for the variables no node uses.
+
+        """
+        last_user = np.full(len(self.variables), -1, dtype='int32')
+        np.maximum.at(last_user, self.inputs,
+                      np.repeat(np.arange(len(self.nodes), dtype='int32'),
+                                np.diff(self.inputs_ptr)))
+        return last_user
+
+    def last_uses(self):
+        """
+        Return, for each node, the indices of its inputs that are computed
+        by a node, are not an output of the graph, and are not used by a
+        later node. Their storage can be freed once the node has run.
+
+        An input is listed as many times as the node uses it, as done by
+        the linkers with the result of gc_helper.
+
+        """
+        user = np.repeat(np.arange(len(self.nodes), dtype='int32'),
+                         np.diff(self.inputs_ptr))
+        inputs = self.inputs
+        mask = ((self.owner[inputs] >= 0) &
+                ~self.is_output[inputs] &
+                (self.last_user()[inputs] == user))
+        rval = [[] for node in self.nodes]
+        for i, v in zip(user[mask].tolist(), inputs[mask].tolist()):
+            rval[i].append(v)
+        return rval
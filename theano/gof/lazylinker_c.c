@@ -1052,14 +1052,210 @@ static PyTypeObject lazylinker_ext_CLazyLinkerType = {
     CLazyLinker_new,           /* tp_new */
 };
 
+/**
+
+  bind_call(vm, error_handler, cells, reset_cells, reset_values,
+            n_returned, unpack, *inputs)
+
+  Fast path of Function.trusted_call. Put each input as is in the matching
+  cell of `cells`, run the CLazyLinker `vm`, put `reset_values` back in
+  `reset_cells` and return the first `n_returned` outputs: as a list, alone
+  if `unpack` is 1 and there is only one of them, or None if `unpack` is 2.
+
+  If the vm fails, error_handler(type, value, traceback) is called to
+  re-raise the exception with information about the node that failed.
+
+  bind_map(vm, error_handler, cells, reset_cells, reset_values,
+           n_returned, unpack, inputs_list)
+
+  Same thing, for each sequence of inputs of the list `inputs_list`,
+  without going back to Python between the calls. Return the list of the
+  results.
+
+  */
+typedef struct {
+    PyObject * vm;
+    PyObject * error_handler;
+    PyObject * cells;
+    PyObject * reset_cells;
+    PyObject * reset_values;
+    long n_returned;
+    long unpack;
+} BindArgs;
+
+static int parse_bind_args(PyObject *args, Py_ssize_t n_min, BindArgs *b)
+{
+  if (PyTuple_Size(args) < n_min)
+    {
+      PyErr_Format(PyExc_TypeError, "expected at least %zd arguments", n_min);
+      return -1;
+    }
+  b->vm = PyTuple_GET_ITEM(args, 0);
+  b->error_handler = PyTuple_GET_ITEM(args, 1);
+  b->cells = PyTuple_GET_ITEM(args, 2);
+  b->reset_cells = PyTuple_GET_ITEM(args, 3);
+  b->reset_values = PyTuple_GET_ITEM(args, 4);
+  b->n_returned = PyInt_AsLong(PyTuple_GET_ITEM(args, 5));
+  b->unpack = PyInt_AsLong(PyTuple_GET_ITEM(args, 6));
+  if (PyErr_Occurred())
+    return -1;
+  if (!PyObject_TypeCheck(b->vm, &lazylinker_ext_CLazyLinkerType)
+      || !PyList_Check(b->cells)
+      || !PyList_Check(b->reset_cells)
+      || !PyList_Check(b->reset_values)
+      || PyList_GET_SIZE(b->reset_cells) != PyList_GET_SIZE(b->reset_values))
+    {
+      PyErr_SetString(PyExc_TypeError, "bad arguments to bind the inputs");
+      return -1;
+    }
+  return 0;
+}
+
+static void reset_cells_values(BindArgs *b)
+{
+  for (Py_ssize_t i = 0; i < PyList_GET_SIZE(b->reset_cells); ++i)
+    {
+      PyObject * value = PyList_GET_ITEM(b->reset_values, i);
+      Py_INCREF(value);
+      PyList_SetItem(PyList_GET_ITEM(b->reset_cells, i), 0, value);
+    }
+}
+
+static PyObject * bind_run(BindArgs *b, PyObject **inputs, Py_ssize_t n_inputs,
+                           PyObject *no_args)
+{
+  if (n_inputs != PyList_GET_SIZE(b->cells))
+    {
+      PyErr_Format(PyExc_TypeError,
+                   "Wrong number of inputs: expected %zd, got %zd",
+                   PyList_GET_SIZE(b->cells), n_inputs);
+      return NULL;
+    }
+  for (Py_ssize_t i = 0; i < n_inputs; ++i)
+    {
+      Py_INCREF(inputs[i]);
+      if (PyList_SetItem(PyList_GET_ITEM(b->cells, i), 0, inputs[i]))
+        return NULL;
+    }
+
+  PyObject * rval = CLazyLinker_call(b->vm, no_args, NULL);
+
+  if (rval == NULL)
+    {
+      PyObject *type, *value, *trace;
+      PyErr_Fetch(&type, &value, &trace);
+      reset_cells_values(b);
+      PyErr_NormalizeException(&type, &value, &trace);
+      PyObject * res = PyObject_CallFunctionObjArgs(
+          b->error_handler, type,
+          value ? value : Py_None,
+          trace ? trace : Py_None,
+          NULL);
+      if (res != NULL)
+        {
+          // The handler did not raise, raise the original exception.
+          Py_DECREF(res);
+          PyErr_Restore(type, value, trace);
+        }
+      else
+        {
+          Py_XDECREF(type);
+          Py_XDECREF(value);
+          Py_XDECREF(trace);
+        }
+      return NULL;
+    }
+  reset_cells_values(b);
+
+  if (b->unpack == 2)
+    {
+      Py_DECREF(rval);
+      Py_RETURN_NONE;
+    }
+  if (b->n_returned < PyList_GET_SIZE(rval))
+    {
+      // Drop the values of the updates.
+      PyObject * returned = PyList_GetSlice(rval, 0, b->n_returned);
+      Py_DECREF(rval);
+      rval = returned;
+      if (rval == NULL)
+        return NULL;
+    }
+  if (b->unpack == 1 && PyList_GET_SIZE(rval) == 1)
+    {
+      PyObject * item = PyList_GET_ITEM(rval, 0);
+      Py_INCREF(item);
+      Py_DECREF(rval);
+      return item;
+    }
+  return rval;
+}
+
+static PyObject * bind_call(PyObject *dummy, PyObject *args)
+{
+  BindArgs b;
+  if (parse_bind_args(args, 7, &b))
+    return NULL;
+  PyObject * no_args = PyTuple_New(0);
+  if (no_args == NULL)
+    return NULL;
+  PyObject * rval = bind_run(&b, &PyTuple_GET_ITEM(args, 7),
+                             PyTuple_GET_SIZE(args) - 7, no_args);
+  Py_DECREF(no_args);
+  return rval;
+}
+
+static PyObject * bind_map(PyObject *dummy, PyObject *args)
+{
+  BindArgs b;
+  if (parse_bind_args(args, 8, &b))
+    return NULL;
+  PyObject * inputs_list = PySequence_Fast(PyTuple_GET_ITEM(args, 7),
+                                           "inputs_list must be a sequence");
+  if (inputs_list == NULL)
+    return NULL;
+  Py_ssize_t n_calls = PySequence_Fast_GET_SIZE(inputs_list);
+  PyObject * no_args = PyTuple_New(0);
+  PyObject * results = PyList_New(n_calls);
+  if (no_args == NULL || results == NULL)
+    goto fail;
+  for (Py_ssize_t i = 0; i < n_calls; ++i)
+    {
+      PyObject * inputs = PySequence_Fast(
+          PySequence_Fast_GET_ITEM(inputs_list, i),
+          "each element of inputs_list must be a sequence");
+      if (inputs == NULL)
+        goto fail;
+      PyObject * rval = bind_run(&b, PySequence_Fast_ITEMS(inputs),
+                                 PySequence_Fast_GET_SIZE(inputs), no_args);
+      Py_DECREF(inputs);
+      if (rval == NULL)
+        goto fail;
+      PyList_SET_ITEM(results, i, rval);
+    }
+  Py_DECREF(no_args);
+  Py_DECREF(inputs_list);
+  return results;
+
+ fail:
+  Py_XDECREF(no_args);
+  Py_XDECREF(results);
+  Py_DECREF(inputs_list);
+  return NULL;
+}
+
 static PyObject * get_version(PyObject *dummy, PyObject *args)
 {
-  PyObject *result = PyFloat_FromDouble(0.211);
+  PyObject *result = PyFloat_FromDouble(0.213);
   return result;
 }
 
 static PyMethodDef lazylinker_ext_methods[] = {
   {"get_version",  get_version, METH_VARARGS, "Get extension version."},
+  {"bind_call",  bind_call, METH_VARARGS,
+   "Bind the inputs of a Function and run its CLazyLinker."},
+  {"bind_map",  bind_map, METH_VARARGS,
+   "Run bind_call for each sequence of inputs of a list."},
   {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -435,6 +435,14 @@ class Container(object):
 
     """
 
+    version = 0
+    """
+    Incremented each time the value is set through this container. Its
+    owner may also increment it when the value is modified inplace (see
+    `Function`), so that the incremental `Stack` VM sees the change.
+
+    """
+
     def __init__(self, r, storage, readonly=False, strict=False,
                  allow_downcast=None, name=None):
         if not isinstance(storage, list) or not len(storage) >= 1:
@@ -461,6 +469,8 @@ class Container(object):
     def __set__(self, value):
         if self.readonly:
             raise Exception("Cannot set readonly storage: %s" % self.name)
+        # filter_inplace may keep the same object.
+        self.version += 1
         try:
             if value is None:
                 self.storage[0] = None
@@ -831,21 +841,15 @@ class PerformLinker(LocalLinker):
             thunks[-1].inputs = [storage_map[v] for v in node.inputs]
             thunks[-1].outputs = [storage_map[v] for v in node.outputs]
 
-        computed, last_user = gc_helper(order)
+        compact = fgraph.compact(order)
+        computed = set(compact.variables[compact.outputs_ptr[0]:])
         if self.allow_gc:
-            post_thunk_old_storage = []
+            post_thunk_old_storage = [
+                [storage_map[compact.variables[v]] for v in last_uses]
+                for last_uses in compact.last_uses()]
         else:
             post_thunk_old_storage = None
 
-        for node in order:
-            if self.allow_gc:
-                post_thunk_old_storage.append(
-                    [storage_map[input]
-                     for input in node.inputs
-                     if (input in computed) and (
-                        input not in fgraph.outputs) and (
-                        node == last_user[input])])
-
         if no_recycling is True:
             # True seems like some special code for *everything*?? -JB
             # FunctionMaker always passes a list I think   -JB
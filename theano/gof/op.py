@@ -790,6 +790,35 @@ class PureOp(object):
         return True
 
 
+class _NodeCThunk(object):
+    """
+    Thunk of a node returned by `Op.make_c_thunk`.
+
+    The `cthunk` used by the C VM is only built when it is first asked
+    for, so with `config.cmodule.lazy_load` the module of the node is not
+    imported before it is needed.
+
+    """
+    lazy = False
+
+    def __init__(self, fill_storage, node, compute_map, inputs, outputs):
+        self.fill_storage = fill_storage
+        self.node = node
+        self.compute_map = compute_map
+        self.inputs = inputs
+        self.outputs = outputs
+
+    @property
+    def cthunk(self):
+        return self.fill_storage.cthunk
+
+    def __call__(self):
+        self.fill_storage()
+        compute_map = self.compute_map
+        for o in self.node.outputs:
+            compute_map[o][0] = True
+
+
 class Op(utils.object2, PureOp, CLinkerOp):
     """
     Convenience class to bundle `PureOp` and `CLinkerOp`.
@@ -809,13 +838,14 @@ class Op(utils.object2, PureOp, CLinkerOp):
         """
         pass
 
-    def make_c_thunk(self, node, storage_map, compute_map, no_recycling):
-        """Like make_thunk, but will only try to make a C thunk.
-
+    def make_c_linker(self, node, no_recycling):
         """
-        node_input_storage = [storage_map[r] for r in node.inputs]
-        node_output_storage = [storage_map[r] for r in node.outputs]
+        Return the CLinker that `make_c_thunk` uses to compile `node`.
 
+        Raises NotImplementedError if the C code of this op can't be used
+        for `node`.
+
+        """
         # float16 gets special treatment since running
         # unprepared C code will get bad results.
         if not getattr(self, '_f16_ok', False):
@@ -831,24 +861,24 @@ class Op(utils.object2, PureOp, CLinkerOp):
         e_no_recycling = [new_o
                           for (new_o, old_o) in zip(e.outputs, node.outputs)
                           if old_o in no_recycling]
-        cl = theano.gof.cc.CLinker().accept(e,
-                                            no_recycling=e_no_recycling)
+        return theano.gof.cc.CLinker().accept(e,
+                                              no_recycling=e_no_recycling)
+
+    def make_c_thunk(self, node, storage_map, compute_map, no_recycling):
+        """Like make_thunk, but will only try to make a C thunk.
+
+        """
+        node_input_storage = [storage_map[r] for r in node.inputs]
+        node_output_storage = [storage_map[r] for r in node.outputs]
+        cl = self.make_c_linker(node, no_recycling)
 
         _logger.debug('Trying CLinker.make_thunk')
         outputs = cl.make_thunk(input_storage=node_input_storage,
                                 output_storage=node_output_storage)
         fill_storage, node_input_filters, node_output_filters = outputs
 
-        def rval():
-            fill_storage()
-            for o in node.outputs:
-                compute_map[o][0] = True
-
-        rval.cthunk = fill_storage.cthunk
-        rval.inputs = node_input_storage
-        rval.outputs = node_output_storage
-        rval.lazy = False
-        return rval
+        return _NodeCThunk(fill_storage, node, compute_map,
+                           node_input_storage, node_output_storage)
 
     def make_py_thunk(self, node, storage_map, compute_map, no_recycling,
                       debug=False):
@@ -1131,6 +1161,13 @@ class OpenMPOp(Op):
 
     """
 
+    thread_budget_kind = 'openmp'
+    """
+    The C code of this Op runs OpenMP loops, whose number of threads can
+    be set by a `theano.gof.threadbudget.ThreadBudget`.
+
+    """
+
     def __init__(self, openmp=None):
         if openmp is None:
             openmp = theano.config.openmp
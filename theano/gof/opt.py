@@ -7,6 +7,7 @@ from __future__ import absolute_import, print_function, division
 
 from collections import deque, defaultdict, OrderedDict
 import copy
+import heapq
 import inspect
 import logging
 import pdb
@@ -510,7 +511,18 @@ class MergeFeature(object):
     That way, the MergeOptimizer can remember the result of the last merge
     pass on the fgraph.
 
+    The distinct nodes are kept in a table indexed by their signature, the
+    op and the identity of their inputs, so finding the node an imported
+    node can be merged with does not depend on the number of clients of
+    its inputs. Nodes whose op is not hashable or with more than
+    `max_signature_inputs` inputs, whose signature would be recomputed
+    each time one of their inputs changes, are compared with the clients
+    of their inputs instead.
+
     """
+
+    max_signature_inputs = 32
+
     def on_attach(self, fgraph):
         assert not hasattr(fgraph, 'merge_feature')
         fgraph.merge_feature = self
@@ -527,6 +539,18 @@ class MergeFeature(object):
         self.nodes_seen = set()
         # Ordered set of distinct (not mergeable) nodes without any input
         self.noinput_nodes = OrderedSet()
+        # signature -> distinct node
+        self.sig_nodes = {}
+        # distinct node -> signature, as the inputs of the node can change
+        # before it is removed from sig_nodes
+        self.node_sigs = {}
+        # Number of nodes looked up in sig_nodes that had a merge candidate,
+        # that were distinct, or that were compared with the clients of
+        # their inputs. They are reset by each MergeOptimizer.apply and
+        # reported in its profile.
+        self.nb_sig_hit = 0
+        self.nb_sig_miss = 0
+        self.nb_sig_scan = 0
 
         # Each element of scheduled is a list of list of (out, new_out) pairs.
         # Each list of pairs represent the substitution needed to replace all
@@ -551,7 +575,7 @@ class MergeFeature(object):
         # If inputs to node change, it is not guaranteed that it is distinct
         # from the other nodes in nodes_seen
         if node in self.nodes_seen:
-            self.nodes_seen.discard(node)
+            self.discard_node(node)
             self.process_node(fgraph, node)
 
         # Since we are in on_change_input, node should have inputs.
@@ -569,9 +593,7 @@ class MergeFeature(object):
         self.process_node(fgraph, node)
 
     def on_prune(self, fgraph, node, reason):
-        self.nodes_seen.discard(node)
-        if not node.inputs:
-            self.noinput_nodes.discard(node)
+        self.discard_node(node)
         for c in node.inputs:
             if isinstance(c, graph.Constant) and (len(c.clients) <= 1):
                 # This was the last node using this constant
@@ -601,6 +623,39 @@ class MergeFeature(object):
             self.const_sig_inv[sig] = c
             self.seen_constants.add(id(c))
 
+    @staticmethod
+    def node_signature(node):
+        """
+        Return the key of `node` in the table of distinct nodes, or None if
+        it is not in the table.
+
+        Two nodes with the same signature can be merged.
+
+        """
+        if len(node.inputs) > MergeFeature.max_signature_inputs:
+            return None
+        sig = (node.op, tuple(map(id, node.inputs)))
+        try:
+            hash(sig)
+        except TypeError:
+            return None
+        return sig
+
+    def add_node(self, node, sig):
+        self.nodes_seen.add(node)
+        if not node.inputs:
+            self.noinput_nodes.add(node)
+        if sig is not None:
+            self.sig_nodes[sig] = node
+            self.node_sigs[node] = sig
+
+    def discard_node(self, node):
+        self.nodes_seen.discard(node)
+        self.noinput_nodes.discard(node)
+        sig = self.node_sigs.pop(node, None)
+        if sig is not None and self.sig_nodes.get(sig) is node:
+            del self.sig_nodes[sig]
+
     def process_node(self, fgraph, node):
         """
         Check if a node can be merged, and queue that replacement.
@@ -611,10 +666,20 @@ class MergeFeature(object):
 
         node_has_assert = False
 
-        # These asserts ensure that the fgraph has set the clients field
-        # properly.
-        # The clients should at least contain `node` itself!
-        if node.inputs:
+        sig = self.node_signature(node)
+        if sig is not None:
+            candidate = self.sig_nodes.get(sig, None)
+            if candidate is None:
+                self.nb_sig_miss += 1
+                merge_candidates = []
+            else:
+                self.nb_sig_hit += 1
+                merge_candidates = [candidate]
+        elif node.inputs:
+            self.nb_sig_scan += 1
+            # These asserts ensure that the fgraph has set the clients field
+            # properly.
+            # The clients should at least contain `node` itself!
             # Take the smallest clients list. Some ops like elemwise
             # have optimization that put constant as the first inputs.
             # As constant have in general more clients than other type of nodes
@@ -649,6 +714,7 @@ class MergeFeature(object):
 
                     merge_candidates.extend(assert_clients)
         else:
+            self.nb_sig_scan += 1
             # If two nodes have no input, but perform the same operation,
             # they are not always constant-folded, so we want to merge them.
             # In that case, the candidates are all the nodes without inputs.
@@ -737,9 +803,7 @@ class MergeFeature(object):
         if replacement_candidates:
             self.scheduled.append(replacement_candidates)
         else:
-            self.nodes_seen.add(node)
-            if not node.inputs:
-                self.noinput_nodes.add(node)
+            self.add_node(node, sig)
 
     def get_merged_assert_input(self, node, candidate):
         new_inputs = []
@@ -922,8 +986,17 @@ class MergeOptimizer(Optimizer):
             callbacks_time = {}
         # clear blacklist
         fgraph.merge_feature.blacklist = []
+        # The lookups done since the last apply, mostly by the callbacks
+        # of the feature while other optimizers changed the graph.
+        merge_feature = fgraph.merge_feature
+        sig_counts = (merge_feature.nb_sig_hit, merge_feature.nb_sig_miss,
+                      merge_feature.nb_sig_scan)
+        merge_feature.nb_sig_hit = 0
+        merge_feature.nb_sig_miss = 0
+        merge_feature.nb_sig_scan = 0
         return (nb_fail, time.time() - t0, validate_time,
-                callback_time, callbacks_time, nb_merged, nb_constant)
+                callback_time, callbacks_time, nb_merged, nb_constant) + \
+            sig_counts
 
     def __str__(self):
         return self.__class__.__name__
@@ -932,12 +1005,15 @@ class MergeOptimizer(Optimizer):
     def print_profile(stream, prof, level=0):
 
         (nb_fail, replace_time, validate_time,
-         callback_time, callbacks_time, nb_merged, nb_constant) = prof
+         callback_time, callbacks_time, nb_merged, nb_constant,
+         nb_sig_hit, nb_sig_miss, nb_sig_scan) = prof
 
         blanc = ('    ' * level)
         print(blanc, "MergeOptimizer", file=stream)
         print(blanc, "  nb fail=%5d merged=%5d constant=%5d" % (
               nb_fail, nb_merged, nb_constant), file=stream)
+        print(blanc, "  signature lookups hit=%5d miss=%5d scan=%5d" % (
+              nb_sig_hit, nb_sig_miss, nb_sig_scan), file=stream)
         print(blanc, "  time replace=%2.2f validate=%2.2f callback=%2.2f" % (
               replace_time, validate_time, callback_time), file=stream)
         if callback_time > 1:
@@ -963,8 +1039,10 @@ class MergeOptimizer(Optimizer):
         callbacks_time = merge_dict(prof1[4], prof2[4])
         nb_merged = prof1[5] + prof2[5]
         nb_constant = prof1[6] + prof2[6]
+        sig_counts = tuple(c1 + c2 for c1, c2 in zip(prof1[7:], prof2[7:]))
         return (nb_fail, replace_time, validate_time,
-                callback_time, callbacks_time, nb_merged, nb_constant)
+                callback_time, callbacks_time, nb_merged, nb_constant) + \
+            sig_counts
 
 
 def is_same_graph_with_merge(var1, var2, givens=None):
@@ -2293,6 +2371,13 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         They must not traverse the graph as they are called very frequently.
         The MergeOptimizer is one example of optimization that respect this.
         They are applied after all global optimizer, then when one local optimizer is applied, then after all final optimizer.
+    worklist
+        If True, after the first iteration, the local optimizers are only
+        applied on the nodes that were added to the graph, whose inputs
+        changed or whose outputs lost or got clients since the previous
+        iteration. When there are none left, a last iteration over all
+        the nodes checks that the equilibrium is reached, like without
+        this option. If None, use the Theano flag optdb.worklist.
 
     """
 
@@ -2303,7 +2388,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                  tracks_on_change_inputs=False,
                  max_use_ratio=None,
                  final_optimizers=None,
-                 cleanup_optimizers=None):
+                 cleanup_optimizers=None,
+                 worklist=None):
         super(EquilibriumOptimizer, self).__init__(
             None,
             ignore_newtrees=ignore_newtrees,
@@ -2331,6 +2417,9 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         self.max_use_ratio = max_use_ratio
         assert self.max_use_ratio is not None, (
             'max_use_ratio has to be a number')
+        if worklist is None:
+            worklist = config.optdb.worklist
+        self.worklist = worklist
 
     def get_local_optimizers(self):
         for opt in self.local_optimizers_all:
@@ -2389,6 +2478,43 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             time_opts.setdefault(opt, 0)
             node_created.setdefault(opt, 0)
 
+        # In worklist mode, the nodes that changed since the start of the
+        # last pass of local optimizers. During a pass that only visits
+        # them, `heap` holds the negated position in `topo` of the ones
+        # left to visit, and the nodes that change and would be visited
+        # later by a full pass are added to it, so they are visited in the
+        # same order as a full pass.
+        dirty = OrderedSet()
+        dirty_updater = None
+        topo = []
+        pos = {}
+        heap = []
+        queued = set()
+        current_pos = 0
+        if self.worklist:
+            def mark_dirty(node):
+                dirty.add(node)
+                i = pos.get(node)
+                if i is not None and i < current_pos and i not in queued:
+                    queued.add(i)
+                    heapq.heappush(heap, -i)
+
+            def dirty_pruner(node):
+                for r in node.inputs:
+                    if r.owner is not None:
+                        mark_dirty(r.owner)
+
+            def dirty_chin(node, i, r, new_r, reason):
+                if not isinstance(node, string_types):
+                    mark_dirty(node)
+                for v in (r, new_r):
+                    if v.owner is not None:
+                        mark_dirty(v.owner)
+            dirty_updater = Updater(mark_dirty, dirty_pruner, dirty_chin,
+                                    name='worklist')
+            fgraph.attach_feature(dirty_updater)
+        full_pass = True
+
         def apply_cleanup(profs_dict):
             changed = False
             for copt in self.cleanup_optimizers:
@@ -2406,7 +2532,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                     node_created[copt] += change_tracker.nb_imported - nb
             return changed
 
-        while changed and not max_use_abort:
+        while (changed or not full_pass) and not max_use_abort:
             process_count = {}
             t0 = time.time()
             changed = False
@@ -2443,11 +2569,27 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
             # apply local optimizer
             topo_t0 = time.time()
-            q = deque(graph.io_toposort(fgraph.inputs, start_from))
+            topo = graph.io_toposort(fgraph.inputs, start_from)
+            if self.worklist and loop_timing:
+                # Only visit the nodes that changed, in the order of a full
+                # pass. If there are none, visit all of them once more to
+                # check the equilibrium.
+                pos = dict((node, i) for i, node in enumerate(topo))
+                queued = set(pos[node] for node in dirty if node in pos)
+                heap = [-i for i in queued]
+                heapq.heapify(heap)
+                current_pos = len(topo)
+            full_pass = not heap
+            if full_pass:
+                pos = {}
+                q = deque(topo)
+            else:
+                q = deque()
+            dirty.clear()
             io_toposort_timing.append(time.time() - topo_t0)
 
-            nb_nodes.append(len(q))
-            max_nb_nodes = max(max_nb_nodes, len(q))
+            nb_nodes.append(len(q) + len(heap))
+            max_nb_nodes = max(max_nb_nodes, len(topo))
             max_use = max_nb_nodes * self.max_use_ratio
 
             def importer(node):
@@ -2463,8 +2605,12 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                                     chin=chin,
                                     name=getattr(self, 'name', None))
             try:
-                while q:
-                    node = q.pop()
+                while q or heap:
+                    if q:
+                        node = q.pop()
+                    else:
+                        current_pos = -heapq.heappop(heap)
+                        node = topo[current_pos]
                     if node not in fgraph.apply_nodes:
                         continue
                     current_node = node
@@ -2492,6 +2638,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                             break
             finally:
                 self.detach_updater(fgraph, u)
+            # The next changes are for the next pass.
+            pos = {}
 
             # Apply final optimizers
             sub_profs = []
@@ -2542,6 +2690,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 raise AssertionError(msg)
             else:
                 _logger.error(msg)
+        if dirty_updater is not None:
+            fgraph.remove_feature(dirty_updater)
         fgraph.remove_feature(change_tracker)
         assert len(loop_process_count) == len(loop_timing)
         assert len(loop_process_count) == len(global_opt_timing)
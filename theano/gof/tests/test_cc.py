@@ -291,6 +291,39 @@ def test_opwiseclinker_straightforward():
         assert fn(2.0, 2.0, 2.0) == -6
 
 
+def test_opwiseclinker_compile_parallel():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+
+    # Unversioned ops are compiled once in each process.
+    class ParallelAdd(Add):
+        def c_code_cache_version(self):
+            return ()
+
+    class ParallelMul(Mul):
+        def c_code_cache_version(self):
+            return ()
+
+    class ParallelDiv(Div):
+        def c_code_cache_version(self):
+            return ()
+
+    x, y, z = inputs()
+    e = ParallelAdd()(ParallelMul()(x, y), ParallelDiv()(y, z))
+    cache = theano.gof.cc.get_module_cache()
+    n_compiled = cache.stats[2]
+    orig_compile_jobs = theano.config.cmodule.compile_jobs
+    try:
+        theano.config.cmodule.compile_jobs = 3
+        fn = OpWiseCLinker().accept(Env([x, y, z], [e])).make_function()
+    finally:
+        theano.config.cmodule.compile_jobs = orig_compile_jobs
+    assert fn(2.0, 3.0, 4.0) == 6.75
+    # Each module was compiled once, in parallel, then found in the cache
+    # when the thunks were built.
+    assert cache.stats[2] - n_compiled == 3
+
+
 def test_opwiseclinker_constant():
     x, y, z = inputs()
     x = Constant(tdouble, 7.2, name='x')
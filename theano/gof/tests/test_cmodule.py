@@ -6,9 +6,18 @@ deterministic based on the input type and the op.
 """
 from __future__ import absolute_import, print_function, division
 
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from nose.plugins.skip import SkipTest
 import numpy as np
 
 import theano
+from theano.gof import cmodule, compilelock
 from theano.gof.cmodule import GCC_compiler
 
 
@@ -69,3 +78,210 @@ def test_flag_detection():
     # but was not detected because that path is not usually taken,
     # so we test it here directly.
     GCC_compiler.try_flags(["-lblas"])
+
+
+def test_lock_key_ctx():
+    # The same key excludes other threads, different keys do not.
+    lock_dir = tempfile.mkdtemp()
+    events = []
+
+    def hold(key, delay):
+        with compilelock.lock_key_ctx(key, lock_dir=lock_dir):
+            events.append(('in', key))
+            time.sleep(delay)
+            events.append(('out', key))
+
+    threads = [threading.Thread(target=hold, args=('a', 0.3))]
+    threads[0].start()
+    time.sleep(0.1)
+    threads.append(threading.Thread(target=hold, args=('a', 0)))
+    threads.append(threading.Thread(target=hold, args=('b', 0)))
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+    # 'b' got its lock while the first 'a' was still held.
+    assert events.index(('out', 'b')) < events.index(('out', 'a'))
+    # The second 'a' waited for the first one.
+    assert events[events.index(('out', 'a')) + 1:].count(('in', 'a')) == 1
+    shutil.rmtree(lock_dir)
+
+
+def test_clear_key_locks():
+    # Only the lock files that are not held are removed.
+    lock_dir = tempfile.mkdtemp()
+    try:
+        with compilelock.lock_key_ctx('b', lock_dir=lock_dir):
+            pass
+        with compilelock.lock_key_ctx('a', lock_dir=lock_dir):
+            compilelock.clear_key_locks(lock_dir, min_age=3600)
+            assert sorted(os.listdir(lock_dir)) == ['a', 'b']
+            compilelock.clear_key_locks(lock_dir)
+            assert os.listdir(lock_dir) == ['a']
+        compilelock.clear_key_locks(lock_dir)
+        assert os.listdir(lock_dir) == []
+        # The locks of the threads are only kept while in use.
+        assert not compilelock._key_thread_locks
+    finally:
+        shutil.rmtree(lock_dir)
+
+
+def test_lock_key_ctx_error():
+    # The lock file is closed if it can't be locked.
+    if not os.path.isdir('/proc/self/fd'):
+        raise SkipTest('Needs /proc/self/fd')
+
+    class FailingFcntl(object):
+        LOCK_EX = LOCK_UN = 0
+
+        def lockf(self, f, flags):
+            raise IOError(errno.ENOLCK, 'No locks available')
+
+    lock_dir = tempfile.mkdtemp()
+    fcntl = compilelock.fcntl
+    n_fds = len(os.listdir('/proc/self/fd'))
+    try:
+        compilelock.fcntl = FailingFcntl()
+        try:
+            with compilelock.lock_key_ctx('a', lock_dir=lock_dir):
+                pass
+        except IOError:
+            pass
+        else:
+            raise AssertionError('Expected an IOError')
+    finally:
+        compilelock.fcntl = fcntl
+        shutil.rmtree(lock_dir)
+    assert len(os.listdir('/proc/self/fd')) == n_fds
+    assert not compilelock._key_thread_locks
+
+
+def test_refresh_keeps_new_empty_dirs():
+    # A new empty directory may be where another process is about to
+    # compile a module.
+    dirname = tempfile.mkdtemp()
+    try:
+        cache = cmodule.ModuleCache(dirname, use_index=False)
+        workdir = cmodule.dlimport_workdir(dirname)
+        cache.refresh()
+        assert os.path.isdir(workdir)
+        old = time.time() - 2 * cache.empty_dir_min_age
+        os.utime(workdir, (old, old))
+        cache.refresh()
+        assert not os.path.exists(workdir)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def add_fake_module(dirname, module_hash, size=0):
+    # Add to the cache `dirname` a versioned module that can't be imported.
+    root = tempfile.mkdtemp(dir=dirname)
+    with open(os.path.join(root, 'mod.so'), 'w') as f:
+        f.write('x' * size)
+    key = ((1,), ('CLinker.cmodule_key', 'md5:' + module_hash))
+    key_data = cmodule.KeyData(keys=set([key]),
+                               module_hash=module_hash,
+                               key_pkl=os.path.join(root, 'key.pkl'),
+                               entry=os.path.join(root, 'mod.so'))
+    key_data.save_pkl()
+    return key, key_data
+
+
+def test_module_cache_index():
+    # A new ModuleCache only reads the index, and loads a module when its
+    # hash is looked up.
+    dirname = tempfile.mkdtemp()
+    try:
+        def add_module(module_hash):
+            return add_fake_module(dirname, module_hash)
+
+        key1, _ = add_module('h1')
+        cache = cmodule.ModuleCache(dirname, use_index=True)
+        assert key1 in cache.entry_from_key
+        assert os.path.exists(os.path.join(dirname, 'module_index'))
+
+        # Modules compiled later by other processes are appended.
+        key2, key_data2 = add_module('h2')
+        cache._append_to_index(key_data2)
+
+        cache = cmodule.ModuleCache(dirname, use_index=True)
+        assert sorted(cache.index) == ['h1', 'h2']
+        assert not cache.entry_from_key
+        assert cache._load_from_index('h2')
+        assert key2 in cache.entry_from_key
+        assert key1 not in cache.entry_from_key
+
+        # A module is found from the hash of its key, without its source.
+        class NoSource(object):
+            def get_src_code(self):
+                raise AssertionError()
+        assert cache.index_from_key_hash[cmodule.get_key_hash(key1)] == 'h1'
+        assert cache.module_from_key(key1, NoSource(), lazy=True) is not None
+        assert key1 in cache.entry_from_key
+        cache = cmodule.ModuleCache(dirname, use_index=True)
+
+        # A full refresh loads the rest and rewrites the index.
+        cache.refresh()
+        assert key1 in cache.entry_from_key
+        assert not cache.index
+        cache = cmodule.ModuleCache(dirname, use_index=True)
+        assert sorted(cache.index) == ['h1', 'h2']
+        assert sorted(cache.index_from_key_hash.values()) == ['h1', 'h2']
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_module_cache_lazy_and_lru():
+    dirname = tempfile.mkdtemp()
+    max_loaded_modules = theano.config.cmodule.max_loaded_modules
+    try:
+        theano.config.cmodule.max_loaded_modules = 2
+        names = []
+        for i in range(3):
+            root = tempfile.mkdtemp(dir=dirname)
+            open(os.path.join(root, '__init__.py'), 'w').close()
+            with open(os.path.join(root, 'mod.py'), 'w') as f:
+                f.write('def instantiate():\n    return %d\n' % i)
+            names.append(os.path.join(root, 'mod.py'))
+        cache = cmodule.ModuleCache(dirname, do_refresh=False)
+
+        lazy = cache._get_module(names[0], lazy=True)
+        assert not cache.module_from_name
+        assert lazy.instantiate() == 0
+        assert list(cache.module_from_name) == names[:1]
+
+        cache._get_module(names[1])
+        cache._get_module(names[0])
+        # names[1] is now the least recently used one.
+        cache._get_module(names[2])
+        assert list(cache.module_from_name) == [names[0], names[2]]
+        assert cache._get_module(names[1]).instantiate() == 1
+    finally:
+        theano.config.cmodule.max_loaded_modules = max_loaded_modules
+        shutil.rmtree(dirname)
+
+
+def test_module_cache_size_and_hits():
+    dirname = tempfile.mkdtemp()
+    try:
+        now = time.time()
+        keys = []
+        for i in range(3):
+            key, key_data = add_fake_module(dirname, 'h%d' % i, size=10000)
+            # h0 is the least recently used.
+            os.utime(key_data.entry, (now - 300 + 100 * i, now))
+            keys.append(key)
+        cache = cmodule.ModuleCache(dirname, use_index=False)
+        assert cache._get_from_key(keys[2], lazy=True) is not None
+        cache.save_hits()
+        assert list(cmodule.get_module_hits(dirname).values()) == [1]
+
+        cache.clear_to_size(25000)
+        assert keys[0] not in cache.entry_from_key
+        assert keys[1] in cache.entry_from_key
+        assert len([d for d in os.listdir(dirname)
+                    if d.startswith('tmp')]) == 2
+        cache._compact_hits()
+        assert list(cmodule.get_module_hits(dirname).values()) == [1]
+    finally:
+        shutil.rmtree(dirname)
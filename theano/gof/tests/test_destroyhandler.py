@@ -1,6 +1,11 @@
 from __future__ import absolute_import, print_function, division
 
+from collections import OrderedDict
+
+import numpy
+from six import iteritems
 from six.moves import xrange
+from theano.configparser import change_flags
 from theano.gof.type import Type
 from theano.gof import graph
 from theano.gof.graph import Variable, Apply
@@ -477,3 +482,120 @@ def test_multiple_inplace():
     OpSubOptimizer(multiple_in_place_1, multiple_in_place_0_1, fail).optimize(g)
     consistent(g)
     assert fail.failures == 1
+
+
+def check_order(g):
+    # Check that the topological order kept by the DestroyHandler is valid.
+    dh = g.destroy_handler
+    if not dh.destroyers:
+        # The cycles are only checked when there are inplace ops.
+        return
+    assert not dh.toposort.stale
+    ords = dh.orderings(g)
+    assert not destroyhandler._contains_cycle(g, ords)
+    pos = dh.toposort.pos
+    assert set(pos) == set(g.apply_nodes)
+    for app in g.apply_nodes:
+        for d in ords.get(app, []):
+            assert pos[d] < pos[app]
+        for input in app.inputs:
+            if input.owner:
+                assert pos[input.owner] < pos[app]
+
+
+def test_incremental_cycle_detection():
+    with change_flags(cycle_detection='incremental'):
+        x, y, z = inputs()
+        e1 = add(x, z)
+        e2 = add(x, sigmoid(sigmoid(sigmoid(y))))
+        e3 = add_in_place(z, y)
+        g = Env([x, y, z], [e1, e2, e3])
+        check_order(g)
+        # The new node must come after e2 (which reads x) and before e3
+        # (which destroys z): e2 and its inputs have to be moved before
+        # e3.
+        g.replace_validate(e1, add_in_place(x, z))
+        check_order(g)
+        # This would read x both before and after it is destroyed.
+        try:
+            g.replace_validate(e2, add(x, g.outputs[0]))
+            raise Exception("Shouldn't have reached this point.")
+        except InconsistencyError:
+            pass
+        consistent(g)
+        check_order(g)
+
+
+def test_incremental_cycle_detection_random():
+    # The topological order kept by the DestroyHandler must accept the
+    # same replacements as a sort of the whole graph, and stay valid.
+    rng = numpy.random.RandomState(42)
+    with change_flags(cycle_detection='incremental'):
+        x, y, z = inputs()
+        vs = [x, y, z]
+        for i in range(30):
+            a, b = [vs[j] for j in rng.randint(len(vs), size=2)]
+            vs.append(transpose_view(a) if i % 7 == 3 else add(a, b))
+        g = Env([x, y, z], vs[-3:])
+        n_fail = 0
+        for i in range(50):
+            nodes = [n for n in g.toposort() if n.op == add]
+            if not nodes:
+                break
+            node = nodes[rng.randint(len(nodes))]
+            if rng.rand() < 0.7:
+                new = add_in_place(*node.inputs)
+            else:
+                new = add(node.inputs[1], node.inputs[0])
+            try:
+                g.replace_validate(node.outputs[0], new)
+            except InconsistencyError:
+                n_fail += 1
+                # The rejected edges are checked again at the next
+                # validation.
+                g.validate()
+            check_order(g)
+        assert 0 < n_fail < i
+
+
+def test_dynamic_toposort_random_orderings():
+    # Several orderings can change at once, and go against the current
+    # order. The result must be the one of _contains_cycle and, without a
+    # cycle, the order must stay valid.
+    rng = numpy.random.RandomState(0)
+    xs = [MyVariable(str(i)) for i in range(4)]
+    outputs = [sigmoid(x) for x in xs]
+    outputs += [add(outputs[0], outputs[1]), sigmoid(outputs[2])]
+    g = FunctionGraph(xs, outputs, clone=False)
+    nodes = [out.owner for out in outputs]
+    n_cycle = 0
+    for run in range(200):
+        toposort = destroyhandler._DynamicToposort()
+        ords = OrderedDict()
+        assert not toposort.contains_cycle(g, ords)
+        for step in range(10):
+            new = OrderedDict((app, list(deps))
+                              for app, deps in iteritems(ords))
+            for i in range(rng.randint(1, 4)):
+                a, b = rng.randint(len(nodes), size=2)
+                deps = new.setdefault(nodes[a], [])
+                if nodes[b] not in deps:
+                    deps.append(nodes[b])
+            cycle = destroyhandler._contains_cycle(g, new)
+            assert toposort.contains_cycle(g, new) == cycle
+            if cycle:
+                n_cycle += 1
+                # Go back to the previous orderings.
+                assert not toposort.contains_cycle(g, ords)
+            else:
+                ords = new
+            if not toposort.stale:
+                pos = toposort.pos
+                assert len(set(pos.values())) == len(nodes)
+                for app in nodes:
+                    for d in ords.get(app, []):
+                        assert pos[d] < pos[app]
+                    for input in app.inputs:
+                        if input.owner:
+                            assert pos[input.owner] < pos[app]
+    assert n_cycle > 100
@@ -8,6 +8,7 @@ from nose.plugins.skip import SkipTest
 import theano
 from theano.compat import PY3
 from theano.gof import CachedConstantError, FunctionGraph
+from theano.gof.link import gc_helper
 from theano import tensor as tt
 
 
@@ -30,6 +31,37 @@ class TFunctionGraph(unittest.TestCase):
         s = pickle.dumps(func)
         pickle.loads(s)
 
+    def test_compact(self):
+        x, y = tt.vectors('xy')
+        a = tt.exp(x)
+        b = a * y + 2
+        c = tt.max_and_argmax(b * a, axis=0)[1]
+        fg = FunctionGraph([x, y], [b, c, b + x, y])
+        order = fg.toposort()
+        g = fg.compact(order)
+        assert g.nodes == order
+        assert set(g.variables) == fg.variables
+        assert len(g.variables) == len(fg.variables)
+        assert list(g.outputs) == [g.variable_index[v] for v in fg.outputs]
+        for v, var in enumerate(g.variables):
+            assert g.variable_index[var] == v
+            if var.owner is None:
+                assert g.owner[v] == -1
+            else:
+                assert g.nodes[g.owner[v]] is var.owner
+            clients = sorted((g.node_index.get(node, -1), i)
+                             for node, i in var.clients)
+            assert sorted(g.variable_clients(v)) == clients
+            assert g.is_output[v] == (var in fg.outputs)
+        computed, last_user = gc_helper(order)
+        for i, node in enumerate(order):
+            assert [g.variables[v] for v in g.node_inputs(i)] == node.inputs
+            assert [g.variables[v] for v in g.node_outputs(i)] == node.outputs
+            assert [g.variables[v] for v in g.last_uses()[i]] == [
+                var for var in node.inputs
+                if var in computed and var not in fg.outputs and
+                last_user[var] is node]
+
     def test_node_outputs_not_used(self):
         # In the past, we where removing some not used variable from
         # fgraph.variables event if the apply had other output used in
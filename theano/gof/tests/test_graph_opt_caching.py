@@ -1,41 +1,120 @@
 from __future__ import absolute_import, print_function, division
 import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
 import numpy as np
 import theano
 import theano.tensor as T
+from theano.compile import optcache
+from theano.configparser import change_flags
 
 floatX = 'float32'
 
 
-def test_graph_opt_caching():
-    opt_db_file = theano.config.compiledir + '/optimized_graphs.pkl'
-    os.system('rm %s' % opt_db_file)
+@contextmanager
+def temp_optimization_cache():
+    # Use an empty cache in a new directory instead of the one of the
+    # compiledir, which keeps the graphs of previous runs.
+    dirname = tempfile.mkdtemp()
+    cache = optcache.OptimizationCache(dirname)
+    get_optimization_cache = optcache.get_optimization_cache
+    optcache.get_optimization_cache = lambda: cache
+    try:
+        with change_flags(cache_optimizations=True):
+            yield cache
+    finally:
+        optcache.get_optimization_cache = get_optimization_cache
+        shutil.rmtree(dirname)
+
 
+def test_graph_opt_caching():
     mode = theano.config.mode
     if mode in ["DEBUG_MODE", "DebugMode"]:
         mode = "FAST_RUN"
-    default = theano.config.cache_optimizations
-    try:
-        theano.config.cache_optimizations = True
+    with temp_optimization_cache():
+        hit = optcache.stats['hit']
         a = T.fmatrix('a')
         b = T.fmatrix('b')
         c = theano.shared(np.ones((10, 10), dtype=floatX))
         d = theano.shared(np.ones((10, 10), dtype=floatX))
         e = T.sum(T.sum(T.sum(a ** 2 + b) + c) + d)
         f1 = theano.function([a, b], e, mode=mode)
+        assert optcache.stats['hit'] == hit
 
+        # Same structure, different variables and shared values.
         m = T.fmatrix('x1')
         n = T.fmatrix('x2')
-        p = theano.shared(np.ones((10, 10), dtype=floatX))
-        q = theano.shared(np.ones((10, 10), dtype=floatX))
+        p = theano.shared(2 * np.ones((10, 10), dtype=floatX))
+        q = theano.shared(3 * np.ones((10, 10), dtype=floatX))
         j = T.sum(T.sum(T.sum(m ** 2 + n) + p) + q)
         f2 = theano.function([m, n], j, mode=mode)
+        assert optcache.stats['hit'] == hit + 1
 
         in1 = np.ones((10, 10), dtype=floatX)
         in2 = np.ones((10, 10), dtype=floatX)
-        assert f1(in1, in2) == f2(in1, in2)
-    finally:
-        theano.config.cache_optimizations = default
 
-if __name__ == '__main__':
-    test_graph_opt_caching()
+        def expected(c, d):
+            return np.sum(np.sum(np.sum(in1 ** 2 + in2) + c) + d)
+        assert np.allclose(f1(in1, in2), expected(c.get_value(),
+                                                  d.get_value()))
+        assert np.allclose(f2(in1, in2), expected(p.get_value(),
+                                                  q.get_value()))
+
+
+def test_graph_opt_caching_updates():
+    mode = theano.config.mode
+    if mode in ["DEBUG_MODE", "DebugMode"]:
+        mode = "FAST_RUN"
+    with temp_optimization_cache():
+        fs = []
+        for i in range(2):
+            x = T.dvector('x')
+            s = theano.shared(np.zeros(3))
+            fs.append((theano.function([x], s * 2, updates=[(s, s + x)],
+                                       mode=mode), s))
+        for f, s in fs:
+            f(np.ones(3))
+            assert np.allclose(f(np.ones(3)), 2)
+            assert np.allclose(s.get_value(), 2)
+
+
+def test_graph_opt_caching_flags():
+    # Flags out of the C key can change the optimized graph too.
+    mode = theano.config.mode
+    if mode in ["DEBUG_MODE", "DebugMode"]:
+        mode = "FAST_RUN"
+    with temp_optimization_cache():
+        def compile():
+            x = T.dvector('x')
+            return theano.function([x], T.exp(x) * 2 + 1, mode=mode)
+        hit, miss = optcache.stats['hit'], optcache.stats['miss']
+        compile()
+        assert optcache.stats['miss'] == miss + 1
+        compile()
+        assert optcache.stats['hit'] == hit + 1
+        with change_flags(**{'tensor.local_elemwise_fusion': False}):
+            compile()
+        assert optcache.stats['hit'] == hit + 1
+        assert optcache.stats['miss'] == miss + 2
+
+
+def test_graph_opt_caching_eviction():
+    dirname = tempfile.mkdtemp()
+    try:
+        cache = optcache.OptimizationCache(
+            os.path.join(dirname, 'optimized_graphs'), max_entries=2)
+        x = T.dvector('x')
+        fgraph = theano.gof.FunctionGraph([x], [x * 2])
+        for i in range(4):
+            cache.store('k%d' % i, fgraph)
+            os.utime(cache._entry_path('k%d' % i), (i, i))
+        # Storing evicts down to max_entries, oldest first.
+        cache.evict()
+        assert cache.load('k0') is None
+        assert cache.load('k1') is None
+        inputs, outputs = cache.load('k3')
+        assert len(inputs) == 1 and len(outputs) == 1
+    finally:
+        shutil.rmtree(dirname)
@@ -537,6 +537,33 @@ class TestMergeOptimizer:
                         if isinstance(n.op, NoInputOp)]
         assert len(no_input_ops) == 2, fg.apply_nodes
 
+    def test_merge_signature(self):
+        # x has many clients, the merge candidates are found by their
+        # signature.
+        x, y, z = inputs()
+        outputs = ([op2(x, op3(x, y)) for i in range(50)] +
+                   [op2(x, op3(x, z)) for i in range(50)])
+        g = FunctionGraph([x, y, z], outputs)
+        prof = MergeOptimizer().optimize(g)
+        assert len(g.apply_nodes) == 4
+        assert len(set(g.outputs)) == 2
+        nb_sig_hit, nb_sig_miss, nb_sig_scan = prof[7:]
+        assert nb_sig_hit > 0
+        assert nb_sig_scan == 0
+        assert len(g.merge_feature.sig_nodes) == 4
+
+    def test_merge_unhashable(self):
+        # Nodes whose op is not hashable are merged too.
+        class UnhashableOp(MyOp):
+            __hash__ = None
+        op = UnhashableOp('OpU', x=1)
+        x, y, z = inputs()
+        e = op1(op(x, y), op(x, y), op(x, z))
+        g = FunctionGraph([x, y, z], [e])
+        prof = MergeOptimizer().optimize(g)
+        assert str(g) == "[Op1(*1 -> OpU(x, y), *1, OpU(x, z))]"
+        assert prof[9] > 0
+
 
 class TestEquilibrium(object):
 
@@ -571,6 +598,62 @@ class TestEquilibrium(object):
         opt.optimize(g)
         assert str(g) == '[Op2(x, y)]'
 
+    def test_worklist(self):
+        def canonical(g):
+            # The graph as a string, with the nodes numbered in the order
+            # of a depth first traversal from the outputs.
+            ids = {}
+
+            def expr(v):
+                if v.owner is None:
+                    return str(v)
+                if v not in ids:
+                    ids[v] = len(ids)
+                    return '*%i -> %s(%s)' % (
+                        ids[v], v.owner.op,
+                        ', '.join(expr(i) for i in v.owner.inputs))
+                return '*%i' % ids[v]
+            return [expr(o) for o in g.outputs]
+
+        def optimize(worklist):
+            x, y, z = map(MyVariable, 'xyz')
+            e = op3(x, y)
+            for i in range(20):
+                e = op1(op1(e), op3(e, z))
+            g = FunctionGraph([x, y, z], [e])
+            opt = EquilibriumOptimizer(
+                [PatternSub((op1, (op2, 'x', 'y')), (op4, 'x', 'y')),
+                 PatternSub((op3, 'x', 'y'), (op4, 'x', 'y')),
+                 PatternSub((op4, 'x', 'y'), (op5, 'x', 'y')),
+                 PatternSub((op5, 'x', 'y'), (op6, 'x', 'y')),
+                 PatternSub((op6, 'x', 'y'), (op2, 'x', 'y'))
+                 ],
+                max_use_ratio=10, worklist=worklist)
+            prof = opt.optimize(g)
+            # The number of visited nodes
+            return canonical(g), sum(prof[5])
+        g, nb_visited = optimize(False)
+        g_worklist, nb_visited_worklist = optimize(True)
+        assert g_worklist == g
+        assert nb_visited_worklist < nb_visited
+
+    def test_worklist_order(self):
+        # A(B(D(y))) becomes C(D(y)) if A is rewritten first and A(E(y))
+        # if B is. A full pass visits A first, so must the worklist.
+        op_a, op_b, op_c, op_d, op_e, op_h, op_k, op_w = [
+            MyOp(name) for name in 'ABCDEHKW']
+        for worklist in [False, True]:
+            y = MyVariable('y')
+            g = FunctionGraph([y], [op_h(op_k(op_w(y)))])
+            EquilibriumOptimizer(
+                [PatternSub((op_h, 'x'), (op_a, 'x')),
+                 PatternSub((op_k, 'x'), (op_b, 'x')),
+                 PatternSub((op_w, 'x'), (op_d, 'x')),
+                 PatternSub((op_a, (op_b, 'x')), (op_c, 'x')),
+                 PatternSub((op_b, (op_d, 'x')), (op_e, 'x'))],
+                max_use_ratio=10, worklist=worklist).optimize(g)
+            assert str(g) == '[C(D(y))]'
+
     @theano.configparser.change_flags(on_opt_error='ignore')
     def test_low_use_ratio(self):
         x, y, z = map(MyVariable, 'xyz')
@@ -0,0 +1,111 @@
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+
+from theano.gof import threadbudget
+from theano.gof.threadbudget import BudgetThunk, ThreadBudget, node_work
+
+
+class FakeSetter(object):
+    def __init__(self):
+        self.threads = 8
+        self.calls = []
+
+    def get_threads(self):
+        return self.threads
+
+    def set_threads(self, n):
+        self.calls.append(n)
+        self.threads = n
+
+
+def test_node_work():
+    assert node_work('openmp', [None, 3]) == 0
+    assert node_work('openmp', [np.zeros(10), np.zeros((2, 3))]) == 10
+    # The multiply-adds of a product of square matrices.
+    assert node_work('blas', [np.zeros((4, 4)), np.zeros((4, 4))]) == 64
+    assert node_work('blas', [np.zeros(5)]) == 5
+
+
+def test_node_threads():
+    budget = ThreadBudget(4, min_work=100)
+    assert budget.node_threads('openmp', [np.zeros(10)]) == 1
+    # Rounded up, so that a node of min_work elements or more runs in
+    # more than one thread.
+    assert budget.node_threads('openmp', [np.zeros(100)]) == 1
+    assert budget.node_threads('openmp', [np.zeros(150)]) == 2
+    assert budget.node_threads('openmp', [np.zeros(250)]) == 3
+    assert budget.node_threads('openmp', [np.zeros(10000)]) == 4
+    assert budget.node_threads('blas', [np.zeros((10, 10))] * 2) == 4
+    # The budget is shared by the nodes run at the same time.
+    budget = ThreadBudget(4, min_work=100, n_concurrent=2)
+    assert budget.node_threads('openmp', [np.zeros(10000)]) == 2
+    budget = ThreadBudget(4, min_work=100, n_concurrent=8)
+    assert budget.node_threads('openmp', [np.zeros(10000)]) == 1
+
+
+def test_budget_thunk():
+    setter = FakeSetter()
+    seen = []
+
+    def thunk():
+        seen.append(setter.threads)
+    thunk.inputs = [[np.zeros(250)]]
+    thunk.lazy = False
+    thunk.cthunk = None
+
+    class FakeOp(object):
+        thread_budget_kind = 'openmp'
+        openmp = True
+
+    class FakeNode(object):
+        op = FakeOp()
+
+    old_setters = dict(threadbudget._setters)
+    threadbudget._setters['openmp'] = setter
+    try:
+        budget = ThreadBudget(4, min_work=100)
+        wrapped, = budget.wrap_thunks([FakeNode()], [thunk])
+        # Without OpenMP, the thunk is left alone.
+        FakeNode.op.openmp = False
+        assert budget.wrap_thunks([FakeNode()], [thunk]) == [thunk]
+    finally:
+        threadbudget._setters.clear()
+        threadbudget._setters.update(old_setters)
+    assert isinstance(wrapped, BudgetThunk)
+    wrapped()
+    assert seen == [3]
+    # The number of threads is restored.
+    assert setter.threads == 8
+    thunk.inputs[0][0] = np.zeros(1000)
+    wrapped.inputs = thunk.inputs
+    wrapped()
+    assert seen == [3, 4]
+    assert setter.calls == [3, 8, 4, 8]
+
+
+def test_budget_thunk_blas():
+    def thunk():
+        pass
+    thunk.lazy = False
+    thunk.cthunk = None
+
+    class FakeOp(object):
+        thread_budget_kind = 'blas'
+
+    class FakeNode(object):
+        op = FakeOp()
+
+    old_setters = dict(threadbudget._setters)
+    threadbudget._setters['blas'] = FakeSetter()
+    try:
+        budget = ThreadBudget(4, min_work=100)
+        wrapped, = budget.wrap_thunks([FakeNode()], [thunk])
+        assert isinstance(wrapped, BudgetThunk)
+        # The threads of BLAS are shared by the whole process, so they are
+        # left alone when nodes run at the same time.
+        budget = ThreadBudget(4, min_work=100, n_concurrent=2)
+        assert budget.wrap_thunks([FakeNode()], [thunk]) == [thunk]
+    finally:
+        threadbudget._setters.clear()
+        threadbudget._setters.update(old_setters)
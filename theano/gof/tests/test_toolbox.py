@@ -4,8 +4,8 @@ from theano.gof.graph import Variable, Apply
 from theano.gof.type import Type
 from theano.gof.op import Op
 
-from theano.gof.fg import FunctionGraph
-from theano.gof.toolbox import NodeFinder
+from theano.gof.fg import FunctionGraph, InconsistencyError
+from theano.gof.toolbox import Feature, NodeFinder, ReplaceValidate
 
 
 def as_variable(x):
@@ -86,3 +86,46 @@ class TestNodeFinder:
         for type, num in ((add, 4), (sigmoid, 3), (dot, 1)):
             if not len([t for t in g.get_nodes(type)]) == num:
                 raise Exception("Expected: %i times %s" % (num, type))
+
+
+class NoDot(Feature):
+
+    def __init__(self):
+        self.nb_validate = 0
+
+    def validate(self, fgraph):
+        self.nb_validate += 1
+        if any(node.op == dot for node in fgraph.apply_nodes):
+            raise InconsistencyError("dot")
+
+
+class TestReplaceValidate:
+
+    def test_replace_all_validate_batch(self):
+        x, y, z = inputs()
+        sx, sy, sz = sigmoid(x), sigmoid(y), sigmoid(z)
+        e = add(add(sx, sy), add(sz, x))
+        g = FunctionGraph([x, y, z], [e], clone=False)
+        g.attach_feature(ReplaceValidate())
+        no_dot = NoDot()
+        g.attach_feature(no_dot)
+
+        candidates = [lambda: [(sx, add(x, x))],
+                      lambda: [(sy, dot(y, y))],
+                      lambda: [(sz, add(z, z))],
+                      lambda: [(sz.owner.inputs[0], dot(x, y))]]
+        accepted = g.replace_all_validate_batch(candidates)
+        assert accepted == [True, False, True, False]
+        # Validate all, each half, then each candidate.
+        assert no_dot.nb_validate == 7
+        g.validate()
+        assert sx not in g.variables
+        assert sy in g.variables
+        assert sz not in g.variables
+        assert len([n for n in g.apply_nodes if n.op == add]) == 5
+
+        # Valid candidates only need one validation.
+        no_dot.nb_validate = 0
+        assert g.replace_all_validate_batch(
+            [lambda: [(sy, sigmoid(x))]]) == [True]
+        assert no_dot.nb_validate == 1
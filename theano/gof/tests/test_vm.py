@@ -1,12 +1,13 @@
 from __future__ import absolute_import, print_function, division
 import gc
 import sys
+import threading
 import time
 import unittest
 
 from nose.plugins.skip import SkipTest
 import numpy as np
-from six import itervalues
+from six import iteritems, itervalues
 
 from theano import function
 from theano.gof import vm
@@ -453,3 +454,303 @@ def test_reallocation():
         assert check_storage(storage_map)[0]
         assert len(set(id(v) for v in
                        itervalues(storage_map))) < len(storage_map)
+
+
+class SleepOp(theano.Op):
+    """Return its input after sleeping, and record how many run at once."""
+
+    __props__ = ()
+    running = [0, 0]  # running, max running
+    lock = threading.Lock()
+
+    def make_node(self, x):
+        return theano.Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        with self.lock:
+            self.running[0] += 1
+            self.running[1] = max(self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running[0] -= 1
+        outputs[0][0] = inputs[0] + 1
+
+
+class InterruptOp(theano.Op):
+    """Raise KeyboardInterrupt."""
+
+    __props__ = ()
+
+    def make_node(self, x):
+        return theano.Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        raise KeyboardInterrupt()
+
+
+def test_parallel_loop():
+    x = tensor.dvector('x')
+    outs = [SleepOp()(x * i) for i in range(4)]
+    z = tensor.exp(x) + sum(outs)
+    # Inplace ops that need the orderings of the DestroyHandler.
+    w = tensor.sqr(tensor.exp(x)) + tensor.tanh(x)
+    for allow_gc in [True, False]:
+        SleepOp.running[1] = 0
+        linker = vm.VM_Linker(allow_gc=allow_gc, use_cloop=False,
+                              n_threads=4)
+        f = theano.function([x], [z, w], mode=Mode(linker=linker))
+        assert isinstance(f.fn, vm.ParallelLoop)
+        v = np.arange(3.)
+        r = f(v)
+        expected = np.exp(v) + sum(v * i + 1 for i in range(4))
+        assert np.allclose(r[0], expected)
+        assert np.allclose(r[1], np.exp(v) ** 2 + np.tanh(v))
+        assert SleepOp.running[1] > 1
+        assert np.allclose(f(v)[0], expected)
+        if allow_gc:
+            fgraph = f.maker.fgraph
+            for var, cell in iteritems(f.fn.storage_map):
+                if var.owner and var not in fgraph.outputs:
+                    assert cell[0] is None
+
+    # The errors are raised with the node that failed.
+    y = tensor.dvector('y')
+    f = theano.function([x, y], [SleepOp()(x), x + y],
+                        mode=Mode(linker=vm.VM_Linker(use_cloop=False,
+                                                      n_threads=2)))
+    try:
+        f(np.ones(2), np.ones(3))
+        assert False
+    except ValueError as e:
+        assert 'Elemwise{add' in str(e)
+    assert SleepOp.running[0] == 0
+
+    # Exceptions that are not an Exception are raised in the main thread
+    # too, instead of waiting forever for the result of the worker.
+    f = theano.function([x], [SleepOp()(x), InterruptOp()(x)],
+                        mode=Mode(linker=vm.VM_Linker(use_cloop=False,
+                                                      n_threads=2)))
+    raised = []
+
+    def call():
+        try:
+            f(np.ones(2))
+        except KeyboardInterrupt:
+            raised.append(True)
+    thread = threading.Thread(target=call)
+    thread.daemon = True
+    thread.start()
+    thread.join(10)
+    assert raised == [True]
+    assert SleepOp.running[0] == 0
+
+
+def test_plan_storage():
+    x = tensor.dvector('x')
+    y = tensor.dvector('y')
+    z = tensor.tanh(3 * x + y) + tensor.cosh(x + 5 * y)
+    default = theano.config.vm.plan_storage
+    try:
+        theano.config.vm.plan_storage = True
+        for allow_gc in [True, False]:
+            linker = vm.VM_Linker(allow_gc=allow_gc, lazy=False,
+                                  use_cloop=False)
+            mode = theano.Mode(linker=linker).excluding('fusion', 'inplace')
+            f = theano.function([x, y], z, mode=mode)
+            assert np.allclose(f([1, 2], [3, 4]),
+                               np.tanh([6, 10]) + np.cosh([16, 22]))
+            assert np.allclose(f([0, 0], [1, 1]),
+                               np.tanh([1, 1]) + np.cosh([5, 5]))
+            storage_map = f.fn.storage_map
+            assert len(set(id(v) for v in
+                           itervalues(storage_map))) < len(storage_map)
+            # The thunks use the shared storage.
+            for node, thunk in zip(f.fn.nodes, f.fn.thunks):
+                for out, cell in zip(node.outputs, thunk.outputs):
+                    assert cell is storage_map[out]
+
+        # With lazy nodes, the Stack VM is used and nothing is shared.
+        c = tensor.scalar('c')
+        f = theano.function([c, x, y], ifelse(c, tensor.tanh(x + y),
+                                              tensor.exp(x * y)),
+                            mode=theano.Mode(linker=vm.VM_Linker(
+                                use_cloop=False)))
+        assert isinstance(f.fn, vm.Stack)
+        storage_map = f.fn.storage_map
+        assert len(set(id(v) for v in
+                       itervalues(storage_map))) == len(storage_map)
+        assert np.allclose(f(1, [1], [2]), np.tanh(3))
+    finally:
+        theano.config.vm.plan_storage = default
+
+
+class ReuseOp(theano.Op):
+    """Add 1 to its input, reusing its output storage like C code does."""
+
+    __props__ = ()
+
+    def make_node(self, x):
+        return theano.Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        x, = inputs
+        z = outputs[0]
+        if z[0] is None or z[0].shape != x.shape:
+            z[0] = np.empty_like(x)
+        np.add(x, 1, out=z[0])
+
+
+def test_buffer_pool():
+    x = tensor.dvector('x')
+    z = ReuseOp()(ReuseOp()(ReuseOp()(x)) * 2)
+    default = theano.config.vm.buffer_pool_size
+    try:
+        theano.config.vm.buffer_pool_size = 1
+        profile = theano.compile.ProfileStats(atexit_print=False)
+        linker = vm.VM_Linker(allow_gc=True, lazy=False, use_cloop=False)
+        f = theano.function([x], z, mode=theano.Mode(linker=linker),
+                            profile=profile)
+        assert isinstance(f.fn, vm.LoopPool)
+        pool = f.fn.buffer_pool
+        v = np.arange(3.)
+        assert np.allclose(f(v), (v + 2) * 2 + 1)
+        assert pool.hits == 0
+        assert pool.n_bytes > 0
+        # The intermediate results are freed in the pool
+        for node in f.maker.fgraph.toposort():
+            for out in node.outputs:
+                if out not in f.maker.fgraph.outputs:
+                    assert f.fn.storage_map[out][0] is None
+        assert np.allclose(f(v + 1), (v + 3) * 2 + 1)
+        assert np.allclose(f(v), (v + 2) * 2 + 1)
+        assert profile.buffer_pool_hits > 0
+        # A different shape misses.
+        assert np.allclose(f(np.ones(4)), [7] * 4)
+        assert profile.buffer_pool_misses > 0
+        # The returned value is not put in the pool.
+        r = f(v)
+        f(v + 1)
+        assert np.allclose(r, (v + 2) * 2 + 1)
+
+        f.free()
+        assert pool.n_bytes == 0
+
+        theano.config.vm.buffer_pool_size = 0
+        f = theano.function([x], z, mode=theano.Mode(linker=linker))
+        assert not isinstance(f.fn, vm.LoopPool)
+    finally:
+        theano.config.vm.buffer_pool_size = default
+
+    pool = vm.BufferPool(16)
+    # Above the limit.
+    cell = [np.zeros(3)]
+    pool.put_cell(cell)
+    assert cell[0] is None and pool.n_bytes == 0
+    # Still referenced by a view.
+    cell = [np.zeros(2)]
+    view = cell[0][1:]
+    pool.put_cell(cell)
+    assert pool.n_bytes == 0
+    del view
+    cell = [np.zeros(2)]
+    pool.put_cell(cell)
+    assert pool.n_bytes == 16
+    assert pool.get((np.dtype('float64'), (2,))) is not None
+    assert pool.get((np.dtype('float64'), (2,))) is None
+    assert pool.hits == 1 and pool.misses == 1
+
+    try:
+        vm.LoopPool([], [], [], [], pool, [[]])
+    except ValueError as e:
+        assert 'one entry per node' in str(e)
+    else:
+        raise AssertionError("Expected a ValueError")
+
+
+def test_incremental():
+    W = tensor.dmatrix('W')
+    q = tensor.dvector('q')
+    z = tensor.dot(tensor.tanh(W), q) + tensor.exp(q).sum()
+    runs = []
+
+    def callback(node, thunk, storage_map, compute_map):
+        runs.append(str(node.op))
+
+    linker = vm.VM_Linker(use_cloop=True, callback=callback,
+                          incremental=True)
+    f = function([W, q], z, mode=Mode(linker=linker, optimizer=None))
+    assert isinstance(f.fn, vm.Stack) and f.fn.incremental
+    w_val = np.random.rand(3, 4)
+    q_val = np.random.rand(4)
+
+    def expected(q_val):
+        return np.dot(np.tanh(w_val), q_val) + np.exp(q_val).sum()
+
+    assert np.allclose(f(w_val, q_val), expected(q_val))
+    n_nodes = len(f.maker.fgraph.apply_nodes)
+    assert len(runs) == n_nodes
+    assert 'Elemwise{tanh,no_inplace}' in runs
+    # Only the nodes that depend on q run again.
+    del runs[:]
+    q_val = q_val + 1
+    assert np.allclose(f(w_val, q_val), expected(q_val))
+    assert 'Elemwise{tanh,no_inplace}' not in runs
+    assert 0 < len(runs) < n_nodes
+    # Nothing changed: only the node of the output, which is not
+    # borrowed, runs.
+    del runs[:]
+    assert np.allclose(f(w_val, q_val), expected(q_val))
+    assert len(runs) == 1
+    # A new value for W, even equal, is a change.
+    del runs[:]
+    w_val = w_val.copy()
+    assert np.allclose(f(w_val, q_val), expected(q_val))
+    assert 'Elemwise{tanh,no_inplace}' in runs
+    # After an error, everything is recomputed.
+    try:
+        f(w_val, np.ones(5))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected a shape error")
+    del runs[:]
+    assert np.allclose(f(w_val, q_val), expected(q_val))
+    assert len(runs) == n_nodes
+
+    # With inplace optimizations, the destroyed variables are recomputed.
+    x = tensor.dvector('x')
+    y = tensor.dvector('y')
+    c = tensor.exp(x)
+    z = (c * 2 + y) * 3, c.sum()
+    f = function([x, y], z,
+                 mode=Mode(linker=vm.VM_Linker(incremental=True),
+                           optimizer='fast_run'))
+    x_val = np.random.rand(3)
+    for y_val in [np.zeros(3), np.ones(3), np.zeros(3)]:
+        out = f(x_val, y_val)
+        assert np.allclose(out[0], (np.exp(x_val) * 2 + y_val) * 3)
+        assert np.allclose(out[1], np.exp(x_val).sum())
+
+
+def test_incremental_shared():
+    # The updates of other functions modify the value of a shared variable
+    # inplace, its version tells that it changed.
+    w_val = np.random.rand(3, 4)
+    W = theano.shared(w_val.copy(), 'W')
+    q = tensor.dvector('q')
+    f = function([q], tensor.dot(tensor.tanh(W), q),
+                 mode=Mode(linker=vm.VM_Linker(incremental=True),
+                           optimizer=None))
+    train = function([], [], updates=[(W, W - 1)],
+                     mode=Mode(linker=vm.VM_Linker(), optimizer='fast_run'))
+    q_val = np.random.rand(4)
+    assert np.allclose(f(q_val), np.dot(np.tanh(w_val), q_val))
+    w_storage = W.get_value(borrow=True)
+    train()
+    assert W.get_value(borrow=True) is w_storage
+    assert np.allclose(f(q_val), np.dot(np.tanh(w_val - 1), q_val))
+    trust = train.trusted_caller()
+    trust()
+    assert np.allclose(f(q_val), np.dot(np.tanh(w_val - 2), q_val))
+    W.set_value(w_val)
+    assert np.allclose(f(q_val), np.dot(np.tanh(w_val), q_val))
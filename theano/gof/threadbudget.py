@@ -0,0 +1,239 @@
+"""
+Per-call control of the number of threads of OpenMP loops and BLAS calls.
+
+The C code of Ops like `Elemwise` runs OpenMP loops, and the BLAS Ops call a
+BLAS library that has its own pool of threads. Left alone, each uses as
+many threads as it wants, so in one function the small nodes pay the cost
+of starting threads while, with a `ParallelLoop`, concurrent nodes ask for
+more threads than there are cores.
+
+A `ThreadBudget` is made for each function by `VM_Linker` when the flag
+``openmp_thread_budget`` (or the linker parameter ``thread_budget``) is
+set. Before running the C thunk of a node whose Op declares a
+`thread_budget_kind`, it computes from the sizes of the inputs of this
+call how many threads the node can use, and sets it with
+``omp_set_num_threads`` or the thread setter of the BLAS library.
+
+``omp_set_num_threads`` only changes the threads of the calling thread,
+but the BLAS setters change a setting of the whole process. So when nodes
+run at the same time, the BLAS nodes are left alone: one node would set
+the threads of another, or restore them while the other runs.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+
+import numpy as np
+
+from theano.configparser import config
+
+_logger = logging.getLogger('theano.gof.threadbudget')
+
+
+class ThreadSetter(object):
+    """
+    Get and set the number of threads of a library through ctypes.
+
+    Parameters
+    ----------
+    get_threads
+        Function without argument returning the number of threads.
+    set_threads
+        Function setting the number of threads.
+
+    """
+
+    def __init__(self, get_threads, set_threads):
+        self.get_threads = get_threads
+        self.set_threads = set_threads
+
+
+def _load_library(name, dirs=()):
+    # Return the ctypes library `name` (without lib prefix), or None.
+    for d in dirs:
+        for ext in ('.so', '.dylib'):
+            path = os.path.join(d, 'lib' + name + ext)
+            if os.path.exists(path):
+                try:
+                    return ctypes.CDLL(path)
+                except OSError:
+                    pass
+    path = ctypes.util.find_library(name)
+    if path is None:
+        return None
+    try:
+        return ctypes.CDLL(path)
+    except OSError:
+        return None
+
+
+def _find_openmp_setter():
+    lib = _load_library('gomp') or _load_library('iomp5')
+    if lib is None:
+        return None
+    try:
+        return ThreadSetter(lib.omp_get_max_threads, lib.omp_set_num_threads)
+    except AttributeError:
+        return None
+
+
+# (getter, setter) of the BLAS libraries that have one.
+_blas_setters = [('openblas_get_num_threads', 'openblas_set_num_threads'),
+                 ('MKL_Get_Max_Threads', 'MKL_Set_Num_Threads'),
+                 ('goto_get_num_threads', 'goto_set_num_threads')]
+
+
+def _find_blas_setter():
+    from theano.tensor.blas import ldflags
+    dirs = [d[2:] if d.startswith('-L') else d
+            for d in ldflags(libs=False, libs_dir=True)]
+    for name in ldflags():
+        lib = _load_library(name, dirs)
+        if lib is None:
+            continue
+        for getter, setter in _blas_setters:
+            try:
+                return ThreadSetter(getattr(lib, getter),
+                                    getattr(lib, setter))
+            except AttributeError:
+                pass
+    return None
+
+
+_setters = {}
+_setters_lock = threading.Lock()
+_setter_finders = {'openmp': _find_openmp_setter, 'blas': _find_blas_setter}
+
+
+def get_thread_setter(kind):
+    """
+    Return the `ThreadSetter` of `kind` ('openmp' or 'blas'), or None if
+    the library can't be found or doesn't have one.
+
+    """
+    with _setters_lock:
+        if kind not in _setters:
+            try:
+                _setters[kind] = _setter_finders[kind]()
+            except Exception as e:
+                _logger.debug('Error while looking for the %s thread '
+                              'setter: %s', kind, e)
+                _setters[kind] = None
+        return _setters[kind]
+
+
+def node_work(kind, values):
+    """
+    Return an estimate of the work of a node given its input `values`.
+
+    For OpenMP loops, it is the number of elements of the largest input.
+    For BLAS calls, it is that number times the smallest dimension of the
+    inputs with 2 dimensions or more, which is the number of multiply-adds
+    of a product of square matrices.
+
+    """
+    arrays = [v for v in values if isinstance(v, np.ndarray)]
+    if not arrays:
+        return 0
+    work = max(a.size for a in arrays)
+    if kind == 'blas':
+        dims = [d for a in arrays if a.ndim >= 2 for d in a.shape]
+        if dims:
+            work *= min(dims)
+    return work
+
+
+class ThreadBudget(object):
+    """
+    Decide how many threads each node of a function may use.
+
+    Parameters
+    ----------
+    n_threads : int
+        The number of threads that the function may use at once.
+    min_work : int
+        The work (see `node_work`) of each thread. Nodes with less work run
+        in one thread, the others get one thread for each `min_work` of
+        work, rounded up, so that a node with at least
+        openmp_elemwise_minsize elements runs in parallel like without a
+        budget. If None, use the flag openmp_elemwise_minsize.
+    n_concurrent : int
+        The number of nodes run at the same time (see `ParallelLoop`), that
+        share the budget. If larger than 1, the BLAS nodes are not wrapped.
+
+    """
+
+    def __init__(self, n_threads, min_work=None, n_concurrent=1):
+        if min_work is None:
+            min_work = config.openmp_elemwise_minsize
+        self.n_threads = n_threads
+        self.min_work = max(1, min_work)
+        self.n_concurrent = max(1, n_concurrent)
+        self.node_budget = max(1, n_threads // max(1, n_concurrent))
+
+    def node_threads(self, kind, values):
+        """
+        Return the number of threads of a node of `kind` with inputs
+        `values`.
+
+        """
+        work = node_work(kind, values)
+        return int(max(1, min(self.node_budget,
+                              -(-work // self.min_work))))
+
+    def wrap_thunks(self, nodes, thunks):
+        """
+        Return `thunks`, where those of C code of nodes with a
+        `thread_budget_kind` whose library has a thread setter are wrapped
+        by a `BudgetThunk`. The BLAS thunks are not wrapped if nodes run at
+        the same time, as their threads are shared by the whole process.
+
+        """
+        wrapped = []
+        for node, thunk in zip(nodes, thunks):
+            kind = getattr(node.op, 'thread_budget_kind', None)
+            if (kind is not None and not thunk.lazy and
+                    hasattr(thunk, 'cthunk') and
+                    (kind != 'openmp' or getattr(node.op, 'openmp', False)) and
+                    (kind != 'blas' or self.n_concurrent == 1)):
+                setter = get_thread_setter(kind)
+                if setter is not None:
+                    thunk = BudgetThunk(self, kind, setter, thunk)
+            wrapped.append(thunk)
+        return wrapped
+
+
+class BudgetThunk(object):
+    """
+    Thunk that sets the number of threads of the library of a node before
+    running its thunk, and restores it after.
+
+    """
+
+    lazy = False
+
+    def __init__(self, budget, kind, setter, thunk):
+        self.budget = budget
+        self.kind = kind
+        self.setter = setter
+        self.thunk = thunk
+        self.inputs = getattr(thunk, 'inputs', None)
+        self.outputs = getattr(thunk, 'outputs', None)
+
+    def __call__(self):
+        n_threads = self.budget.node_threads(
+            self.kind, [cell[0] for cell in self.inputs])
+        setter = self.setter
+        previous = setter.get_threads()
+        if previous == n_threads:
+            return self.thunk()
+        setter.set_threads(n_threads)
+        try:
+            return self.thunk()
+        finally:
+            setter.set_threads(previous)
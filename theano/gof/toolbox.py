@@ -288,12 +288,14 @@ class Validator(Feature):
 
 class ReplaceValidate(History, Validator):
     pickle_rm_attr = (["replace_validate", "replace_all_validate",
-                       "replace_all_validate_remove"] +
+                       "replace_all_validate_remove",
+                       "replace_all_validate_batch"] +
                       History.pickle_rm_attr + Validator.pickle_rm_attr)
 
     def on_attach(self, fgraph):
         for attr in ('replace_validate', 'replace_all_validate',
-                     'replace_all_validate_remove'):
+                     'replace_all_validate_remove',
+                     'replace_all_validate_batch'):
             if hasattr(fgraph, attr):
                 raise AlreadyThere("ReplaceValidate feature is already present"
                                    " or in conflict with another plugin.")
@@ -311,6 +313,8 @@ class ReplaceValidate(History, Validator):
                                               fgraph)
         fgraph.replace_all_validate_remove = partial(
             self.replace_all_validate_remove, fgraph)
+        fgraph.replace_all_validate_batch = partial(
+            self.replace_all_validate_batch, fgraph)
 
     def on_detach(self, fgraph):
         """
@@ -323,6 +327,7 @@ class ReplaceValidate(History, Validator):
         del fgraph.replace_validate
         del fgraph.replace_all_validate
         del fgraph.replace_all_validate_remove
+        del fgraph.replace_all_validate_batch
 
     def replace_validate(self, fgraph, r, new_r, reason=None):
         self.replace_all_validate(fgraph, [(r, new_r)], reason=reason)
@@ -406,6 +411,69 @@ class ReplaceValidate(History, Validator):
                     print(reason, replacements, file=out)
                 raise ReplacementDidntRemovedError()
 
+    def replace_all_validate_batch(self, fgraph, candidates,
+                                   reason=None, verbose=None):
+        """
+        Apply several independent groups of replacements, validating the
+        graph as few times as possible.
+
+        All the candidates are applied and the graph is validated once. If
+        it is not valid, the replacements are reverted and each half of
+        the candidates is tried the same way, so a few candidates that
+        make the graph invalid only cost a few more validations each.
+
+        Parameters
+        ----------
+        candidates : list of callables
+            Each one returns the list of (variable, replacement) pairs of
+            a candidate. It is called each time the candidate is applied,
+            so it must build them from the current graph. It can raise
+            ValueError, TypeError or InconsistencyError to reject the
+            candidate.
+
+        Returns
+        -------
+        list of bool
+            For each candidate, whether its replacements were kept.
+
+        Notes
+        -----
+        Like fgraph.checkpoint(), this forgets the previous checkpoint.
+
+        """
+        if verbose is None:
+            verbose = config.optimizer_verbose
+        accepted = [False] * len(candidates)
+        todo = [list(range(len(candidates)))]
+        while todo:
+            idx = todo.pop()
+            if not idx:
+                continue
+            chk = fgraph.checkpoint()
+            try:
+                for i in idx:
+                    for r, new_r in candidates[i]():
+                        fgraph.replace(r, new_r, reason=reason, verbose=False)
+                fgraph.validate()
+            except (ValueError, TypeError,
+                    theano.gof.InconsistencyError) as e:
+                fgraph.revert(chk)
+                if len(idx) > 1:
+                    half = len(idx) // 2
+                    # The first half is tried first.
+                    todo.append(idx[half:])
+                    todo.append(idx[:half])
+                elif verbose:
+                    print("validate failed on candidate %s.\n Reason: %s, %s"
+                          % (candidates[idx[0]], reason, e))
+                continue
+            except Exception:
+                fgraph.revert(chk)
+                raise
+            for i in idx:
+                accepted[i] = True
+        return accepted
+
     def __getstate__(self):
         d = self.__dict__.copy()
         if "history" in d:
@@ -8,18 +8,23 @@ VM was a better name at some point.
 from __future__ import absolute_import, print_function, division
 
 from . import link
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import logging
 import sys
+import threading
 import time
 import warnings
 
+import numpy as np
+
 from theano.configparser import (config, _config_var_list)
 
+import theano.gof.cc
 import theano.gof.cmodule
+from theano.gof.threadbudget import ThreadBudget
 
 from six import iteritems, itervalues
-from six.moves import xrange
+from six.moves import queue, xrange
 
 logger = logging.getLogger(__name__)
 
@@ -113,6 +118,107 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
     return reallocated_info
 
 
+def plan_storage(order, fgraph, no_recycling=()):
+    """
+    Plan the reuse of the storage of intermediate results.
+
+    The nodes are walked in `order`, keeping the storage slots whose last
+    variable is dead (all the nodes using it have run) in a pool. An
+    output of a node takes a slot of the pool when it has the same type
+    and the same shape as the last variable of the slot. The shapes are
+    compared with the `ShapeFeature` of `fgraph`, when the optimizer left
+    one, so that the Ops that reuse their output storage when it has the
+    right shape can write in the buffer of the dead variable instead of
+    allocating a new one. Without it, only scalars are planned.
+
+    Variables that are outputs of the graph, in `no_recycling`, or that
+    are views of other variables, are viewed, or destroyed, keep their
+    own storage.
+
+    Parameters
+    ----------
+    order
+        The nodes of `fgraph` in the order they will be run.
+    fgraph
+        The FunctionGraph.
+    no_recycling
+        Variables whose storage must not be shared.
+
+    Returns
+    -------
+    OrderedDict
+        Map from each variable in a shared slot to the pair (v0, v), where
+        v0 is the first variable of the slot, whose storage v must use.
+        It has the format of the result of `calculate_reallocate_info`.
+
+    """
+    shape_feature = getattr(fgraph, 'shape_feature', None)
+
+    def compatible(a, b):
+        if a.type != b.type:
+            return False
+        if a.ndim == 0:
+            return True
+        return (shape_feature is not None and
+                a in shape_feature.shape_of and
+                b in shape_feature.shape_of and
+                shape_feature.same_shape(a, b))
+
+    excluded = set(fgraph.outputs)
+    excluded.update(no_recycling)
+    last_use = {}
+    for idx, node in enumerate(order):
+        for o_map in (getattr(node.op, 'destroy_map', None),
+                      getattr(node.op, 'view_map', None)):
+            for o_idx, i_idxs in iteritems(o_map or {}):
+                excluded.add(node.outputs[o_idx])
+                excluded.update(node.inputs[i] for i in i_idxs)
+        for ins in node.inputs:
+            last_use[ins] = idx
+
+    reallocated_info = OrderedDict()
+    slot_of = {}
+    # (first variable, last variable) of the slots that are free.
+    free = []
+    for idx, node in enumerate(order):
+        for out in node.outputs:
+            if (out in excluded or out not in last_use or
+                    getattr(out, 'ndim', None) is None):
+                continue
+            for k, (first, var) in enumerate(free):
+                if compatible(var, out):
+                    del free[k]
+                    reallocated_info.setdefault(first, [first, first])
+                    reallocated_info[out] = [first, out]
+                    slot_of[out] = first
+                    break
+        # The inputs are released after the outputs are placed, so a node
+        # never writes its outputs in the storage of its inputs.
+        for ins in set(node.inputs):
+            if (last_use[ins] == idx and ins.owner is not None and
+                    ins not in excluded and
+                    getattr(ins, 'ndim', None) is not None):
+                free.append((slot_of.get(ins, ins), ins))
+    return reallocated_info
+
+
+def _view_root(var):
+    """
+    Return the variable whose memory `var` shares through the view_map and
+    destroy_map of its owners, or `var` itself.
+
+    """
+    while var.owner is not None:
+        op = var.owner.op
+        o_idx = var.owner.outputs.index(var)
+        i_idxs = ((getattr(op, 'view_map', None) or {}).get(o_idx) or
+                  (getattr(op, 'destroy_map', None) or {}).get(o_idx))
+        if not i_idxs:
+            break
+        var = var.owner.inputs[i_idxs[0]]
+    return var
+
+
 class VM(object):
     """
     A VM object's __call__ method evaluates a Theano program.
@@ -303,6 +409,306 @@ class LoopGC(VM):
                 link.raise_with_op(node, thunk)
 
 
+class BufferPool(object):
+    """
+    Pool of ndarrays, by dtype and shape, kept from one call of a VM to
+    the next.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Arrays are not added to the pool once it holds that many bytes.
+
+    Attributes
+    ----------
+    n_bytes : int
+        The number of bytes held by the pool.
+    hits, misses : int
+        The number of requests that found an array in the pool, and of
+        those that did not.
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.buffers = defaultdict(list)
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return an array of the (dtype, shape) `key` from the pool, or None.
+
+        """
+        buffers = self.buffers.get(key)
+        if buffers:
+            self.hits += 1
+            value = buffers.pop()
+            self.n_bytes -= value.nbytes
+            return value
+        self.misses += 1
+        return None
+
+    def put_cell(self, cell):
+        """
+        Empty the storage `cell`, and add its value to the pool if it is an
+        ndarray that owns its data and that nothing else references.
+
+        """
+        value = cell[0]
+        cell[0] = None
+        # The references are `value` and the argument of getrefcount.
+        if (type(value) is np.ndarray and value.flags.owndata and
+                value.flags.writeable and sys.getrefcount(value) == 2 and
+                self.n_bytes + value.nbytes <= self.max_bytes):
+            self.buffers[(value.dtype, value.shape)].append(value)
+            self.n_bytes += value.nbytes
+
+    def clear(self):
+        self.buffers.clear()
+        self.n_bytes = 0
+
+
+class LoopPool(LoopGC):
+    """
+    LoopGC that puts the intermediate results it frees in a `BufferPool`.
+
+    Before running a node, the storage of each of its outputs gets an
+    array from the pool with the dtype and shape that output had in the
+    previous call, so the Ops that reuse their output storage when it has
+    the right shape (most C implementations) don't allocate new memory.
+
+    Parameters
+    ----------
+    buffer_pool : BufferPool
+        The pool.
+    pooled_outputs
+        For each node, the storage cells of the outputs to take from the
+        pool.
+
+    """
+
+    def __init__(self, nodes, thunks, pre_call_clear, post_thunk_clear,
+                 buffer_pool, pooled_outputs):
+        super(LoopPool, self).__init__(nodes, thunks, pre_call_clear,
+                                       post_thunk_clear)
+        if len(pooled_outputs) != len(nodes):
+            raise ValueError("pooled_outputs must have one entry per node")
+        self.buffer_pool = buffer_pool
+        # [cell, (dtype, shape) of its value at the last call or None]
+        self.pooled_outputs = [[[cell, None] for cell in cells]
+                               for cells in pooled_outputs]
+
+    def __call__(self):
+        pool = self.buffer_pool
+        time_thunks = self.time_thunks
+        for cont in self.pre_call_clear:
+            cont[0] = None
+        try:
+            for i, (thunk, node, old_storage, outputs) in enumerate(
+                    zip(self.thunks, self.nodes, self.post_thunk_clear,
+                        self.pooled_outputs)):
+                for out in outputs:
+                    if out[1] is not None and out[0][0] is None:
+                        out[0][0] = pool.get(out[1])
+                if time_thunks:
+                    t0 = time.time()
+                    thunk()
+                    self.call_times[i] += time.time() - t0
+                    self.call_counts[i] += 1
+                else:
+                    thunk()
+                for out in outputs:
+                    value = out[0][0]
+                    if type(value) is np.ndarray:
+                        out[1] = (value.dtype, value.shape)
+                    else:
+                        out[1] = None
+                for old_s in old_storage:
+                    pool.put_cell(old_s)
+        except Exception:
+            link.raise_with_op(node, thunk)
+
+    def clear_storage(self):
+        self.buffer_pool.clear()
+
+    def update_profile(self, profile):
+        super(LoopPool, self).update_profile(profile)
+        pool = self.buffer_pool
+        profile.buffer_pool_hits += pool.hits
+        profile.buffer_pool_misses += pool.misses
+        profile.buffer_pool_size = pool.n_bytes
+        pool.hits = 0
+        pool.misses = 0
+
+
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+# `in_worker` is True in the threads of the pools.
+_worker_state = threading.local()
+
+
+def get_thread_pool(n_threads):
+    """
+    Return the pool of `n_threads` threads shared by the `ParallelLoop` VMs.
+
+    """
+    with _thread_pools_lock:
+        pool = _thread_pools.get(n_threads)
+        if pool is None:
+            from multiprocessing.pool import ThreadPool
+            pool = _thread_pools[n_threads] = ThreadPool(n_threads)
+        return pool
+
+
+class ParallelLoop(VM):
+    """
+    Program execution in Python that runs independent thunks concurrently
+    in a pool of threads.
+
+    A node is run as soon as the nodes computing its inputs and the nodes
+    that must run before it (e.g. the readers of a variable that it
+    destroys, see `FunctionGraph.orderings`) are done. The thread calling
+    the VM schedules the nodes and runs one of them itself when there is
+    nothing else to do, so a graph without independent branches runs like
+    with `Loop`. Only the thunks that release the GIL (e.g. Ops whose
+    perform calls BLAS or other NumPy functions on large arrays) actually
+    run in parallel. Lazy thunks are not supported.
+
+    When `allow_gc` is True, a computed variable is freed once all the
+    nodes using it have run, which is what `LoopGC` does in toposort order.
+
+    Parameters
+    ----------
+    nodes
+        A list of nodes in toposort order.
+    thunks
+        A list of thunks to execute those nodes, in toposort order.
+    pre_call_clear
+        A list of containers to empty at the beginning of each call.
+    fgraph
+        The FunctionGraph of the nodes.
+    storage_map
+        Map from the variables of the graph to their storage cells.
+    allow_gc
+        Whether intermediate results are freed once they are used.
+    n_threads
+        Number of threads of the pool.
+
+    """
+
+    def __init__(self, nodes, thunks, pre_call_clear, fgraph, storage_map,
+                 allow_gc, n_threads):
+        super(ParallelLoop, self).__init__(nodes, thunks, pre_call_clear)
+        # Some other part of Theano query that information
+        self.allow_gc = allow_gc
+        self.n_threads = n_threads
+
+        node_idx = dict((node, i) for i, node in enumerate(nodes))
+        ords = fgraph.orderings()
+        prereqs = []
+        for node in nodes:
+            prereq = set(node_idx[inp.owner] for inp in node.inputs
+                         if inp.owner in node_idx)
+            prereq.update(node_idx[p] for p in ords.get(node, []))
+            prereqs.append(prereq)
+        self.successors = [[] for node in nodes]
+        for i, prereq in enumerate(prereqs):
+            for j in prereq:
+                self.successors[j].append(i)
+        self.n_prereqs = [len(prereq) for prereq in prereqs]
+        self.roots = [i for i, n in enumerate(self.n_prereqs) if n == 0]
+
+        # For each node, the variables to free once it ran, as indices in
+        # gc_cells, and for each variable the number of nodes using it.
+        self.gc_cells = []
+        self.gc_counts = []
+        self.node_gc = [[] for node in nodes]
+        if allow_gc:
+            gc_idx = {}
+            for i, node in enumerate(nodes):
+                for inp in set(node.inputs):
+                    if inp.owner in node_idx and inp not in fgraph.outputs:
+                        if inp not in gc_idx:
+                            gc_idx[inp] = len(self.gc_cells)
+                            self.gc_cells.append(storage_map[inp])
+                            self.gc_counts.append(0)
+                        self.gc_counts[gc_idx[inp]] += 1
+                        self.node_gc[i].append(gc_idx[inp])
+
+    def run_thunk(self, i):
+        """
+        Run the thunk of node `i` and return (i, None), or (i, exc_info) if
+        it raised an exception.
+
+        Any exception is caught, even those that are not an `Exception`
+        like KeyboardInterrupt: in a worker, the result is only passed to
+        the main thread if this returns.
+
+        """
+        thunk = self.thunks[i]
+        try:
+            if self.time_thunks:
+                t0 = time.time()
+                thunk()
+                self.call_times[i] += time.time() - t0
+                self.call_counts[i] += 1
+            else:
+                thunk()
+        except BaseException:
+            return i, sys.exc_info()
+        return i, None
+
+    def run_thunk_in_worker(self, i):
+        _worker_state.in_worker = True
+        return self.run_thunk(i)
+
+    def __call__(self):
+        for cont in self.pre_call_clear:
+            cont[0] = None
+        pool = get_thread_pool(self.n_threads)
+        # A VM run by a thunk in a worker (e.g. the inner function of
+        # Scan) must not wait for other workers, they may all be busy.
+        in_worker = getattr(_worker_state, 'in_worker', False)
+        n_prereqs = self.n_prereqs[:]
+        gc_counts = self.gc_counts[:]
+        ready = self.roots[:]
+        done = queue.Queue()
+        running = 0
+        error = None
+        while ready or running:
+            while ready and error is None:
+                i = ready.pop()
+                running += 1
+                if (ready or running > 1) and not in_worker:
+                    pool.apply_async(self.run_thunk_in_worker, (i,),
+                                     callback=done.put)
+                else:
+                    # Nothing else to run: do it in this thread.
+                    done.put(self.run_thunk(i))
+            if not running:
+                break
+            i, exc_info = done.get()
+            running -= 1
+            if exc_info is not None:
+                # Wait for the running thunks before raising.
+                if error is None:
+                    error = (i, exc_info)
+                continue
+            for j in self.successors[i]:
+                n_prereqs[j] -= 1
+                if not n_prereqs[j]:
+                    ready.append(j)
+            for k in self.node_gc[i]:
+                gc_counts[k] -= 1
+                if not gc_counts[k]:
+                    self.gc_cells[k][0] = None
+        if error is not None:
+            i, exc_info = error
+            link.raise_with_op(self.nodes[i], self.thunks[i], exc_info)
+
+
 class Stack(VM):
     """
     Finish-to-start evalution order of thunks.
@@ -327,12 +733,33 @@ class Stack(VM):
     The actual logic is more complex to support intermediate
     garbage collection, lazily-evaluated nodes, and better speed.
 
+    When `incremental` is True, a variable is up to date at the start of a
+    call if it was computed by a previous call and none of the inputs it
+    depends on changed since then, so only the nodes that depend on the
+    changed inputs are run again. An input changed if the value in its
+    storage is not the same object as at the previous call, or if the
+    version of its container in `version_sources` changed. `Function`
+    gives there the containers of the shared variables, whose version is
+    incremented by ``set_value`` and by the functions that update them, as
+    their updates may modify the value inplace. Other modifications of an
+    input value inplace between calls (e.g. of the value returned by
+    ``get_value(borrow=True)``) are not detected; ``Function.free()`` makes
+    the next call recompute everything. Variables that some node destroys
+    (and the inputs they are views of) are considered changed at each call,
+    as their value does not survive the call.
+
+    Parameters
+    ----------
+    incremental
+        Keep the values computed by the previous call and only recompute
+        the variables whose inputs changed. Requires `allow_gc` to be False.
+
     """
 
     def __init__(self, nodes, thunks, pre_call_clear,
                  storage_map, compute_map, fgraph, allow_gc,
                  n_updates, dependencies=None, callback=None,
-                 callback_input=None):
+                 callback_input=None, incremental=False):
         super(Stack, self).__init__(nodes, thunks, pre_call_clear)
 
         self.allow_gc = allow_gc
@@ -377,6 +804,59 @@ class Stack(VM):
         if self.allow_gc and self.dependencies is None:
             raise ValueError("Must set dependencies when using GC")
 
+        self.incremental = incremental
+        if incremental:
+            if allow_gc:
+                raise ValueError("Can't keep the computed values when "
+                                 "using GC")
+            # The variables without owner, with their storage and the value
+            # and version they had at the last successful call (None before
+            # the first).
+            self.input_cells = [(var, cell) for var, cell
+                                in iteritems(storage_map)
+                                if var.owner is None]
+            self.input_values = None
+            # Maps input variables to the container whose version tells if
+            # their value was modified inplace.
+            self.version_sources = {}
+            self.volatile = set(_view_root(node.inputs[i])
+                                for node in self.nodes
+                                for i_idxs in itervalues(
+                                    getattr(node.op, 'destroy_map', None) or
+                                    {})
+                                for i in i_idxs)
+
+    def get_input_values(self):
+        """
+        Return the value of each input of `input_cells`, with the version of
+        its container in `version_sources` (or None).
+
+        """
+        sources = self.version_sources
+        return [(cell[0], sources[var].version if var in sources else None)
+                for var, cell in self.input_cells]
+
+    def dirty_variables(self, input_values):
+        """
+        Return the set of variables that may not have the same value as at
+        the previous call, given the current `input_values` (as returned by
+        `get_input_values`).
+
+        """
+        last_values = self.input_values
+        dirty = set(self.volatile)
+        if last_values is None:
+            dirty.update(var for var, cell in self.input_cells)
+        else:
+            for (var, cell), (value, version), (last_value, last_version) in \
+                    zip(self.input_cells, input_values, last_values):
+                if value is not last_value or version != last_version:
+                    dirty.add(var)
+        for node in self.nodes:
+            if any(inp in dirty for inp in node.inputs):
+                dirty.update(node.outputs)
+        return dirty
+
     def run_thunk_of_node(self, node):
         """
         Run the thunk corresponding to Apply instance `node`.
@@ -411,9 +891,23 @@ class Stack(VM):
         self.node_executed_order = []
         self.node_cleared_order = []
 
+        if self.incremental:
+            # The values that may be returned without being borrowed must
+            # be computed again, as the caller may have modified them.
+            for cont in self.pre_call_clear:
+                cont[0] = None
+            input_values = self.get_input_values()
+            dirty = self.dirty_variables(input_values)
+            # If the call fails, some of the values kept don't match the
+            # inputs anymore, so the next call recomputes everything.
+            self.input_values = None
         for k in self.storage_map:
-            compute_map[k][0] = (k.owner is None)
-            if self.callback_input and compute_map[k][0]:
+            if not self.incremental or k.owner is None:
+                compute_map[k][0] = (k.owner is None)
+            elif k in dirty or storage_map[k][0] is None:
+                compute_map[k][0] = 0
+            # Else it keeps the state of the previous call.
+            if self.callback_input and k.owner is None:
                 self.callback_input(k, self.storage_map[k][0])
 
         # apply_stack contains nodes
@@ -653,6 +1147,9 @@ class Stack(VM):
 
         self.node_cleared_order.append(final_index)
 
+        if self.incremental:
+            self.input_values = input_values
+
 
 try:
     # If cxx is explicitely set to an empty string, we do not want to import neither lazylinker C code
@@ -712,12 +1209,29 @@ class VM_Linker(link.LocalLinker):
     allow_partial_eval
         If True, enforces usage of Stack or CVM, to allow for partial
         evaluation of functions (calculating a subset of outputs).
+    n_threads
+        If more than 1, run the independent nodes of graphs without lazy
+        nodes concurrently with a `ParallelLoop` of that many threads,
+        instead of the Loop/LoopGC or the CVM. If None, use the Theano
+        flag vm.threads.
+    incremental
+        If True, use a `Stack` VM that keeps the intermediate results
+        between calls and only recomputes those that depend on inputs
+        whose value changed. This disables the garbage collection of
+        intermediate results. If None, use the Theano flag vm.incremental.
+    thread_budget
+        If more than 0, the number of threads that the OpenMP loops and
+        BLAS calls of the function may use. Before each call of the C code
+        of such a node, a `ThreadBudget` sets how many of them it uses from
+        the size of its inputs. If None, use the Theano flag
+        openmp_thread_budget.
 
     """
 
     def __init__(self, allow_gc=None, use_cloop=False, callback=None,
                  callback_input=None, lazy=None, schedule=None,
-                 c_thunks=None, allow_partial_eval=None):
+                 c_thunks=None, allow_partial_eval=None, n_threads=None,
+                 incremental=None, thread_budget=None):
         # Note: if more parameters are added to __init__, make sure to forward
         # them in the "type(self)(...)" call in the "accept" method below.
         if allow_gc is None:
@@ -732,6 +1246,15 @@ class VM_Linker(link.LocalLinker):
             c_thunks = bool(theano.config.cxx)
         self.c_thunks = c_thunks
         self.allow_partial_eval = allow_partial_eval
+        if n_threads is None:
+            n_threads = config.vm.threads
+        self.n_threads = n_threads
+        if incremental is None:
+            incremental = config.vm.incremental
+        self.incremental = incremental
+        if thread_budget is None:
+            thread_budget = config.openmp_thread_budget
+        self.thread_budget = thread_budget
         self.updated_vars = {}
         if schedule:
             self.schedule = schedule
@@ -770,7 +1293,10 @@ class VM_Linker(link.LocalLinker):
                 lazy=self.lazy,
                 schedule=self.schedule,
                 c_thunks=self.c_thunks,
-                allow_partial_eval=self.allow_partial_eval
+                allow_partial_eval=self.allow_partial_eval,
+                n_threads=self.n_threads,
+                incremental=self.incremental,
+                thread_budget=self.thread_budget
             ).accept(fgraph, no_recycling, profile)
         self.fgraph = fgraph
         self.no_recycling = no_recycling
@@ -829,6 +1355,60 @@ class VM_Linker(link.LocalLinker):
                 dependencies[k] += ls
         return dependencies
 
+    def use_parallel_vm(self, thunks):
+        """
+        Return True if the nodes of `thunks` will be run by a
+        `ParallelLoop`.
+
+        """
+        if (self.n_threads <= 1 or self.incremental or
+                self.callback is not None or
+                self.callback_input is not None or self.allow_partial_eval or
+                ((config.profile or config.print_global_stats) and
+                 config.profile_memory)):
+            return False
+        lazy = self.lazy
+        if lazy is None:
+            lazy = config.vm.lazy
+        if lazy is None:
+            lazy = not all([(not th.lazy) for th in thunks])
+        return not lazy
+
+    def pooled_outputs(self, nodes, storage_map):
+        """
+        Return, for each node, the storage of the outputs that can be taken
+        from a `BufferPool`: those that are not outputs of the graph, in
+        no_recycling, views or destroyed inputs.
+
+        """
+        excluded = set(self.fgraph.outputs)
+        excluded.update(self.no_recycling)
+        pooled_outputs = []
+        for node in nodes:
+            no_pool = set()
+            for o_map in (getattr(node.op, 'destroy_map', None),
+                          getattr(node.op, 'view_map', None)):
+                no_pool.update(o_map or {})
+            pooled_outputs.append(
+                [storage_map[out] for o_idx, out in enumerate(node.outputs)
+                 if o_idx not in no_pool and out not in excluded])
+        return pooled_outputs
+
+    def may_plan_storage(self):
+        """
+        Return True if `plan_storage` can be used, that is if the nodes
+        will be run in order by Loop or LoopGC, unless some are lazy.
+
+        """
+        return not (self.lazy or (self.lazy is None and config.vm.lazy) or
+                    self.use_cloop or self.n_threads > 1 or
+                    self.incremental or
+                    self.callback is not None or
+                    self.callback_input is not None or
+                    self.allow_partial_eval or
+                    ((config.profile or config.print_global_stats) and
+                     config.profile_memory))
+
     def make_vm(self, nodes, thunks,
                 input_storage, output_storage, storage_map,
                 post_thunk_clear,
@@ -839,7 +1419,21 @@ class VM_Linker(link.LocalLinker):
 
         pre_call_clear = [storage_map[v] for v in self.no_recycling]
 
-        if (self.callback is not None or self.callback_input is not None or
+        if self.use_parallel_vm(thunks):
+            vm = ParallelLoop(nodes, thunks, pre_call_clear, self.fgraph,
+                              storage_map, self.allow_gc, self.n_threads)
+        elif self.incremental:
+            # The kept values are only valid if the previous calls didn't
+            # free or reuse their storage.
+            vm = Stack(
+                nodes, thunks, pre_call_clear,
+                storage_map, compute_map,
+                self.fgraph, False,
+                len(updated_vars),
+                callback=self.callback,
+                callback_input=self.callback_input,
+                incremental=True)
+        elif (self.callback is not None or self.callback_input is not None or
                 ((config.profile or config.print_global_stats) and config.profile_memory) or
                 (self.allow_partial_eval and not self.use_cloop)):
 
@@ -980,7 +1574,16 @@ class VM_Linker(link.LocalLinker):
                 lazy = not all([(not th.lazy) for th in thunks])
             if not lazy:
                 # there is no conditional in the graph
-                if self.allow_gc:
+                if self.allow_gc and config.vm.buffer_pool_size:
+                    vm = LoopPool(
+                        nodes,
+                        thunks,
+                        pre_call_clear,
+                        post_thunk_clear,
+                        BufferPool(config.vm.buffer_pool_size * 2 ** 20),
+                        self.pooled_outputs(nodes, storage_map),
+                    )
+                elif self.allow_gc:
                     vm = LoopGC(
                         nodes,
                         thunks,
@@ -1018,8 +1621,6 @@ class VM_Linker(link.LocalLinker):
         for k in storage_map:
             compute_map[k] = [k.owner is None]
 
-        thunks = []
-
         # Collect Reallocation Info
         compute_map_re = defaultdict(lambda: [0])
         for var in fgraph.inputs:
@@ -1030,37 +1631,71 @@ class VM_Linker(link.LocalLinker):
         else:
             dependencies = self.compute_gc_dependencies(storage_map)
 
-        reallocated_info = calculate_reallocate_info(
-            order, fgraph, storage_map, compute_map_re, dependencies)
+        planned_storage = None
+        if config.vm.plan_storage and self.may_plan_storage():
+            reallocated_info = plan_storage(order, fgraph, no_recycling)
+            # The thunks keep the storage they are made with, so the plan
+            # is applied before making them.
+            planned_storage = {}
+            for pair in itervalues(reallocated_info):
+                planned_storage[pair[1]] = storage_map[pair[1]]
+                storage_map[pair[1]] = storage_map[pair[0]]
+        else:
+            reallocated_info = calculate_reallocate_info(
+                order, fgraph, storage_map, compute_map_re, dependencies)
         t0 = time.time()
         linker_make_thunk_time = {}
         impl = None
         if self.c_thunks is False:
             impl = 'py'
-        for node in order:
-            try:
-                thunk_start = time.time()
-                thunks.append(node.op.make_thunk(node,
-                                                 storage_map,
-                                                 compute_map,
-                                                 no_recycling,
-                                                 impl=impl))
-                linker_make_thunk_time[node] = time.time() - thunk_start
-                if not hasattr(thunks[-1], 'lazy'):
-                    # We don't want all ops maker to think about lazy Ops.
-                    # So if they didn't specify that its lazy or not, it isn't.
-                    # If this member isn't present, it will crash later.
-                    thunks[-1].lazy = False
-            except Exception as e:
-                e.args = ("The following error happened while"
-                          " compiling the node", node, "\n") + e.args
-                raise
+        else:
+            theano.gof.cc.compile_nodes_parallel(order, no_recycling,
+                                                 storage_map, compute_map)
+        while True:
+            thunks = []
+            for node in order:
+                try:
+                    thunk_start = time.time()
+                    thunks.append(node.op.make_thunk(node,
+                                                     storage_map,
+                                                     compute_map,
+                                                     no_recycling,
+                                                     impl=impl))
+                    linker_make_thunk_time[node] = time.time() - thunk_start
+                    if not hasattr(thunks[-1], 'lazy'):
+                        # We don't want all ops maker to think about lazy Ops.
+                        # So if they didn't specify that its lazy or not, it isn't.
+                        # If this member isn't present, it will crash later.
+                        thunks[-1].lazy = False
+                except Exception as e:
+                    e.args = ("The following error happened while"
+                              " compiling the node", node, "\n") + e.args
+                    raise
+            if (planned_storage and self.lazy is None and
+                    config.vm.lazy is None and
+                    any(th.lazy for th in thunks)):
+                # The Stack VM will be used. It doesn't run the nodes in
+                # order, so make the thunks again with their own storage.
+                storage_map.update(planned_storage)
+                planned_storage = None
+                reallocated_info = {}
+                continue
+            break
         t1 = time.time()
 
         if self.profile:
             self.profile.linker_node_make_thunks += t1 - t0
             self.profile.linker_make_thunk_time = linker_make_thunk_time
 
+        if self.thread_budget:
+            if self.use_parallel_vm(thunks):
+                n_concurrent = self.n_threads
+            else:
+                n_concurrent = 1
+            budget = ThreadBudget(self.thread_budget,
+                                  n_concurrent=n_concurrent)
+            thunks = budget.wrap_thunks(order, thunks)
+
         for node, thunk in zip(order, thunks):
             thunk.inputs = [storage_map[v] for v in node.inputs]
             thunk.outputs = [storage_map[v] for v in node.outputs]
@@ -1070,21 +1705,24 @@ class VM_Linker(link.LocalLinker):
             lazy = config.vm.lazy
         if lazy is None:
             lazy = not all([(not th.lazy) for th in thunks])
-        if not (lazy or ((config.profile or config.print_global_stats) and config.profile_memory) or
-                self.use_cloop or self.callback or self.callback_input):
+        # The nodes of a ParallelLoop don't run in toposort order, so
+        # the storage of a variable could be reused while it is in use.
+        if (planned_storage is None and
+                not (lazy or ((config.profile or config.print_global_stats) and config.profile_memory) or
+                     self.use_cloop or self.callback or self.callback_input or
+                     self.incremental or self.use_parallel_vm(thunks))):
             for pair in itervalues(reallocated_info):
                 storage_map[pair[1]] = storage_map[pair[0]]
 
-        computed, last_user = link.gc_helper(order)
+        compact = fgraph.compact(order)
+        computed = set(compact.variables[compact.outputs_ptr[0]:])
         if self.allow_gc:
             post_thunk_clear = []
-            for node in order:
+            for last_uses in compact.last_uses():
                 clear_after_this_thunk = []
-                for input in node.inputs:
-                    if (input in computed and
-                            input not in fgraph.outputs and
-                            node == last_user[input] and
-                            input not in reallocated_info):
+                for v in last_uses:
+                    input = compact.variables[v]
+                    if input not in reallocated_info:
                         clear_after_this_thunk.append(storage_map[input])
                 post_thunk_clear.append(clear_after_this_thunk)
         else:
@@ -1117,3 +1755,9 @@ class VM_Linker(link.LocalLinker):
             self.allow_partial_eval = None
         if not hasattr(self, 'callback_input'):
             self.callback_input = None
+        if not hasattr(self, 'n_threads'):
+            self.n_threads = 1
+        if not hasattr(self, 'incremental'):
+            self.incremental = False
+        if not hasattr(self, 'thread_budget'):
+            self.thread_budget = 0
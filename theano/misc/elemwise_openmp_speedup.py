@@ -1,4 +1,5 @@
 from __future__ import absolute_import, print_function, division
+import multiprocessing
 import os
 import subprocess
 import sys
@@ -15,6 +16,9 @@ parser = OptionParser(usage='%prog <options>\n Compute time for'
 parser.add_option('-N', '--N', action='store', dest='N',
                   default=theano.config.openmp_elemwise_minsize, type="int",
                   help="Number of vector elements")
+parser.add_option('-B', '--budget', action='store', dest='budget',
+                  default=max(multiprocessing.cpu_count(), 1), type="int",
+                  help="Number of threads of the openmp_thread_budget run")
 
 
 def runScript(N):
@@ -29,6 +33,12 @@ def runScript(N):
         sys.exit()
     return list(map(float, decode_with(out, console_encoding).split(" ")))
 
+
+def speedup(time, reference):
+    if reference > time:
+        return "speedup %2.2f" % (reference / time)
+    return "slowdown %2.2f" % (time / reference)
+
 if __name__ == '__main__':
     options, arguments = parser.parse_args(sys.argv)
     if hasattr(options, "help"):
@@ -36,26 +46,19 @@ if __name__ == '__main__':
         sys.exit(0)
     orig_flags = os.environ.get('THEANO_FLAGS', '')
     os.environ['THEANO_FLAGS'] = orig_flags + ',openmp=false'
-    (cheapTime, costlyTime) = runScript(N=options.N)
+    times = runScript(N=options.N)
     os.environ['THEANO_FLAGS'] = orig_flags + ',openmp=true'
-    (cheapTimeOpenmp, costlyTimeOpenmp) = runScript(N=options.N)
-
-    if cheapTime > cheapTimeOpenmp:
-        cheapSpeed = cheapTime / cheapTimeOpenmp
-        cheapSpeedstring = "speedup"
-    else:
-        cheapSpeed = cheapTimeOpenmp / cheapTime
-        cheapSpeedstring = "slowdown"
-
-    if costlyTime > costlyTimeOpenmp:
-        costlySpeed = costlyTime / costlyTimeOpenmp
-        costlySpeedstring = "speedup"
-    else:
-        costlySpeed = costlyTimeOpenmp / costlyTime
-        costlySpeedstring = "slowdown"
-    print("Timed with vector of %d elements" % options.N)
-    print("Fast op time without openmp %fs with openmp %fs %s %2.2f" % (
-        cheapTime, cheapTimeOpenmp, cheapSpeedstring, cheapSpeed))
+    timesOpenmp = runScript(N=options.N)
+    # The same, with the number of threads of each node (elemwise
+    # and BLAS) decided at each call from the size of its inputs.
+    os.environ['THEANO_FLAGS'] = (orig_flags + ',openmp=true,'
+                                  'openmp_thread_budget=%d' % options.budget)
+    timesBudget = runScript(N=options.N)
 
-    print("Slow op time without openmp %fs with openmp %fs %s %2.2f" % (
-        costlyTime, costlyTimeOpenmp, costlySpeedstring, costlySpeed))
+    print("Timed with vector of %d elements" % options.N)
+    for name, time, timeOpenmp, timeBudget in zip(
+            ["Fast", "Slow", "Mixed"], times, timesOpenmp, timesBudget):
+        print("%s op time without openmp %fs with openmp %fs %s" % (
+            name, time, timeOpenmp, speedup(timeOpenmp, time)))
+        print("%s op time with a budget of %d threads %fs %s" % (
+            name, options.budget, timeBudget, speedup(timeBudget, time)))
@@ -0,0 +1,31 @@
+from __future__ import absolute_import, print_function, division
+import os
+import sys
+from optparse import OptionParser
+
+import theano
+from theano.misc.elemwise_openmp_speedup import runScript, speedup
+
+parser = OptionParser(usage='%prog <options>\n Compute time for'
+                      ' fast and slow elemwise operations with and'
+                      ' without the elemwise_simd flag')
+parser.add_option('-N', '--N', action='store', dest='N',
+                  default=theano.config.openmp_elemwise_minsize, type="int",
+                  help="Number of vector elements")
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args(sys.argv)
+    if hasattr(options, "help"):
+        print(options.help)
+        sys.exit(0)
+    orig_flags = os.environ.get('THEANO_FLAGS', '')
+    os.environ['THEANO_FLAGS'] = orig_flags + ',elemwise_simd=false'
+    times = runScript(N=options.N)
+    os.environ['THEANO_FLAGS'] = orig_flags + ',elemwise_simd=true'
+    timesSimd = runScript(N=options.N)
+
+    print("Timed with vector of %d elements" % options.N)
+    for name, time, timeSimd in zip(["Fast", "Slow", "Mixed"],
+                                    times, timesSimd):
+        print("%s op time without simd %fs with simd %fs %s" % (
+            name, time, timeSimd, speedup(timeSimd, time)))
@@ -37,6 +37,11 @@ def ElemwiseOpTime(N, script=False, loops=1000):
     v = np.random.random(N).astype(theano.config.floatX)
     f = theano.function([x], 2 * x + x * x)
     f1 = theano.function([x], T.tanh(x))
+    # A BLAS call, an elemwise and a reduction on a square matrix made of
+    # the first elements of x.
+    k = int(np.sqrt(N))
+    m = x[:k * k].reshape((k, k))
+    f2 = theano.function([x], T.tanh(T.dot(m, m)).sum(axis=1))
     if not script:
         if theano.config.openmp:
             print("With openmp:")
@@ -45,7 +50,10 @@ def ElemwiseOpTime(N, script=False, loops=1000):
     if not script:
         print("Slow op ", end=' ')
     costlyTime = evalTime(f1, v, script=script, loops=loops)
-    return (ceapTime, costlyTime)
+    if not script:
+        print("Mixed op", end=' ')
+    mixedTime = evalTime(f2, v, script=script, loops=loops)
+    return (ceapTime, costlyTime, mixedTime)
 
 if __name__ == '__main__':
     options, arguments = parser.parse_args(sys.argv)
@@ -53,9 +61,10 @@ if __name__ == '__main__':
         print(options.help)
         sys.exit(0)
 
-    (cheapTime, costlyTime) = ElemwiseOpTime(N=options.N,
-                                             script=options.script)
+    (cheapTime, costlyTime, mixedTime) = ElemwiseOpTime(
+        N=options.N, script=options.script)
 
     if options.script:
-        sys.stdout.write("%2.9f %2.9f\n" % (cheapTime, costlyTime))
+        sys.stdout.write("%2.9f %2.9f %2.9f\n" % (cheapTime, costlyTime,
+                                                  mixedTime))
         sys.stdout.flush()
@@ -214,6 +214,8 @@ class Gemv(Op):
     """
 
     __props__ = ("inplace",)
+    # The C code calls BLAS, see theano.gof.threadbudget.
+    thread_budget_kind = 'blas'
 
     def __init__(self, inplace):
         self.inplace = inplace
@@ -300,6 +302,8 @@ class Ger(Op):
     """
 
     __props__ = ("destructive",)
+    # The C code calls BLAS, see theano.gof.threadbudget.
+    thread_budget_kind = 'blas'
 
     def __init__(self, destructive):
         self.destructive = destructive
@@ -468,6 +472,8 @@ class GemmRelated(Op):
     """
 
     __props__ = ()
+    # The C code calls BLAS, see theano.gof.threadbudget.
+    thread_budget_kind = 'blas'
 
     def c_support_code(self):
         # return cblas_header_text()
@@ -1994,6 +2000,8 @@ class BatchedDot(Op):
         batched_dot(a, b)[i] = dot(a[i], b[i])
     """
     __props__ = ()
+    # The C code calls BLAS, see theano.gof.threadbudget.
+    thread_budget_kind = 'blas'
 
     def make_node(self, *inputs):
         inputs = list(map(T.as_tensor_variable, inputs))
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function, division
 import sys
+import warnings
 from copy import copy
 
 import numpy as np
@@ -472,6 +473,12 @@ second dimension
 
     __props__ = ("scalar_op", "inplace_pattern")
 
+    gxx_support_simd = None
+    """
+    True/False after we tested that the compiler supports ``-fopenmp-simd``.
+
+    """
+
     def __init__(self, scalar_op, inplace_pattern=None, name=None,
                  nfunc_spec=None, openmp=None):
         if inplace_pattern is None:
@@ -1164,10 +1171,29 @@ second dimension
                             contig += """
             dtype_%(x)s& %(x)s_i = ((dtype_%(x)s*) PyArray_DATA(%(x)s))[0];
                             """ % locals()
-                    if self.openmp:
-                        contig += """#pragma omp parallel for if(n>=%d)
-                        """ % (config.openmp_elemwise_minsize)
-                    contig += """
+                    if self.use_simd():
+                        # The iterations are independent, so the compiler
+                        # can use vector instructions even when it can't
+                        # prove it by itself (e.g. for Composite).
+                        if self.openmp:
+                            contig += """
+                    #pragma omp parallel for simd if(n>=%d)
+                            """ % (config.openmp_elemwise_minsize)
+                        else:
+                            contig += """
+                    #pragma omp simd
+                            """
+                        contig += """
+                    for(npy_intp i=0; i<n; i++){
+                        %(index)s
+                        %(task_code)s;
+                    }
+                    """ % locals()
+                    else:
+                        if self.openmp:
+                            contig += """#pragma omp parallel for if(n>=%d)
+                            """ % (config.openmp_elemwise_minsize)
+                        contig += """
                     for(int i=0; i<n; i++){
                         %(index)s
                         %(task_code)s;
@@ -1200,6 +1226,35 @@ second dimension
         code = "\n".join(self._c_all(node, nodename, inames, onames, sub))
         return code
 
+    def use_simd(self):
+        """
+        Return True if the loop over contiguous inputs of the C code is
+        vectorized with ``#pragma omp simd``.
+
+        This is the case when the Theano flag elemwise_simd is True and the
+        compiler supports it.
+
+        """
+        if not config.elemwise_simd:
+            return False
+        if Elemwise.gxx_support_simd is None:
+            Elemwise.gxx_support_simd = bool(
+                gof.cmodule.GCC_compiler.try_flags(['-fopenmp-simd']))
+            if not Elemwise.gxx_support_simd:
+                # We want to warn only once.
+                warnings.warn(
+                    "Your g++ compiler does not support -fopenmp-simd, so"
+                    " the Theano flag elemwise_simd is ignored.",
+                    stacklevel=3)
+        return Elemwise.gxx_support_simd
+
+    def c_compile_args(self):
+        args = super(Elemwise, self).c_compile_args()
+        if self.use_simd() and not self.openmp:
+            # -fopenmp already enables the simd pragmas.
+            args.append('-fopenmp-simd')
+        return args
+
     def c_headers(self):
         return ['<vector>', '<algorithm>']
 
@@ -1212,7 +1267,7 @@ second dimension
         return support_code
 
     def c_code_cache_version_apply(self, node):
-        version = [12]  # the version corresponding to the c code in this Op
+        version = [13]  # the version corresponding to the c code in this Op
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -1226,6 +1281,8 @@ second dimension
             version.append(
                 get_scalar_type(dtype=i.type.dtype).c_code_cache_version())
         version.append(('openmp', self.openmp))
+        if self.use_simd():
+            version.append(('simd', True))
         if all(version):
             return tuple(version)
         else:
@@ -1244,7 +1301,7 @@ second dimension
 #   CAReduce   #
 ################
 
-class CAReduce(Op):
+class CAReduce(OpenMPOp):
     """
     CAReduce = Commutative Associative Reduce
     Reduces a scalar operation along the specified axis(es).
@@ -1263,6 +1320,12 @@ class CAReduce(Op):
         - The dimension along which we want to reduce
         - List of dimensions that we want to reduce
         - If None, all dimensions are reduced
+    openmp
+        Run the outermost loop of the C code in parallel with OpenMP on
+        inputs of at least `openmp_elemwise_minsize` elements. If None, use
+        the Theano flag openmp. When all the dimensions are reduced, the
+        reduction is split in chunks whose partial results are combined in
+        order, so the result does not depend on the number of threads.
 
     Note
     ----
@@ -1290,11 +1353,12 @@ class CAReduce(Op):
 
     __props__ = ("scalar_op", "axis")
 
-    def __init__(self, scalar_op, axis=None):
+    def __init__(self, scalar_op, axis=None, openmp=None):
         if scalar_op.nin not in [-1, 2] or scalar_op.nout != 1:
             raise NotImplementedError((
                 "CAReduce only supports binary functions with a single "
                 "output."))
+        super(CAReduce, self).__init__(openmp=openmp)
         self.scalar_op = scalar_op
 
         if axis is None:
@@ -1382,7 +1446,7 @@ class CAReduce(Op):
         return d
 
     def __setstate__(self, d):
-        self.__dict__.update(d)
+        super(CAReduce, self).__setstate__(d)
         self.set_ufunc(self.scalar_op)
 
     def __str__(self):
@@ -1496,11 +1560,13 @@ class CAReduce(Op):
         if adtype != odtype:
             # Create an accumulator variable different from the output
             aname = "acc"
+            acc_dtype = self.acc_dtype
             decl = acc_type.c_declare(aname, sub)
             decl += acc_type.c_init(aname, sub)
         else:
             # the output is the accumulator variable
             aname = oname
+            acc_dtype = output.type.dtype
 
         decl += cgen.make_declare([order], [idtype], sub)
         checks = cgen.make_checks([order], [idtype], sub)
@@ -1609,9 +1675,23 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
                             [("", code1), ""])
         else:
             all_code = [task0_decl + code1]
+        combine = None
+        if self.openmp and not nnested:
+            # Code to combine the partial results of the threads.
+            acc_scalar = get_scalar_type(dtype=acc_dtype)
+            combine = {aname: self.scalar_op.c_code(
+                Apply(self.scalar_op,
+                      [acc_scalar.make_variable(),
+                       acc_scalar.make_variable()],
+                      [acc_scalar.make_variable()]),
+                None,
+                ["%s_i" % aname, "%s_partial" % aname],
+                ["%s_i" % aname],
+                sub)}
         loop = cgen.make_loop_careduce(
             [order, list(range(nnested)) + ['x'] * len(axis)],
-            [idtype, adtype], all_code, sub)
+            [idtype, adtype], all_code, sub, openmp=self.openmp,
+            combine=combine)
 
         end = ""
         if adtype != odtype:
@@ -1632,7 +1712,7 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
 
     def c_code_cache_version_apply(self, node):
         # the version corresponding to the c code in this Op
-        version = [7]
+        version = [8]
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -1645,6 +1725,9 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
         for i in node.inputs + node.outputs:
             version.append(
                 get_scalar_type(dtype=i.type.dtype).c_code_cache_version())
+        if self.openmp:
+            # The number of chunks depends on openmp_elemwise_minsize.
+            version.append(('openmp', config.openmp_elemwise_minsize))
         if all(version):
             return tuple(version)
         else:
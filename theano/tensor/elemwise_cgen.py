@@ -248,7 +248,7 @@ def make_loop(loop_orders, dtypes, loop_tasks, sub, openmp=None):
 
 
 def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
-                        openmp=None):
+                        openmp=None, tile_size=32):
     """A bit like make_loop, but when only the inner-most loop executes code.
 
     All the loops will be reordered so that the loops over the output tensor
@@ -258,6 +258,12 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
 
     The output tensor's index among the loop variables is indicated by olv_index.
 
+    When there are at least 2 loops and, after the reordering, the
+    inner-most loop of one of the variables has a larger stride than the
+    loop around it (e.g. ``x + x.T``), the two inner-most loops are run by
+    tiles of `tile_size` x `tile_size` iterations, so that the elements of
+    all the variables read in a tile stay in the cache.
+
     """
 
     # Number of variables
@@ -396,27 +402,66 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
             pointer_update += "+%(var)s_stride_l%(i)i*%(iterv)s" % locals()
         pointer_update += ");\n"
 
-    loop = inner_task
-    for i in reversed(range(nnested)):
-        iterv = 'ITER_%i' % i
-        total = 'TOTAL_%i' % i
-        update = ''
-        forloop = ''
-        # The pointers are defined only in the most inner loop
-        if i == nnested - 1:
-            update = pointer_update
-        if i == 0:
-            if openmp:
-                openmp_elemwise_minsize = theano.config.openmp_elemwise_minsize
-                forloop += """#pragma omp parallel for if( %(total)s >=%(openmp_elemwise_minsize)s)\n""" % locals()
-        forloop += "for(int %(iterv)s = 0; %(iterv)s<%(total)s; %(iterv)s++)" % locals()
-
+    def make_loops(tiled):
+        # The two inner-most loops are split in a loop over the tiles and
+        # a loop inside the tile if tiled is True.
+        loop = inner_task
+        for i in reversed(range(nnested)):
+            iterv = 'ITER_%i' % i
+            total = 'TOTAL_%i' % i
+            update = ''
+            forloop = ''
+            # The pointers are defined only in the most inner loop
+            if i == nnested - 1:
+                update = pointer_update
+            if tiled and i >= nnested - 2:
+                forloop += """
+                int %(iterv)s_end = TILE_%(i)i + %(tile_size)i < %(total)s ?
+                                  TILE_%(i)i + %(tile_size)i : %(total)s;
+                for(int %(iterv)s = TILE_%(i)i; %(iterv)s<%(iterv)s_end; %(iterv)s++)""" % locals()
+            else:
+                forloop += "for(int %(iterv)s = 0; %(iterv)s<%(total)s; %(iterv)s++)" % locals()
+
+            loop = """
+            %(forloop)s
+            { // begin loop %(i)i
+                %(update)s
+                %(loop)s
+            } // end loop %(i)i
+            """ % locals()
+            if tiled and i == nnested - 2:
+                for j in reversed(range(nnested - 2, nnested)):
+                    loop = """
+                    for(int TILE_%(j)i = 0; TILE_%(j)i<TOTAL_%(j)i; TILE_%(j)i += %(tile_size)i)
+                    { // begin tile loop %(j)i
+                        %(loop)s
+                    } // end tile loop %(j)i
+                    """ % dict(j=j, tile_size=tile_size, loop=loop)
+        if openmp:
+            openmp_elemwise_minsize = theano.config.openmp_elemwise_minsize
+            loop = """#pragma omp parallel for if( TOTAL_0 >=%(openmp_elemwise_minsize)s)
+            %(loop)s""" % locals()
+        return loop
+
+    loop = make_loops(False)
+    if nnested >= 2:
+        # Tile the two inner-most loops when a variable does not access
+        # the memory in order in them and they are larger than a tile.
+        inner = nnested - 1
+        outer = nnested - 2
+        unordered = ' || '.join(
+            "(%(var)s_stride_l%(outer)i != 0 && "
+            "abs(%(var)s_stride_l%(inner)i) > abs(%(var)s_stride_l%(outer)i))"
+            % dict(var=sub["lv%i" % i], inner=inner, outer=outer)
+            for i in xrange(nvars))
+        tiled_loop = make_loops(True)
         loop = """
-        %(forloop)s
-        { // begin loop %(i)i
-            %(update)s
+        if ((%(unordered)s) &&
+            TOTAL_%(inner)i > %(tile_size)i && TOTAL_%(outer)i > %(tile_size)i) {
+            %(tiled_loop)s
+        } else {
             %(loop)s
-        } // end loop %(i)i
+        }
         """ % locals()
 
     return '\n'.join(['{',
@@ -464,7 +509,8 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
 ################
 
 
-def make_loop_careduce(loop_orders, dtypes, loop_tasks, sub):
+def make_loop_careduce(loop_orders, dtypes, loop_tasks, sub, openmp=None,
+                       combine=None):
     """
     Make a nested loop over several arrays and associate specific code
     to each level of nesting.
@@ -487,6 +533,22 @@ def make_loop_careduce(loop_orders, dtypes, loop_tasks, sub):
     sub: dictionary
         Maps 'lv#' to a suitable variable name.
         The 'lvi' variable corresponds to the ith element of loop_orders.
+    openmp : bool
+        If True, the outermost loop is run in parallel with OpenMP when the
+        first variable has at least `openmp_elemwise_minsize` elements. The
+        other loops are run as without it. If the outermost loop is not
+        reduced (all the variables loop over it), each thread computes its
+        own elements of the outputs, in the same order as without OpenMP.
+        Otherwise, the variables broadcasted over it are accumulators:
+        the outermost loop is split in one chunk per
+        `openmp_elemwise_minsize` elements of the first variable, each
+        chunk accumulates in its own partial result, and the partial
+        results are then combined in the order of the chunks, so the
+        result does not depend on the number of threads.
+    combine : dict
+        Needed when the outermost loop is reduced. Maps the name of each
+        accumulator variable ``v`` to the code combining the partial result
+        ``v_partial`` into ``v_i``.
 
     """
 
@@ -520,6 +582,12 @@ def make_loop_careduce(loop_orders, dtypes, loop_tasks, sub):
 
     if len(loop_tasks) == 1:
         s = preloops.get(0, "")
+    elif openmp:
+        s = ""
+        for i, (pre_task, task), indices in reversed(list(zip(xrange(1, len(loop_tasks) - 1), loop_tasks[1:], list(zip(*loop_orders))[1:]))):
+            s = loop_over(preloops.get(i, "") + pre_task, s + task, indices, i)
+        s = make_parallel_loop_careduce(loop_orders, dtypes, loop_tasks[0],
+                                        s, sub, combine)
     else:
         s = ""
         for i, (pre_task, task), indices in reversed(list(zip(xrange(len(loop_tasks) - 1), loop_tasks, list(zip(*loop_orders))))):
@@ -527,3 +595,115 @@ def make_loop_careduce(loop_orders, dtypes, loop_tasks, sub):
 
     s += loop_tasks[-1]
     return "{%s}" % s
+
+
+def make_parallel_loop_careduce(loop_orders, dtypes, loop_task, inner_code,
+                                sub, combine):
+    """
+    Make the outermost loop of `make_loop_careduce` with OpenMP.
+
+    `loop_task` is the pair of code of the outermost loop and `inner_code`
+    the code of the loops it contains. The pointers of all the variables
+    start at the outermost loop, which is always the case for CAReduce.
+
+    """
+    minsize = theano.config.openmp_elemwise_minsize
+    pre_task, task = loop_task
+    first = sub['lv0']
+    indices = [loop_order[0] for loop_order in loop_orders]
+    n = ["%s_n%s" % (sub['lv%i' % j], index)
+         for j, index in enumerate(indices) if index != 'x'][0]
+    bases = ""
+    for j, dtype in enumerate(dtypes):
+        var = sub['lv%i' % j]
+        bases += "%(dtype)s* %(var)s_base = (%(dtype)s*)(PyArray_DATA(%(var)s));\n" % locals()
+
+    if 'x' not in indices:
+        # Each iteration computes its own elements of the outputs.
+        iters = ""
+        for j, (index, dtype) in enumerate(zip(indices, dtypes)):
+            var = sub['lv%i' % j]
+            iters += "%(dtype)s* %(var)s_iter = %(var)s_base + ITER_0 * %(var)s_stride%(index)s;\n" % locals()
+        return """
+        %(bases)s
+        %(pre_task)s
+        #pragma omp parallel for schedule(static) if(PyArray_SIZE(%(first)s) >= %(minsize)s)
+        for (npy_intp ITER_0 = 0; ITER_0 < %(n)s; ITER_0++) {
+            %(iters)s
+            %(inner_code)s
+            %(task)s
+        }
+        """ % locals()
+
+    # The variables broadcasted over the outermost loop are accumulators.
+    if combine is None:
+        raise ValueError("combine is needed to reduce the outermost loop "
+                         "in parallel.")
+    accumulators = [j for j, index in enumerate(indices) if index == 'x']
+    for j in accumulators:
+        assert all(index == 'x' for index in loop_orders[j]), (
+            "The accumulators must be broadcasted over all the loops.")
+    fail = sub['fail']
+    alloc = ""
+    free = ""
+    iters = ""
+    update = ""
+    combine_iters = ""
+    partials = ""
+    for j, (index, dtype) in enumerate(zip(indices, dtypes)):
+        var = sub['lv%i' % j]
+        if index == 'x':
+            alloc += """
+            %(dtype)s* %(var)s_partials = (%(dtype)s*)malloc(n_chunks * sizeof(%(dtype)s));
+            if (%(var)s_partials == NULL) {
+                %(free)s
+                PyErr_NoMemory();
+                %(fail)s
+            }
+            """ % locals()
+            free += "free(%(var)s_partials);\n" % locals()
+            iters += "%(dtype)s* %(var)s_iter = %(var)s_partials + chunk;\n" % locals()
+            combine_iters += "%(dtype)s* %(var)s_iter = %(var)s_base;\n" % locals()
+            partials += """
+            {
+                %(dtype)s& %(var)s_partial = %(var)s_partials[chunk];
+                %(combine)s
+            }
+            """ % dict(locals(), combine=combine[var])
+        else:
+            iters += "%(dtype)s* %(var)s_iter = %(var)s_base + start * %(var)s_stride%(index)s;\n" % locals()
+            update += "%(var)s_iter += %(var)s_jump%(index)s_0;\n" % locals()
+    return """
+    {
+        %(bases)s
+        // The number of chunks only depends on the shapes, so that the
+        // result does not depend on the number of threads.
+        npy_intp n_chunks = PyArray_SIZE(%(first)s) / %(minsize)s;
+        if (n_chunks > %(n)s)
+            n_chunks = %(n)s;
+        if (n_chunks < 1)
+            n_chunks = 1;
+        %(alloc)s
+        #pragma omp parallel for schedule(static) if(n_chunks > 1)
+        for (npy_intp chunk = 0; chunk < n_chunks; chunk++) {
+            npy_intp start = %(n)s * chunk / n_chunks;
+            npy_intp stop = %(n)s * (chunk + 1) / n_chunks;
+            %(iters)s
+            %(pre_task)s
+            for (npy_intp ITER_0 = stop - start; ITER_0; ITER_0--) {
+                %(inner_code)s
+                %(task)s
+                %(update)s
+            }
+        }
+        {
+            // Combine the partial results in order.
+            %(combine_iters)s
+            %(pre_task)s
+            for (npy_intp chunk = 0; chunk < n_chunks; chunk++) {
+                %(partials)s
+            }
+        }
+        %(free)s
+    }
+    """ % locals()
@@ -147,6 +147,26 @@ def broadcast_like(value, template, fgraph, dtype=None):
     return rval
 
 
+class InplaceElemwiseCandidate(object):
+    """
+    Replacement of the outputs of `node` by those of `op` applied to the
+    current inputs of `node`, for fgraph.replace_all_validate_batch.
+
+    """
+    def __init__(self, node, op):
+        self.node = node
+        self.op = op
+        self.new_node = None
+
+    def __call__(self):
+        new_outputs = self.op(*self.node.inputs, **dict(return_list=True))
+        self.new_node = new_outputs[0].owner
+        return list(zip(self.node.outputs, new_outputs))
+
+    def __str__(self):
+        return "%s -> %s" % (self.node, self.op)
+
+
 class InplaceElemwiseOptimizer(Optimizer):
     """
     We parametrise it to make it work for Elemwise and GpuElemwise op.
@@ -164,6 +184,7 @@ class InplaceElemwiseOptimizer(Optimizer):
         for k in ['node_before',
                   'nb_call_replace',
                   'nb_call_validate',
+                  'nb_call_validate_batch',
                   'nb_inconsistent']:
             print(blanc, k, prof[k], file=stream)
         ndim = prof['ndim']
@@ -209,11 +230,19 @@ class InplaceElemwiseOptimizer(Optimizer):
         # Then I think it is the [io_?]toposort (need to validate) so check if
         # the solution is also applicable there.
 
-        # We execute `validate` after this number of change.
+        # We execute `validate` after this number of change. If it fails,
+        # all the changes since the previous validation are dropped, unless
+        # bisect is True. Then they are tried again with
+        # fgraph.replace_all_validate_batch, that only drops the ones that
+        # make the graph invalid, and as this costs more validations than
+        # it saves when many changes are invalid, the number of changes
+        # between validations is halved after each failure and doubled
+        # after each success.
         prof = {'opt': self,
                 'node_before': len(fgraph.apply_nodes),
                 'nb_call_replace': 0,
                 'nb_call_validate': 0,
+                'nb_call_validate_batch': 0,
                 'nb_inconsistent': 0,
                 'ndim': defaultdict(lambda: 0)}
 
@@ -223,8 +252,12 @@ class InplaceElemwiseOptimizer(Optimizer):
                 check_each_change = 10
             else:
                 check_each_change = 1
+        bisect = config.tensor.insert_inplace_optimizer_bisect
 
         nb_change_no_validate = 0
+        nb_change_validate = check_each_change
+        # Candidates applied since the last validation
+        pending = []
         chk = fgraph.checkpoint()
 
         if fgraph.update_mapping:
@@ -346,6 +379,7 @@ class InplaceElemwiseOptimizer(Optimizer):
 
                     inplace_pattern = dict(baseline)
                     inplace_pattern[candidate_output] = candidate_input
+                    candidate = None
                     try:
                         if hasattr(op.scalar_op, "make_new_inplace"):
                             new_scal = op.scalar_op.make_new_inplace(
@@ -357,21 +391,30 @@ class InplaceElemwiseOptimizer(Optimizer):
                                 scalar.transfer_type(
                                     *[inplace_pattern.get(i, None)
                                       for i in xrange(len(node.outputs))]))
-                        new_outputs = self.op(new_scal, inplace_pattern)(
-                            *node.inputs, **dict(return_list=True))
-                        new_node = new_outputs[0].owner
+                        candidate = InplaceElemwiseCandidate(
+                            node, self.op(new_scal, inplace_pattern))
 
-                        for r, new_r in zip(node.outputs, new_outputs):
+                        for r, new_r in candidate():
                             prof['nb_call_replace'] += 1
                             fgraph.replace(r, new_r,
                                            reason="inplace_elemwise_optimizer")
+                        pending.append(candidate)
                         nb_change_no_validate += 1
                         prof['ndim'][candidate_out_var.ndim] += 1
-                        if nb_change_no_validate >= check_each_change:
+                        # The candidates for the next outputs of this node
+                        # replace the node made here, so it must be kept
+                        # when the others are tried again.
+                        if (nb_change_no_validate >= nb_change_validate or
+                                (bisect and
+                                 candidate_output != candidate_outputs[-1])):
                             prof['nb_call_validate'] += 1
                             fgraph.validate()
                             chk = fgraph.checkpoint()
+                            pending = []
                             nb_change_no_validate = 0
+                            if bisect:
+                                nb_change_validate = min(
+                                    check_each_change, nb_change_validate * 2)
                     except (ValueError, InconsistencyError) as e:
                         prof['nb_inconsistent'] += 1
                         if check_each_change != 1 and not raised_warning:
@@ -381,14 +424,29 @@ class InplaceElemwiseOptimizer(Optimizer):
                             print(e, file=sys.stderr)
                             raised_warning = True
                         fgraph.revert(chk)
-                        continue
+                        accepted = [False] * len(pending)
+                        if bisect and [c for c in pending
+                                       if c is not candidate]:
+                            nb_change_validate = max(
+                                1, nb_change_validate // 2)
+                            nb_change_no_validate = 0
+                            prof['nb_call_validate_batch'] += 1
+                            accepted = fgraph.replace_all_validate_batch(
+                                pending, reason="inplace_elemwise_optimizer")
+                        kept = (candidate is not None and
+                                candidate in pending and accepted[-1])
+                        chk = fgraph.checkpoint()
+                        pending = []
+                        if not kept:
+                            continue
                     candidate_inputs.remove(candidate_input)
-                    node = new_node
+                    node = candidate.new_node
                     baseline = inplace_pattern
                     break
 
         if nb_change_no_validate > 0:
             try:
+                prof['nb_call_validate'] += 1
                 fgraph.validate()
             except Exception:
                 if not raised_warning:
@@ -396,6 +454,10 @@ class InplaceElemwiseOptimizer(Optimizer):
                            "performed due to unexpected error"),
                           file=sys.stderr)
                 fgraph.revert(chk)
+                if bisect and len(pending) > 1:
+                    prof['nb_call_validate_batch'] += 1
+                    fgraph.replace_all_validate_batch(
+                        pending, reason="inplace_elemwise_optimizer")
         return prof
 
     def print_summary(self, stream=sys.stdout, level=0, depth=-1):
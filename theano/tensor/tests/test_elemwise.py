@@ -570,6 +570,29 @@ class test_CAReduce(unittest_tools.InferShapeTester):
             self.with_linker(gof.CLinker(), scalar.maximum, dtype=dtype,
                              test_nan=True)
 
+    def test_c_openmp(self):
+        x = tensor.matrix('x', dtype='float64')
+        xv = np.random.rand(50, 7)
+        xv[3, 2] = 10
+        for scalar_op, ref in [(scalar.add, np.sum),
+                               (scalar.maximum, np.max)]:
+            for axis in [None, (0,), (1,)]:
+                with theano.configparser.change_flags(
+                        openmp_elemwise_minsize=20):
+                    e = CAReduce(scalar_op, axis=axis, openmp=True)(x)
+                    fgraph = FunctionGraph([x], [e])
+                    src = gof.CLinker().accept(fgraph).get_src_code()
+                assert 'omp parallel' in src
+                # The partial results of the threads are only needed when
+                # all the dimensions are reduced.
+                assert ('n_chunks' in src) == (axis is None)
+                if not theano.config.cxx:
+                    continue
+                with theano.configparser.change_flags(
+                        openmp_elemwise_minsize=20):
+                    f = gof.CLinker().accept(fgraph).make_function()
+                    unittest_tools.assert_allclose(f(xv), ref(xv, axis=axis))
+
     def test_infer_shape(self, dtype=None, pre_scalar_op=None):
         if dtype is None:
             dtype = theano.config.floatX
@@ -1212,6 +1235,54 @@ class TestElemwise(unittest_tools.InferShapeTester):
                             mode=theano.compile.Mode(linker='py'))
         g(*[np.zeros(2 ** 11, config.floatX) for i in xrange(6)])
 
+    def test_c_tiled(self):
+        # x + x.T reads one of the inputs by columns, so the inner loops
+        # are tiled.
+        x = tensor.matrix('x')
+        e = Elemwise(scalar.add)(x, x.T)
+        fgraph = FunctionGraph([x], [e])
+        src = gof.CLinker().accept(fgraph).get_src_code()
+        assert 'TILE_1' in src
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        f = gof.CLinker().accept(fgraph).make_function()
+        for shp in [(100, 100), (70, 70), (5, 5)]:
+            xv = np.asarray(np.random.rand(*shp), dtype=config.floatX)
+            unittest_tools.assert_allclose(f(xv), xv + xv.T)
+        xv = np.asarray(np.random.rand(50, 100), dtype=config.floatX)
+        xv = xv[:, ::2]
+        unittest_tools.assert_allclose(f(xv), xv + xv.T)
+
+    def test_c_simd(self):
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        x = tensor.matrix('x')
+        y = tensor.row('y')
+        xs = scalar.get_scalar_type(config.floatX)()
+        ys = scalar.get_scalar_type(config.floatX)()
+        composite = scalar.Composite([xs, ys], [xs * ys + scalar.exp(xs)])
+        xv = np.asarray(np.random.rand(5, 7), dtype=config.floatX)
+        for yv in [np.asarray(np.random.rand(5, 7), dtype=config.floatX),
+                   np.asarray(np.random.rand(1, 7), dtype=config.floatX)]:
+            with theano.configparser.change_flags(elemwise_simd=True):
+                if yv.shape[0] == 1:
+                    # Broadcasted inputs use the usual loops.
+                    e = Elemwise(composite)(x, y)
+                else:
+                    e = Elemwise(composite)(x, tensor.matrix('y'))
+                if not e.owner.op.use_simd():
+                    raise SkipTest("The compiler does not support "
+                                   "-fopenmp-simd.")
+                fgraph = FunctionGraph(e.owner.inputs, [e])
+                src = gof.CLinker().accept(fgraph).get_src_code()
+                assert ('omp simd' in src) == (yv.shape[0] != 1)
+                f = gof.CLinker().accept(fgraph).make_function()
+                unittest_tools.assert_allclose(f(xv, yv), xv * yv + np.exp(xv))
+                # Not contiguous
+                unittest_tools.assert_allclose(
+                    f(xv[:, ::2], yv[:, ::2]),
+                    xv[:, ::2] * yv[:, ::2] + np.exp(xv[:, ::2]))
+
 
 def test_gt_grad():
     """A user test that failed.
@@ -1547,6 +1547,33 @@ class TestCompositeCodegen(unittest.TestCase):
         utt.assert_allclose(f([[1.]]), [[0.]])
 
 
+def test_inplace_elemwise_bisect():
+    # With insert_inplace_optimizer_bisect, validating several changes at
+    # once must keep as many inplace nodes as validating each change.
+    x = vector('x')
+    outs = []
+    for i in range(20):
+        a = tensor.exp(x * (i + 2))
+        b = tensor.tanh(x * (i + 3))
+        outs.append((a + b) * (a - b) + (a * b))
+    mode = get_mode('FAST_RUN').excluding('fusion').clone(linker='py')
+
+    def nb_inplace(validate_nb, bisect):
+        with theano.configparser.change_flags(**{
+                'tensor.insert_inplace_optimizer_validate_nb': validate_nb,
+                'tensor.insert_inplace_optimizer_bisect': bisect}):
+            f = function([x], outs, mode=mode)
+        xv = np.arange(3).astype(config.floatX)
+        for o, v in zip(f(xv), theano.function([x], outs, mode=mode)(xv)):
+            utt.assert_allclose(o, v)
+        return len([node for node in f.maker.fgraph.apply_nodes
+                    if node.op.destroy_map])
+
+    nb = nb_inplace(1, False)
+    assert nb > nb_inplace(10, False)
+    assert nb == nb_inplace(10, True)
+
+
 def test_log1p():
     m = theano.config.mode
     if m == 'FAST_COMPILE':